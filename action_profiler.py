@@ -0,0 +1,112 @@
+# action_profiler.py - 操作性能分析模块
+import os
+import io
+import cProfile
+import pstats
+import tracemalloc
+from datetime import datetime
+
+
+class ActionProfiler:
+    """操作性能分析类：对下一次用户操作进行cProfile和tracemalloc采样，并写出分析报告"""
+
+    def __init__(self, output_dir=".", top_allocations=30, on_report=None):
+        # 报告输出目录（与last_session.json同目录）
+        self.output_dir = output_dir
+        self.top_allocations = top_allocations
+        self.on_report = on_report  # 报告生成后的回调函数
+        self.armed = False          # 是否对下一次操作进行分析
+        self.last_report = None     # 最近一次生成的报告信息
+
+    def arm(self):
+        """开启：下一次被包装的操作将进行性能分析"""
+        self.armed = True
+        print("已开启性能分析，将记录下一次操作")
+
+    def disarm(self):
+        """关闭性能分析"""
+        self.armed = False
+
+    def run(self, action_name, func, *args, **kwargs):
+        """执行操作；如果已开启分析，则在cProfile和tracemalloc下执行并写出报告
+
+        参数:
+            action_name (str): 操作名称，用于报告文件名
+            func (callable): 要执行的操作
+        """
+        if not self.armed:
+            return func(*args, **kwargs)
+
+        # 只分析一次操作，执行前立即关闭
+        self.armed = False
+        print(f"开始性能分析操作: {action_name}")
+
+        # 如果外部已经在跟踪内存分配，不要停止它
+        started_tracing = not tracemalloc.is_tracing()
+        if started_tracing:
+            tracemalloc.start(25)
+        tracemalloc.reset_peak()
+        snapshot_before = tracemalloc.take_snapshot()
+
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            profiler.disable()
+            snapshot_after = tracemalloc.take_snapshot()
+            current_memory, peak_memory = tracemalloc.get_traced_memory()
+            if started_tracing:
+                tracemalloc.stop()
+
+            try:
+                self.last_report = self._write_report(
+                    action_name, profiler, snapshot_before, snapshot_after,
+                    current_memory, peak_memory)
+                print(f"性能分析报告已生成: {self.last_report['prof_path']}")
+                if self.on_report:
+                    self.on_report(self.last_report)
+            except Exception as e:
+                print(f"写出性能分析报告失败: {e}")
+
+    def _write_report(self, action_name, profiler, snapshot_before, snapshot_after, current_memory, peak_memory):
+        """写出.prof文件和内存分配报告"""
+        os.makedirs(self.output_dir, exist_ok=True)
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        base_name = f"profile_{action_name}_{timestamp}"
+        prof_path = os.path.join(self.output_dir, f"{base_name}.prof")
+        alloc_path = os.path.join(self.output_dir, f"{base_name}_alloc.txt")
+
+        # cProfile原始数据，可用snakeviz/pstats打开
+        profiler.dump_stats(prof_path)
+
+        # 文本摘要：耗时最多的函数
+        stats_stream = io.StringIO()
+        stats = pstats.Stats(profiler, stream=stats_stream)
+        stats.sort_stats("cumulative").print_stats(30)
+
+        # 内存分配对比：按代码行统计本次操作新增的分配
+        alloc_stats = snapshot_after.compare_to(snapshot_before, "lineno")
+        # 过滤掉tracemalloc自身的分配
+        alloc_stats = [stat for stat in alloc_stats
+                       if not stat.traceback[0].filename.endswith("tracemalloc.py")]
+
+        with open(alloc_path, 'w', encoding='utf-8') as f:
+            f.write(f"操作: {action_name}\n")
+            f.write(f"时间: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
+            f.write(f"当前跟踪内存: {current_memory / 1024:.1f} KiB\n")
+            f.write(f"峰值跟踪内存: {peak_memory / 1024:.1f} KiB\n")
+            f.write("\n")
+            f.write(f"新增内存分配 Top {self.top_allocations}:\n")
+            for stat in alloc_stats[:self.top_allocations]:
+                f.write(f"  {stat}\n")
+            f.write("\n")
+            f.write("耗时统计 (按累计时间排序):\n")
+            f.write(stats_stream.getvalue())
+
+        return {
+            'action': action_name,
+            'prof_path': prof_path,
+            'alloc_path': alloc_path,
+            'peak_memory': peak_memory
+        }
@@ -0,0 +1,613 @@
+# column_store.py - 解析结果列存储模块
+import os
+import re
+import json
+import mmap
+import bisect
+import struct
+import hashlib
+import heapq
+import operator
+import threading
+from array import array
+from urllib.parse import quote, unquote
+
+from field_model import FieldDef
+from decode_plan import dynamic_start
+
+
+OPERATORS = {
+    '==': operator.eq, '!=': operator.ne,
+    '>': operator.gt, '>=': operator.ge,
+    '<': operator.lt, '<=': operator.le,
+}
+
+# struct格式 -> 列文件的array类型码（浮点统一保存为double）
+_COLUMN_TYPECODES = {
+    'B': 'B', 'b': 'b', 'H': 'H', 'h': 'h',
+    'I': 'I', 'i': 'i', 'Q': 'Q', 'q': 'q',
+    'f': 'd', 'd': 'd',
+}
+
+OFFSET_COLUMN = "_offset"
+
+
+def _load_numpy():
+    """numpy可用时用于向量化过滤，没有安装时返回None"""
+    try:
+        import numpy
+        return numpy
+    except ImportError:
+        return None
+
+
+def parse_predicates(text):
+    """解析过滤条件，如 "目标扭矩 > 12.5 and 转速 == 0x0a27"
+
+    返回:
+        list: [(字段名, 运算符, 值)]
+    """
+    predicates = []
+    for part in re.split(r'\s+and\s+|\s*&&\s*', text.strip()):
+        if not part:
+            continue
+        match = re.fullmatch(r'\s*(.+?)\s*(==|!=|>=|<=|>|<)\s*(\S+)\s*', part)
+        if not match:
+            raise ValueError(f"无法解析条件: {part}")
+        name, op, value = match.groups()
+        try:
+            value = int(value, 0)
+        except ValueError:
+            value = float(value)
+        predicates.append((name, op, value))
+    return predicates
+
+
+def build_columns(definition):
+    """根据协议/命令定义生成列结构
+
+    整数和浮点字段按struct格式保存；不超过8字节的hex/bytes等字段按大端整数保存，
+    以便用 == 0x0a27 这样的条件过滤；位字段保存取出的位值；字符串等其他字段不建列。
+    第一个变长字段及其后的字段在各帧中位置不固定，也不建列
+
+    返回:
+        list: 列描述字典
+    """
+    columns = []
+    fixed_end = dynamic_start(definition)
+    for index, field in enumerate(definition.get('fields', [])):
+        field = FieldDef.from_dict(field)
+        start, end, layout = field.get_layout()
+        if fixed_end is not None and end > fixed_end:
+            continue
+        column = {'name': field.get('name', ''), 'file': f"{index}.col", 'start': start, 'end': end}
+        if layout:
+            fmt = layout[1].format
+            column.update(kind='struct', format=fmt, typecode=_COLUMN_TYPECODES[fmt[-1]])
+        elif field.is_bit_field():
+            try:
+                _, _, shift, mask, _, byteorder = field.get_bit_layout()
+            except ValueError:
+                continue
+            if mask.bit_length() > 64:
+                continue
+            column.update(kind='bits', typecode='Q', shift=shift, mask=mask, byteorder=byteorder)
+        elif 0 < end - start <= 8 and field.get('type', '').split('.')[0] in ('hex', 'bytes', 'BYTE', 'WORD', 'DWORD'):
+            column.update(kind='raw', typecode='Q')
+        else:
+            continue
+        columns.append(column)
+    return columns
+
+
+class _ColumnSegment:
+    """同一列结构下的一组列文件：每个字段一个定长数组文件，另有报文记录偏移列和分块最值(zone map)"""
+
+    def __init__(self, segment_dir, columns, block_rows, flush_rows, definition_key=""):
+        self.dir = segment_dir
+        self.definition_key = definition_key
+        self.columns = columns
+        self.block_rows = block_rows
+        self.flush_rows = flush_rows
+        os.makedirs(self.dir, exist_ok=True)
+        schema_path = os.path.join(self.dir, "schema.json")
+        if not os.path.exists(schema_path):
+            with open(schema_path, 'w', encoding='utf-8') as f:
+                json.dump({'definition': definition_key, 'columns': columns}, f, ensure_ascii=False, indent=2)
+
+        self._structs = [struct.Struct(column['format']) if column['kind'] == 'struct' else None
+                         for column in columns]
+        self._buffers = [array(column['typecode']) for column in columns]
+        self._offsets = array('Q')
+        self.row_count = self._stored_rows()
+
+    def _path(self, file_name):
+        return os.path.join(self.dir, file_name)
+
+    def _stored_rows(self):
+        path = self._path(OFFSET_COLUMN + ".col")
+        return os.path.getsize(path) // 8 if os.path.exists(path) else 0
+
+    def append(self, data, frame_offset):
+        """追加一帧，报文长度不足时返回False"""
+        values = []
+        for column, parser in zip(self.columns, self._structs):
+            if column['end'] > len(data):
+                return False
+            if parser is not None:
+                values.append(parser.unpack_from(data, column['start'])[0])
+            elif column['kind'] == 'bits':
+                container = int.from_bytes(data[column['start']:column['end']], column['byteorder'])
+                values.append((container >> column['shift']) & column['mask'])
+            else:
+                values.append(int.from_bytes(data[column['start']:column['end']], 'big'))
+        for buffer, value in zip(self._buffers, values):
+            buffer.append(value)
+        self._offsets.append(frame_offset)
+        self.row_count += 1
+        if len(self._offsets) >= self.flush_rows:
+            self.flush()
+        return True
+
+    def flush(self):
+        """把缓冲的行写入列文件并更新zone map"""
+        if not self._offsets:
+            return
+        first_row = self.row_count - len(self._offsets)
+        for column, buffer in zip(self.columns, self._buffers):
+            with open(self._path(column['file']), 'ab') as f:
+                buffer.tofile(f)
+            self._update_zone_map(column, buffer, first_row)
+            del buffer[:]
+        with open(self._path(OFFSET_COLUMN + ".col"), 'ab') as f:
+            self._offsets.tofile(f)
+        del self._offsets[:]
+
+    def _update_zone_map(self, column, buffer, first_row):
+        """按块记录每列的最小值和最大值，查询时跳过不可能满足条件的块"""
+        zone_path = self._path(column['file'] + ".zone")
+        zones = array('d')
+        if os.path.exists(zone_path):
+            with open(zone_path, 'rb') as f:
+                zones.frombytes(f.read())
+        row = first_row
+        position = 0
+        while position < len(buffer):
+            block = row // self.block_rows
+            block_end = (block + 1) * self.block_rows
+            chunk = buffer[position:position + block_end - row]
+            low, high = min(chunk), max(chunk)
+            if len(zones) > block * 2:
+                zones[block * 2] = min(zones[block * 2], low)
+                zones[block * 2 + 1] = max(zones[block * 2 + 1], high)
+            else:
+                zones.extend((low, high))
+            position += len(chunk)
+            row += len(chunk)
+        with open(zone_path, 'wb') as f:
+            zones.tofile(f)
+
+    def column(self, name):
+        """按字段名取列描述，没有该列时返回None"""
+        return next((column for column in self.columns if column['name'] == name), None)
+
+    def read_values(self, column):
+        """读取一列已写入文件的全部值"""
+        values = array(column['typecode'])
+        with open(self._path(column['file']), 'rb') as f:
+            values.frombytes(f.read(self.row_count * values.itemsize))
+        return values
+
+    def read_offsets(self):
+        """读取每行在报文记录中的偏移"""
+        return self.read_values({'file': OFFSET_COLUMN + ".col", 'typecode': 'Q'})
+
+    def read_zone_map(self, column):
+        zones = array('d')
+        zone_path = self._path(column['file'] + ".zone")
+        if os.path.exists(zone_path):
+            with open(zone_path, 'rb') as f:
+                zones.frombytes(f.read())
+        return zones
+
+
+class ColumnStore:
+    """按命令分开的解析结果列存储
+
+    每个命令键(组/命令ID)下按协议/命令定义和字段结构分段：同一命令ID下follow不同的命令、
+    修改字段前后的定义各写入自己的列段，读取和查询时覆盖该命令的全部列段。
+    每段中每个数值字段一个定长数组文件，另有一列记录该帧在报文记录(FrameLog)中的偏移。
+    列文件可以直接内存映射，过滤时安装了numpy则向量化比较，否则逐块比较；
+    zone map跳过不满足条件的块，对常用字段可以另外建立排序索引。
+
+    追加、写入文件和查询可能在不同线程中进行（采集线程追加，界面线程查询），
+    由存储自身的锁保证互斥，不依赖调用方的锁
+    """
+
+    BLOCK_ROWS = 65536  # zone map的块大小
+    FLUSH_ROWS = 1024   # 缓冲多少行后写入文件
+
+    def __init__(self, root_dir):
+        self.root_dir = str(root_dir)
+        os.makedirs(self.root_dir, exist_ok=True)
+        self._segments = {}  # (命令键, 段目录名) -> _ColumnSegment
+        self._definition_segments = {}  # (命令键, 定义版本) -> _ColumnSegment，避免每帧重新生成列结构
+        self._lock = threading.RLock()
+
+    def _command_dir(self, command_key):
+        return os.path.join(self.root_dir, quote(command_key, safe=''))
+
+    def _segment(self, command_key, definition_key, columns):
+        """定义键和列结构对应的列段，段目录名为两者的摘要"""
+        digest = hashlib.blake2b(json.dumps([definition_key, columns], ensure_ascii=False).encode('utf-8'),
+                                 digest_size=8).hexdigest()
+        segment = self._segments.get((command_key, digest))
+        if segment is None:
+            segment = _ColumnSegment(os.path.join(self._command_dir(command_key), digest), columns,
+                                     self.BLOCK_ROWS, self.FLUSH_ROWS, definition_key)
+            self._segments[(command_key, digest)] = segment
+        return segment
+
+    def append(self, command_key, definition, data, frame_offset, version=None, definition_key=None):
+        """追加一帧的解析结果
+
+        参数:
+            command_key (str): 命令键，如 livewire/DB
+            definition (dict): 匹配到的协议/命令定义
+            data (bytes): 报文字节
+            frame_offset (int): 该帧在报文记录中的偏移
+            version: 定义版本，相同版本直接沿用上次的列结构
+            definition_key (str): 定义键（组/命令ID/名称），区分同一命令键下的不同定义，默认为定义名称
+
+        返回:
+            bool: 是否写入
+        """
+        with self._lock:
+            cache_key = (command_key, version)
+            segment = self._definition_segments.get(cache_key) if version is not None else None
+            if segment is None:
+                columns = build_columns(definition)
+                if not columns:
+                    return False
+                if definition_key is None:
+                    definition_key = definition.get('name', '')
+                segment = self._segment(command_key, definition_key, columns)
+                if version is not None:
+                    self._definition_segments[cache_key] = segment
+            return segment.append(data, frame_offset)
+
+    def flush(self):
+        with self._lock:
+            for segment in self._segments.values():
+                segment.flush()
+
+    def close(self):
+        with self._lock:
+            self.flush()
+            self._segments = {}
+            self._definition_segments = {}
+
+    def command_keys(self):
+        """已有列存储的命令键"""
+        return [unquote(name) for name in sorted(os.listdir(self.root_dir))
+                if os.path.isdir(os.path.join(self.root_dir, name))]
+
+    def _command_segments(self, command_key):
+        """打开命令的全部列段并写入缓冲的行，调用方须持有self._lock"""
+        command_dir = self._command_dir(command_key)
+        if not os.path.isdir(command_dir):
+            return []
+        segments = []
+        for name in sorted(os.listdir(command_dir)):
+            segment = self._segments.get((command_key, name))
+            if segment is None:
+                schema_path = os.path.join(command_dir, name, "schema.json")
+                if not os.path.exists(schema_path):
+                    continue
+                with open(schema_path, 'r', encoding='utf-8') as f:
+                    schema = json.load(f)
+                segment = _ColumnSegment(os.path.join(command_dir, name), schema['columns'],
+                                         self.BLOCK_ROWS, self.FLUSH_ROWS, schema.get('definition', ''))
+                self._segments[(command_key, name)] = segment
+            segment.flush()
+            segments.append(segment)
+        return segments
+
+    def get_columns(self, command_key):
+        """命令各列段中的列名（去重，按首次出现的顺序）"""
+        with self._lock:
+            names = {}
+            for segment in self._command_segments(command_key):
+                for column in segment.columns:
+                    names.setdefault(column['name'], None)
+            return list(names)
+
+    def read_column(self, command_key, field_name):
+        """读取一个字段在命令全部列段中的值，按报文记录中的顺序排列
+
+        返回:
+            array: 字段值（array('d')），没有该列时返回None
+        """
+        with self._lock:
+            parts = []
+            for segment in self._command_segments(command_key):
+                column = segment.column(field_name)
+                if column is not None and segment.row_count:
+                    parts.append((segment.read_offsets(), segment.read_values(column)))
+            if not parts:
+                return None
+            if len(parts) == 1:
+                values = parts[0][1]
+                return values if values.typecode == 'd' else array('d', values)
+            # 各段内按偏移递增，合并后与报文记录的顺序一致
+            merged = heapq.merge(*(zip(offsets, values) for offsets, values in parts))
+            return array('d', (value for _, value in merged))
+
+    def row_count(self, command_key):
+        with self._lock:
+            return sum(segment.row_count for segment in self._command_segments(command_key))
+
+    # ---------- 查询 ----------
+
+    def query(self, command_key, where, limit=None):
+        """按条件过滤帧，覆盖命令中包含全部条件字段的列段
+
+        参数:
+            command_key (str): 命令键
+            where (str|list): 条件文本(如 "目标扭矩 > 12.5 and 转速 == 0x0a27")或parse_predicates的结果
+            limit (int): 最多返回的行数
+
+        返回:
+            list: [(定义键, 段内行号, 报文记录偏移)]，按报文记录偏移排序
+        """
+        predicates = parse_predicates(where) if isinstance(where, str) else list(where)
+        for name, op, value in predicates:
+            if op not in OPERATORS:
+                raise ValueError(f"不支持的运算符: {op}")
+        with self._lock:
+            segments = self._command_segments(command_key)
+            names = {column['name'] for segment in segments for column in segment.columns}
+            for name, op, value in predicates:
+                if name not in names:
+                    raise ValueError(f"字段 {name} 没有列数据")
+
+            results = []
+            for segment in segments:
+                by_name = {column['name']: column for column in segment.columns}
+                if segment.row_count == 0 or any(name not in by_name for name, op, value in predicates):
+                    continue
+                results.append(self._query_segment(segment, by_name, predicates, limit))
+            matches = list(heapq.merge(*results, key=lambda match: match[2]))
+            return matches[:limit] if limit is not None else matches
+
+    def _query_segment(self, segment, by_name, predicates, limit):
+        """在一个列段中过滤，返回 [(定义键, 行号, 报文记录偏移)]"""
+        with _MappedColumns(segment) as mapped:
+            ranges, rows = self._candidate_rows(segment, mapped, by_name, predicates)
+            numpy = _load_numpy()
+            if numpy is not None:
+                result = self._filter_numpy(numpy, segment, mapped, by_name, predicates, ranges, rows, limit)
+            else:
+                result = self._filter_python(mapped, by_name, predicates, ranges, rows, limit)
+            offsets = mapped.view(OFFSET_COLUMN, 'Q')
+            return [(segment.definition_key, row, offsets[row]) for row in result]
+
+    def _candidate_rows(self, segment, mapped, by_name, predicates):
+        """先用排序索引缩小范围，再用zone map跳过整块
+
+        返回:
+            tuple: (需要检查的 (起始行, 结束行) 区间列表, None)，
+                   或使用排序索引时为 (None, 需要检查的行号列表)
+        """
+        row_count = segment.row_count
+        for name, op, value in predicates:
+            column = by_name[name]
+            index = self._load_sorted_index(segment, column)
+            if index is None or op == '!=':
+                continue
+            covered, order = index
+            values = mapped.view(column['file'], column['typecode'])
+            sorted_values = _SortedView(values, order)
+            low, high = 0, len(order)
+            if op in ('==', '>=', '>'):
+                low = (bisect.bisect_left if op != '>' else bisect.bisect_right)(sorted_values, value)
+            if op in ('==', '<=', '<'):
+                high = (bisect.bisect_right if op != '<' else bisect.bisect_left)(sorted_values, value)
+            rows = sorted(order[low:high])
+            # 建立索引之后追加的行逐行检查
+            return None, rows + list(range(covered, row_count))
+
+        ranges = []
+        block_rows = segment.block_rows
+        zone_maps = {name: segment.read_zone_map(by_name[name]) for name, op, value in predicates}
+        for block in range((row_count + block_rows - 1) // block_rows):
+            if all(self._zone_may_match(zone_maps[name], block, op, value) for name, op, value in predicates):
+                ranges.append((block * block_rows, min(row_count, (block + 1) * block_rows)))
+        return ranges, None
+
+    def _zone_may_match(self, zones, block, op, value):
+        if len(zones) <= block * 2 + 1:
+            return True
+        low, high = zones[block * 2], zones[block * 2 + 1]
+        if op == '==':
+            return low <= value <= high
+        if op == '!=':
+            return not (low == high == value)
+        if op in ('>', '>='):
+            return OPERATORS[op](high, value)
+        return OPERATORS[op](low, value)
+
+    def _filter_numpy(self, numpy, segment, mapped, by_name, predicates, ranges, rows, limit):
+        arrays = {name: numpy.frombuffer(mapped.buffer(by_name[name]['file']),
+                                         dtype=numpy.dtype(by_name[name]['typecode']),
+                                         count=segment.row_count)
+                  for name, op, value in predicates}
+        result = []
+        if ranges is not None:
+            for start, end in ranges:
+                mask = numpy.ones(end - start, dtype=bool)
+                for name, op, value in predicates:
+                    mask &= OPERATORS[op](arrays[name][start:end], value)
+                result.extend((numpy.nonzero(mask)[0] + start).tolist())
+                if limit is not None and len(result) >= limit:
+                    return result[:limit]
+            return result
+        row_index = numpy.asarray(rows, dtype=numpy.int64)
+        mask = numpy.ones(len(row_index), dtype=bool)
+        for name, op, value in predicates:
+            mask &= OPERATORS[op](arrays[name][row_index], value)
+        result = row_index[mask].tolist()
+        return result[:limit] if limit is not None else result
+
+    def _filter_python(self, mapped, by_name, predicates, ranges, rows, limit):
+        views = [(mapped.view(by_name[name]['file'], by_name[name]['typecode']), OPERATORS[op], value)
+                 for name, op, value in predicates]
+        if ranges is not None:
+            rows = (row for start, end in ranges for row in range(start, end))
+        result = []
+        for row in rows:
+            if all(compare(values[row], value) for values, compare, value in views):
+                result.append(row)
+                if limit is not None and len(result) >= limit:
+                    break
+        return result
+
+    # ---------- 排序索引 ----------
+
+    def build_sorted_index(self, command_key, field_name):
+        """为字段在命令的各列段中建立排序索引，之后对该字段的范围和等值查询使用二分查找
+
+        返回:
+            tuple: (是否成功, 消息)
+        """
+        with self._lock:
+            segments = self._command_segments(command_key)
+            if not segments:
+                return False, f"没有命令 {command_key} 的列数据"
+            total = 0
+            indexed = 0
+            for segment in segments:
+                column = segment.column(field_name)
+                if column is None:
+                    continue
+                total += self._build_segment_index(segment, column)
+                indexed += 1
+            if not indexed:
+                return False, f"字段 {field_name} 没有列数据"
+            return True, f"已为 {field_name} 建立排序索引，共 {indexed} 个列段 {total} 行"
+
+    def _build_segment_index(self, segment, column):
+        """为一个列段中的一列建立排序索引，返回覆盖的行数"""
+        with _MappedColumns(segment) as mapped:
+            values = mapped.view(column['file'], column['typecode'])
+            numpy = _load_numpy()
+            if numpy is not None:
+                order = array('Q', numpy.argsort(numpy.asarray(values), kind='stable').astype('uint64').tobytes())
+            else:
+                order = array('Q', sorted(range(len(values)), key=values.__getitem__))
+        with open(segment._path(column['file'] + ".sidx"), 'wb') as f:
+            array('Q', [len(order)]).tofile(f)
+            order.tofile(f)
+        return len(order)
+
+    def _load_sorted_index(self, segment, column):
+        """读取排序索引: (覆盖的行数, 行号顺序)；没有索引时返回None"""
+        path = segment._path(column['file'] + ".sidx")
+        if not os.path.exists(path):
+            return None
+        data = array('Q')
+        with open(path, 'rb') as f:
+            data.frombytes(f.read())
+        return data[0], data[1:]
+
+
+class _SortedView:
+    """按排序索引的顺序访问列值，供bisect使用"""
+
+    def __init__(self, values, order):
+        self.values = values
+        self.order = order
+
+    def __len__(self):
+        return len(self.order)
+
+    def __getitem__(self, i):
+        return self.values[self.order[i]]
+
+
+class _MappedColumns:
+    """查询期间把列文件映射到内存"""
+
+    def __init__(self, segment):
+        self.segment = segment
+        self._files = []
+        self._maps = {}
+        self._views = []
+
+    def __enter__(self):
+        return self
+
+    def buffer(self, file_name):
+        if file_name not in self._maps:
+            path = self.segment._path(file_name)
+            if os.path.getsize(path) == 0:
+                self._maps[file_name] = b""
+            else:
+                f = open(path, 'rb')
+                self._files.append(f)
+                self._maps[file_name] = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return self._maps[file_name]
+
+    def view(self, file_name, typecode):
+        if file_name == OFFSET_COLUMN:
+            file_name = OFFSET_COLUMN + ".col"
+        base = memoryview(self.buffer(file_name))
+        view = base.cast(typecode)
+        self._views.extend((view, base))
+        return view
+
+    def __exit__(self, *exc):
+        for view in self._views:
+            view.release()
+        for mapped in self._maps.values():
+            if isinstance(mapped, mmap.mmap):
+                try:
+                    mapped.close()
+                except BufferError:
+                    # 仍有返回值引用映射时交给垃圾回收关闭
+                    pass
+        for f in self._files:
+            f.close()
+        return False
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="按字段条件查询解析结果列存储")
+    parser.add_argument("--dir", default=os.path.join("frame_log", "columns"), help="列存储目录")
+    subparsers = parser.add_subparsers(dest="action", required=True)
+    subparsers.add_parser("list", help="列出所有命令及行数")
+    query_parser = subparsers.add_parser("query", help="按条件过滤帧")
+    query_parser.add_argument("command", help="命令键，如 livewire/DB")
+    query_parser.add_argument("where", help="条件，如 \"目标扭矩 > 12.5 and 转速 == 0x0a27\"")
+    query_parser.add_argument("--limit", type=int, default=20)
+    index_parser = subparsers.add_parser("index", help="为字段建立排序索引")
+    index_parser.add_argument("command")
+    index_parser.add_argument("field")
+    args = parser.parse_args()
+
+    store = ColumnStore(args.dir)
+    if args.action == "list":
+        for command_key in store.command_keys():
+            print(f"{command_key:<24} {store.row_count(command_key):>10}  {', '.join(store.get_columns(command_key))}")
+    elif args.action == "query":
+        import time
+        started = time.perf_counter()
+        matches = store.query(args.command, args.where)
+        elapsed = (time.perf_counter() - started) * 1000
+        for definition_key, row, offset in matches[:args.limit]:
+            print(f"{definition_key:<32} 行 {row:>10}  报文记录偏移 {offset}")
+        print(f"共 {len(matches)} 行匹配，用时 {elapsed:.1f} ms")
+    else:
+        print(store.build_sorted_index(args.command, args.field)[1])
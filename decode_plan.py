@@ -0,0 +1,284 @@
+# decode_plan.py - 变长字段、重复记录和分支布局的预编译解析计划
+from field_model import FieldDef, DecodedField, PlacedField
+
+GROUP_TYPE = 'group'          # 重复记录组，子字段定义在fields中，位置相对于每条记录的起始
+LENGTH_KEY = 'length_field'   # 字段的实际字节数取自该字段的值
+COUNT_KEY = 'count_field'     # 记录组的记录条数取自该字段的值
+SELECTOR_KEY = 'variant_field'  # 按该字段的值选择分支布局
+VARIANTS_KEY = 'variants'       # 分支值 -> 分支定义
+DEFAULT_VARIANT = 'default'
+
+_STEP_FIXED, _STEP_LENGTH, _STEP_GROUP = range(3)
+
+
+def is_dynamic_field(field):
+    """字段的长度是否由报文内容决定"""
+    return (field.get(LENGTH_KEY) is not None or field.get(COUNT_KEY) is not None
+            or str(field.get('type', '')).split('.')[0] == GROUP_TYPE)
+
+
+def dynamic_start(definition):
+    """第一个变长字段在定义中的起始位置，该位置之后的字段在各帧中的位置不固定
+
+    返回:
+        int|None: 没有变长字段时为None
+    """
+    starts = [field.get('start_pos', 0) for field in definition.get('fields', []) if is_dynamic_field(field)]
+    return min(starts) if starts else None
+
+
+def _to_count(value, name):
+    """把长度/条数字段的值转换为非负整数
+
+    hex类型的值为'0x02'这样的字符串，按16进制解析；不超过4字节的char解析为十进制数字字符串
+    """
+    try:
+        if isinstance(value, str) and value.strip()[:2].lower() == '0x':
+            count = int(value.strip(), 16)
+        else:
+            count = int(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"字段 {name} 的值 {value!r} 不能作为长度/条数")
+    if count < 0:
+        raise ValueError(f"字段 {name} 的值 {count} 为负数")
+    return count
+
+
+def _compile_leaf(field, convert):
+    """生成定长字段的取值函数 f(data, start, end)"""
+    if field.is_bit_field():
+        decode_bits = field.decode_bits
+        return lambda data, start, end: decode_bits(data[start:end])
+    layout = field.get_layout()[2]
+    if layout and layout[0] != 'd':
+        # 长度匹配的整数直接按struct解包，与批量解析一致
+        unpack_from = layout[1].unpack_from
+        return lambda data, start, end: unpack_from(data, start)[0]
+    field_type = field.get('type', 'u8')
+    endian = field.get('endian', 'big')
+    encoding = field.get('encoding')
+    if encoding:
+        return lambda data, start, end: convert(data[start:end].hex(), field_type, endian, encoding)
+    return lambda data, start, end: convert(data[start:end].hex(), field_type, endian)
+
+
+class DecodePlan:
+    """由协议/命令定义编译出的解析计划
+
+    定义中的start_pos/end_pos为样本报文中的位置（名义位置）。解析时按名义起始位置的顺序
+    向前走一遍：变长字段的实际长度取自之前已解析的长度字段，记录组按条数字段重复解析子计划，
+    之后的字段整体按实际长度与名义长度之差平移。字段的排序、取值函数和引用关系在编译时确定，
+    解析每帧、每条记录时不再遍历字段定义
+    """
+
+    def __init__(self, definition, convert, outer_names=()):
+        """
+        参数:
+            definition (dict): 协议/命令定义，或记录组字段（子字段在fields中，位置相对于记录起始）
+            convert (callable): 非数值字段的转换函数 convert(hex, type, endian)，
+                通常为ProtocolManager._convert_field_value
+            outer_names (iterable): 记录组可以引用的外层字段名
+
+        异常:
+            ValueError: 引用的长度/条数字段不在被引用字段之前、记录组没有子字段或没有条数字段
+        """
+        self.name = definition.get('name', '')
+        fields = sorted((FieldDef.from_dict(field) for field in definition.get('fields', [])),
+                        key=lambda field: field.get('start_pos', 0))
+        self.steps = []
+        self.dynamic = False
+        seen = set(outer_names)
+        for field in fields:
+            name = field.get('name', '')
+            start = field.get('start_pos', 0)
+            length = field.get('end_pos', 0) - start + 1
+            if str(field.get('type', 'u8')).split('.')[0] == GROUP_TYPE:
+                if not field.get('fields'):
+                    raise ValueError(f"记录组 {name} 没有定义子字段")
+                if field.get(COUNT_KEY) is None:
+                    raise ValueError(f"记录组 {name} 没有指定条数字段 {COUNT_KEY}")
+                kind, ref, decoder = _STEP_GROUP, field.get(COUNT_KEY), DecodePlan(field, convert, seen)
+            elif field.get(LENGTH_KEY) is not None:
+                kind, ref, decoder = _STEP_LENGTH, field.get(LENGTH_KEY), _compile_leaf(field, convert)
+            else:
+                kind, ref, decoder = _STEP_FIXED, None, _compile_leaf(field, convert)
+            if kind != _STEP_FIXED:
+                self.dynamic = True
+            if ref is not None and ref not in seen:
+                raise ValueError(f"字段 {name} 引用的字段 {ref} 不存在或不在它之前")
+            seen.add(name)
+            self.steps.append((kind, field, name, start, length, ref, decoder))
+        # 记录组的记录长度可以用record_size指定（包含末尾的保留字节）
+        self.nominal_size = definition.get('record_size') or max(
+            (step[3] + step[4] for step in self.steps), default=0)
+
+    def decode(self, data):
+        """解析一帧
+
+        参数:
+            data (bytes): 报文
+
+        返回:
+            list: 字段结果；位置未变的字段为DecodedField，位置变化的字段和记录组为PlacedField。
+            报文长度不足或长度/条数无效时，从该字段起停止解析
+        """
+        return self.decode_at(data, 0, {})[0]
+
+    def decode_at(self, data, base, outer):
+        """从base开始按计划解析，outer为外层已解析的字段值（记录组引用外层字段时使用）
+
+        返回:
+            tuple: (字段结果列表, 实际结束位置)，解析中断时结束位置为None
+        """
+        results = []
+        values = {}
+        delta = base
+        size = len(data)
+        for kind, field, name, start, length, ref, decoder in self.steps:
+            offset = start + delta
+            try:
+                count = None if ref is None else _to_count(values[ref] if ref in values else outer.get(ref), ref)
+                if kind == _STEP_GROUP:
+                    result, end = self._decode_group(data, field, offset, count, decoder, values)
+                else:
+                    end = offset + (count if kind == _STEP_LENGTH else length)
+                    if end > size:
+                        break
+                    value = decoder(data, offset, end) if end > offset else ''
+                    hex_data = data[offset:end].hex().upper()
+                    if offset == start and end - offset == length:
+                        result = DecodedField(field, value, hex_data)
+                    else:
+                        result = PlacedField(field, value, hex_data, offset, end - 1)
+            except ValueError as e:
+                print(f"解析变长字段失败: {e}")
+                break
+            values[name] = result.value
+            results.append(result)
+            delta += end - offset - length
+        else:
+            return results, self.nominal_size + delta
+        return results, None
+
+    @staticmethod
+    def _decode_group(data, field, offset, count, record_plan, values):
+        """按条数解析记录组，返回 (PlacedField, 结束位置)，value为每条记录的 {字段名: 值}"""
+        records = []
+        end = offset
+        for index in range(count):
+            record, end = record_plan.decode_at(data, end, values)
+            if end is None:
+                raise ValueError(f"记录组 {field.get('name', '')} 第 {index + 1} 条记录不完整")
+            records.append(record)
+        value = [{item.name: item.value for item in record} for record in records]
+        return PlacedField(field, value, data[offset:end].hex().upper(), offset, end - 1, records=records), end
+
+
+class VariantTable:
+    """按选择字段的值区分布局的命令：公共字段 + 各分支字段
+
+    定义中用variant_field指定选择字段（须为公共字段中的定长字段），variants为
+    值 -> {"name": 分支名, "fields": [分支字段]}，值为"default"的分支在没有匹配时使用。
+    加载定义时为每个分支生成合并后的定义（公共字段 + 分支字段），解析时只需解析选择字段，
+    再用字典直接取到对应分支
+    """
+
+    def __init__(self, definition):
+        """
+        参数:
+            definition (dict): 含variant_field和variants的协议/命令定义
+
+        异常:
+            ValueError: 选择字段不存在或不是定长字段、分支格式错误
+        """
+        self.selector_name = definition.get(SELECTOR_KEY)
+        base_fields = [FieldDef.from_dict(field) for field in definition.get('fields', [])]
+        self.selector = next((field for field in base_fields if field.get('name') == self.selector_name), None)
+        if self.selector is None:
+            raise ValueError(f"选择字段 {self.selector_name} 不在公共字段中")
+        if is_dynamic_field(self.selector) or any(
+                is_dynamic_field(field) and field.get('start_pos', 0) <= self.selector.get('start_pos', 0)
+                for field in base_fields):
+            raise ValueError(f"选择字段 {self.selector_name} 的位置必须固定")
+
+        variants = definition.get(VARIANTS_KEY)
+        if not isinstance(variants, dict) or not variants:
+            raise ValueError("variants 必须是 值 -> 分支定义 的对象")
+        common = {key: value for key, value in definition.items()
+                  if key not in (VARIANTS_KEY, SELECTOR_KEY, 'fields', 'samples', 'hex_data')}
+        self.base = dict(common, fields=base_fields)  # 没有匹配分支时只解析公共字段
+        self.cases = {}
+        self.default = None
+        for key, variant in variants.items():
+            if not isinstance(variant, dict):
+                raise ValueError(f"分支 {key} 不是对象")
+            merged = dict(common)
+            merged['variant'] = variant.get('name', str(key))
+            merged['fields'] = base_fields + [FieldDef.from_dict(field) for field in variant.get('fields', [])]
+            if str(key) == DEFAULT_VARIANT:
+                self.default = merged
+            else:
+                self.cases[variant_key(key)] = merged
+
+    def select(self, value):
+        """按选择字段的值取分支的合并定义，没有匹配且没有default分支时返回None"""
+        return self.cases.get(variant_key(value), self.default)
+
+    def definitions(self):
+        """所有分支的合并定义"""
+        return list(self.cases.values()) + ([self.default] if self.default else [])
+
+
+def variant_key(value):
+    """分支值的规范形式：整数和数字字符串（含0x前缀）统一为十进制字符串，其他字符串去掉首尾空白"""
+    if isinstance(value, bool):
+        value = int(value)
+    if isinstance(value, int):
+        return str(value)
+    text = str(value).strip()
+    try:
+        return str(int(text, 16)) if text[:2].lower() == '0x' else str(int(text))
+    except ValueError:
+        return text
+
+
+def expand_records(decoded):
+    """把记录组结果展开为逐条记录的字段，名称如 records[0].id，用于表格显示和高亮
+
+    参数:
+        decoded: 字段结果
+
+    返回:
+        list: 非记录组字段原样返回 [decoded]
+    """
+    records = getattr(decoded, 'records', None)
+    if records is None:
+        return [decoded]
+    expanded = [decoded]
+    for index, record in enumerate(records):
+        for item in record:
+            for child in expand_records(item):
+                expanded.append(PlacedField(child.definition, child.value, child.hex,
+                                            child.start_pos, child.end_pos,
+                                            name=f"{decoded.name}[{index}].{child.name}"))
+    return expanded
+
+
+if __name__ == "__main__":
+    import argparse
+    from protocol_manager import ProtocolManager
+
+    parser = argparse.ArgumentParser(description="按包含变长字段/记录组的定义解析一帧")
+    parser.add_argument("protocol_key", help="协议/命令键，如 livewire/DB")
+    parser.add_argument("hex_data", help="16进制报文")
+    parser.add_argument("--data-dir", default="protocols", help="协议目录")
+    args = parser.parse_args()
+
+    manager = ProtocolManager(args.data_dir)
+    definition = manager.get_protocol_by_key(args.protocol_key)
+    if not definition:
+        raise SystemExit(f"协议不存在: {args.protocol_key}")
+    result = manager.parse_protocol_data(args.hex_data.replace(' ', ''), definition)
+    for field in result['fields'] if result else []:
+        for item in expand_records(field):
+            print(f"{item.start_pos:>5}-{item.end_pos:<5} {item.name:<30} {item.value}")
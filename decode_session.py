@@ -0,0 +1,135 @@
+# decode_session.py - 解码会话模块
+class HexLayout:
+    """16进制显示布局：字节位置到输出文本索引的换算
+
+    输出每行格式为 "0000: 00 11 22 ...  |ascii|"，偏移量至少4位，数据超过64KB时按最大偏移加宽，
+    第k个字节的16进制从第 hex_start_col+3k 列开始，ASCII字符在竖线之后
+    """
+
+    MIN_OFFSET_WIDTH = 4
+
+    def __init__(self, byte_count, bytes_per_line):
+        self.byte_count = byte_count
+        self.bytes_per_line = bytes_per_line
+        self.offset_width = self.offset_width_for(byte_count)
+        self.hex_start_col = self.offset_width + 2  # "0000: " 的长度
+        # 竖线位置: 偏移量 + 16进制部分(含填充) + 两个空格
+        self.ascii_start_col = self.hex_start_col + 3 * bytes_per_line - 1 + 2 + 1
+
+    @classmethod
+    def offset_width_for(cls, byte_count):
+        """显示byte_count字节时偏移量的16进制位数"""
+        return max(cls.MIN_OFFSET_WIDTH, len(f"{max(byte_count - 1, 0):x}"))
+
+    def byte_spans(self, start_pos, end_pos):
+        """获取字节范围在输出文本中的位置
+
+        参数:
+            start_pos (int): 起始字节
+            end_pos (int): 结束字节（包含）
+
+        返回:
+            list: 每行一项 (16进制起始索引, 16进制结束索引, ASCII起始索引, ASCII结束索引)
+        """
+        spans = []
+        if start_pos is None or end_pos is None or start_pos < 0 or start_pos > end_pos:
+            return spans
+        end_pos = min(end_pos, self.byte_count - 1)
+
+        bytes_per_line = self.bytes_per_line
+        position = start_pos
+        while position <= end_pos:
+            line_index = position // bytes_per_line
+            line_start = line_index * bytes_per_line
+            line_byte_start = position - line_start
+            line_byte_end = min(end_pos, line_start + bytes_per_line - 1) - line_start
+
+            line_num = line_index + 1
+            hex_start_col = self.hex_start_col + line_byte_start * 3
+            # 包含字节后的空格，行尾最后一个字节除外
+            is_last_byte_in_line = (line_byte_end == bytes_per_line - 1)
+            hex_end_col = self.hex_start_col + line_byte_end * 3 + (2 if is_last_byte_in_line else 3)
+
+            spans.append((
+                f"{line_num}.{hex_start_col}",
+                f"{line_num}.{hex_end_col}",
+                f"{line_num}.{self.ascii_start_col + line_byte_start}",
+                f"{line_num}.{self.ascii_start_col + line_byte_end + 1}"
+            ))
+            position = line_start + bytes_per_line
+        return spans
+
+
+class DecodeSession:
+    """一份输入数据的解码会话
+
+    保存字节数据、匹配到的定义和解析结果，自动格式化、识别协议、
+    选择命令等操作都从会话中读取，同一份数据只匹配和解析一次
+    """
+
+    def __init__(self, hex_data, protocol_manager, record=True):
+        """
+        参数:
+            hex_data (str): 16进制数据
+            protocol_manager (ProtocolManager): 协议管理器
+            record (bool): 第一次解码时是否写入报文记录（从报文记录载入的帧为False）
+        """
+        self.hex_data = hex_data
+        self.protocol_manager = protocol_manager
+        self.record = record
+        # 第4个字节(索引6-7)是命令ID
+        self.command_id = hex_data[6:8].upper() if len(hex_data) >= 8 else ""
+        self.protocol = None      # 匹配到的协议或命令
+        self.parsed_data = None   # 匹配定义的解析结果
+        self._decoded_version = None
+        self._parsed_by_definition = {}  # 定义键 -> (定义版本, 解析结果)
+        self._data = None
+
+    @property
+    def data(self):
+        """字节形式的数据"""
+        if self._data is None:
+            try:
+                self._data = bytes.fromhex(self.hex_data)
+            except ValueError:
+                self._data = b""
+        return self._data
+
+    def matches(self, hex_data):
+        """会话是否对应这份数据"""
+        return hex_data == self.hex_data
+
+    def decode(self):
+        """匹配并解析数据，协议定义未变化时直接返回上次的结果
+
+        返回:
+            tuple: (匹配的协议或命令, 解析结果)
+        """
+        version = self.protocol_manager.definition_version
+        if self._decoded_version != version:
+            # 同一份数据只在第一次解码时写入报文记录
+            self.protocol, self.parsed_data = self.protocol_manager.decode_frame(
+                self.hex_data, record=self.record and self._decoded_version is None)
+            self._decoded_version = version
+            if self.protocol:
+                self._remember(self.protocol, self.parsed_data)
+        return self.protocol, self.parsed_data
+
+    def parse_with(self, definition):
+        """使用指定的协议/命令定义解析数据，同一定义版本只解析一次"""
+        if not definition:
+            return None
+        manager = self.protocol_manager
+        key = manager.get_definition_key(definition)
+        version = manager.get_definition_version(definition)
+        cached = self._parsed_by_definition.get(key)
+        if cached and cached[0] == version and cached[1] is not None:
+            return cached[1]
+        parsed_data = manager.parse_protocol_data(self.hex_data, definition)
+        self._parsed_by_definition[key] = (version, parsed_data)
+        return parsed_data
+
+    def _remember(self, definition, parsed_data):
+        manager = self.protocol_manager
+        key = manager.get_definition_key(definition)
+        self._parsed_by_definition[key] = (manager.get_definition_version(definition), parsed_data)
@@ -0,0 +1,146 @@
+# field_index.py - 字段区间索引：重叠/越界检查与字节覆盖图
+import bisect
+
+from field_model import BIT_FIELD_TYPE
+
+
+def _field_range(field):
+    """字段的 (起始, 结束, 名称, 位范围)；位字段的位范围为 (位偏移, 位偏移+位宽)，其他字段为None"""
+    start = field.get('start_pos', 0)
+    end = field.get('end_pos', 0)
+    bits = None
+    if str(field.get('type', '')).split('.')[0] == BIT_FIELD_TYPE:
+        offset = field.get('bit_offset', 0)
+        bits = (offset, offset + field.get('bit_width', 1))
+    return start, end, field.get('name', ''), bits
+
+
+def _conflicts(entry, start, end, bits):
+    """两个区间重叠时是否冲突：共用同一容器字节且位范围不重叠的位字段不冲突"""
+    if bits is not None and entry[3] is not None and (entry[0], entry[1]) == (start, end):
+        return bits[0] < entry[3][1] and entry[3][0] < bits[1]
+    return True
+
+
+class FieldIntervalIndex:
+    """一个协议/命令定义的字段区间索引
+
+    字段按起始位置保存在有序列表中，并维护到每个位置为止的最大结束位置（前缀最大值）。
+    查询与[start, end]重叠的字段时，先二分找到起始位置不超过end的最后一个字段，再向前扫描，
+    前缀最大结束位置小于start时即可停止；字段互不重叠时一次检查为O(log n)。
+    增删字段时只更新插入位置之后的前缀值，不重建索引；按名称删除时先取出字段的起始位置再二分定位
+    """
+
+    def __init__(self, fields=()):
+        entries = sorted((_field_range(field) for field in fields), key=lambda entry: entry[0])
+        self._starts = [entry[0] for entry in entries]
+        self._entries = entries
+        self._by_name = {entry[2]: entry for entry in entries}  # 字段名 -> 索引项
+        self._max_ends = []
+        self._refresh(0)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _refresh(self, index):
+        """从index开始重新计算前缀最大结束位置"""
+        del self._max_ends[index:]
+        current = self._max_ends[-1] if self._max_ends else -1
+        for entry in self._entries[index:]:
+            current = max(current, entry[1])
+            self._max_ends.append(current)
+
+    def add(self, field):
+        """加入一个字段"""
+        entry = _field_range(field)
+        index = bisect.bisect_right(self._starts, entry[0])
+        self._starts.insert(index, entry[0])
+        self._entries.insert(index, entry)
+        self._by_name[entry[2]] = entry
+        self._refresh(index)
+
+    def remove(self, name):
+        """按名称删除字段，不存在时返回False"""
+        entry = self._by_name.pop(name, None)
+        if entry is None:
+            return False
+        index = bisect.bisect_left(self._starts, entry[0])
+        while self._entries[index] is not entry:
+            index += 1
+        del self._starts[index]
+        del self._entries[index]
+        self._refresh(index)
+        return True
+
+    def overlapping(self, start, end):
+        """与[start, end]重叠的字段，按起始位置倒序
+
+        返回:
+            list: (起始, 结束, 名称, 位范围)
+        """
+        hits = []
+        index = bisect.bisect_right(self._starts, end) - 1
+        while index >= 0 and self._max_ends[index] >= start:
+            entry = self._entries[index]
+            if entry[1] >= start:
+                hits.append(entry)
+            index -= 1
+        return hits
+
+    def check(self, field, frame_length=None, exclude=None):
+        """检查字段能否加入定义：位置是否有效、是否超出报文长度、是否与已有字段重叠
+
+        参数:
+            field (dict): 字段定义
+            frame_length (int): 报文长度，None表示不检查
+            exclude (str): 不参与重叠检查的字段名（编辑已有字段时为原字段名）
+
+        返回:
+            list: 错误信息，没有错误时为空列表
+        """
+        start, end, name, bits = _field_range(field)
+        if not isinstance(start, int) or not isinstance(end, int) or start < 0 or end < start:
+            return [f"字段 {name} 位置无效: {start}-{end}"]
+        errors = []
+        if frame_length is not None and end >= frame_length:
+            errors.append(f"字段 {name} 结束位置 {end} 超出报文长度 {frame_length}")
+        for entry in reversed(self.overlapping(start, end)):
+            if entry[2] in (exclude, name) or not _conflicts(entry, start, end, bits):
+                continue
+            errors.append(f"字段 {name} ({start}-{end}) 与字段 {entry[2]} ({entry[0]}-{entry[1]}) 重叠")
+        return errors
+
+    def coverage(self, length, start=0):
+        """字节覆盖图：[start, length) 内已定义和未定义的连续字节区间
+
+        返回:
+            list: (起始, 结束, 是否已定义)，结束位置包含在区间内
+        """
+        runs = []
+        position = start
+        run_start = run_end = None
+        for entry in self._entries[bisect.bisect_left(self._max_ends, start):]:
+            entry_start, entry_end = max(entry[0], start), min(entry[1], length - 1)
+            if entry_start >= length:
+                break
+            if entry_end < entry_start:
+                continue
+            if run_end is not None and entry_start <= run_end + 1:
+                run_end = max(run_end, entry_end)
+                continue
+            if run_end is not None:
+                runs.append((run_start, run_end, True))
+                position = run_end + 1
+            if entry_start > position:
+                runs.append((position, entry_start - 1, False))
+            run_start, run_end = entry_start, entry_end
+        if run_end is not None:
+            runs.append((run_start, run_end, True))
+            position = run_end + 1
+        if position < length:
+            runs.append((position, length - 1, False))
+        return runs
+
+    def first_start(self):
+        """第一个字段的起始位置，没有字段时为None"""
+        return self._starts[0] if self._starts else None
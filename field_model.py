@@ -0,0 +1,330 @@
+# field_model.py - 字段定义与解析结果的紧凑数据模型
+import struct
+from array import array
+
+
+_MISSING = object()  # 标记字段定义中不存在的键
+
+
+class FieldDef:
+    """字段定义，使用__slots__代替字典保存常用属性
+
+    为了兼容原有基于字典的代码，支持 get / [] / in / keys / items 等字典操作；
+    文件中没有的键保持缺省（get返回默认值），未知的键保存在extra中，序列化时原样写回
+    """
+    __slots__ = ('name', 'type', 'start_pos', 'end_pos', 'endian', 'description', 'extra', '_layout', '_bits')
+
+    KEYS = ('name', 'type', 'start_pos', 'end_pos', 'endian', 'description')
+
+    def __init__(self, name=_MISSING, type=_MISSING, start_pos=_MISSING, end_pos=_MISSING,
+                 endian=_MISSING, description=_MISSING, extra=None):
+        self.name = name
+        self.type = type
+        self.start_pos = start_pos
+        self.end_pos = end_pos
+        self.endian = endian
+        self.description = description
+        self.extra = extra  # 其他键值（如length），没有时为None以节省内存
+        self._layout = None  # 批量解析用的预编译布局
+        self._bits = None    # 位字段的预编译移位/掩码
+
+    @classmethod
+    def from_dict(cls, data):
+        """从字典创建字段定义，已经是FieldDef时直接返回"""
+        if isinstance(data, FieldDef):
+            return data
+        extra = {key: value for key, value in data.items() if key not in cls.KEYS}
+        return cls(*(data.get(key, _MISSING) for key in cls.KEYS), extra=extra or None)
+
+    def to_dict(self):
+        """转换为字典，用于写入JSON文件"""
+        result = {}
+        for key in self.KEYS:
+            value = getattr(self, key)
+            if value is not _MISSING:
+                result[key] = value
+        if self.extra:
+            result.update(self.extra)
+        return result
+
+    def keys(self):
+        return self.to_dict().keys()
+
+    def items(self):
+        return self.to_dict().items()
+
+    def values(self):
+        return self.to_dict().values()
+
+    def copy(self):
+        return FieldDef.from_dict(self.to_dict())
+
+    def get(self, key, default=None):
+        if key in self.KEYS:
+            value = getattr(self, key)
+            return default if value is _MISSING else value
+        if self.extra:
+            return self.extra.get(key, default)
+        return default
+
+    def __getitem__(self, key):
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key, value):
+        if key in self.KEYS:
+            setattr(self, key, value)
+        else:
+            if self.extra is None:
+                self.extra = {}
+            self.extra[key] = value
+        self._layout = None
+        self._bits = None
+
+    def __contains__(self, key):
+        return self.get(key, _MISSING) is not _MISSING
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self.keys())
+
+    def __eq__(self, other):
+        if isinstance(other, (FieldDef, dict)):
+            return self.to_dict() == dict(other.items())
+        return NotImplemented
+
+    __hash__ = None
+
+    def __getstate__(self):
+        return self.to_dict()
+
+    def __setstate__(self, state):
+        field = FieldDef.from_dict(state)
+        for slot in self.__slots__:
+            setattr(self, slot, getattr(field, slot))
+
+    def __repr__(self):
+        return f"FieldDef({self.to_dict()!r})"
+
+    def get_layout(self):
+        """获取批量解析用的布局: (起始字节, 结束字节, struct格式或None)
+
+        整数和浮点类型在长度匹配时使用struct直接解包，其他类型返回None
+        """
+        if self._layout is None:
+            start = self.get('start_pos', 0)
+            end = self.get('end_pos', 0) + 1
+            base_type = self.get('type', 'u8').split('.')[0]
+            fmt = _STRUCT_FORMATS.get(base_type)
+            if fmt and struct.calcsize(fmt[1]) != end - start:
+                fmt = None
+            if fmt:
+                byte_order = '<' if self.get('endian', 'big') == 'little' else '>'
+                if fmt[0] == 'd':
+                    # 与_convert_field_value保持一致：浮点数按字节逆序后以本机序解包，结果等同大端
+                    byte_order = '>'
+                fmt = (fmt[0], struct.Struct(byte_order + fmt[1]))
+            self._layout = (start, end, fmt)
+        return self._layout
+
+    def is_bit_field(self):
+        return self.get('type', 'u8').split('.')[0] == BIT_FIELD_TYPE
+
+    def get_bit_layout(self):
+        """获取位字段的解析布局: (起始字节, 结束字节, 移位, 掩码, 容器struct或None, 字节序)
+
+        start_pos..end_pos 为容纳该位字段的字节（容器），按字段字节序读成整数后
+        右移bit_offset位再与掩码相与；bit_offset从容器整数的最低位算起。
+        容器为1/2/4/8字节时用struct解包，其他长度用int.from_bytes
+
+        异常:
+            ValueError: 位偏移或位宽无效、超出容器
+        """
+        if self._bits is None:
+            start = self.get('start_pos', 0)
+            end = self.get('end_pos', 0) + 1
+            bit_offset = self.get('bit_offset', 0)
+            bit_width = self.get('bit_width', 1)
+            if (not isinstance(bit_offset, int) or not isinstance(bit_width, int)
+                    or bit_offset < 0 or bit_width < 1 or bit_offset + bit_width > (end - start) * 8):
+                raise ValueError(f"字段 {self.get('name', '')} 的位范围无效: "
+                                 f"偏移 {bit_offset}，位宽 {bit_width}，容器 {end - start} 字节")
+            byteorder = 'little' if self.get('endian', 'big') == 'little' else 'big'
+            code = _CONTAINER_CODES.get(end - start)
+            container = struct.Struct(('<' if byteorder == 'little' else '>') + code) if code else None
+            self._bits = (start, end, bit_offset, (1 << bit_width) - 1, container, byteorder)
+        return self._bits
+
+    def decode_bits(self, data):
+        """从容器字节（只含start_pos..end_pos）中取出位字段的值"""
+        _, _, shift, mask, _, byteorder = self.get_bit_layout()
+        return (int.from_bytes(data, byteorder) >> shift) & mask
+
+
+BIT_FIELD_TYPE = 'bits'
+
+# 位字段容器字节数 -> struct格式
+_CONTAINER_CODES = {1: 'B', 2: 'H', 4: 'I', 8: 'Q'}
+
+# 类型 -> (array类型码, struct格式)
+_STRUCT_FORMATS = {
+    'u8': ('B', 'B'), 'BYTE': ('B', 'B'), 'i8': ('b', 'b'),
+    'u16': ('H', 'H'), 'WORD': ('H', 'H'), 'i16': ('h', 'h'),
+    'u32': ('L', 'I'), 'DWORD': ('L', 'I'), 'i32': ('l', 'i'),
+    'u64': ('Q', 'Q'), 'QWORD': ('Q', 'Q'), 'i64': ('q', 'q'),
+    'float': ('d', 'f'), 'double': ('d', 'd'),
+}
+
+
+class DecodedField:
+    """单个字段的解析结果
+
+    只保存值和原始16进制，其余属性引用字段定义，避免每帧每字段复制一份
+    """
+    __slots__ = ('definition', 'value', 'hex')
+
+    KEYS = ('name', 'type', 'value', 'hex', 'description', 'start_pos', 'end_pos')
+
+    def __init__(self, definition, value, hex_data):
+        self.definition = definition
+        self.value = value
+        self.hex = hex_data
+
+    @property
+    def name(self):
+        return self.definition.get('name', '')
+
+    @property
+    def type(self):
+        return self.definition.get('type', 'u8')
+
+    @property
+    def description(self):
+        return self.definition.get('description', '')
+
+    @property
+    def start_pos(self):
+        return self.definition.get('start_pos', 0)
+
+    @property
+    def end_pos(self):
+        return self.definition.get('end_pos', 0)
+
+    def get(self, key, default=None):
+        if key in self.KEYS:
+            return getattr(self, key)
+        return default
+
+    def __getitem__(self, key):
+        if key in self.KEYS:
+            return getattr(self, key)
+        raise KeyError(key)
+
+    def __contains__(self, key):
+        return key in self.KEYS
+
+    def keys(self):
+        return iter(self.KEYS)
+
+    def items(self):
+        return ((key, getattr(self, key)) for key in self.KEYS)
+
+    def __iter__(self):
+        return iter(self.KEYS)
+
+    def __len__(self):
+        return len(self.KEYS)
+
+    def to_dict(self):
+        return {key: getattr(self, key) for key in self.KEYS}
+
+    def __repr__(self):
+        return f"DecodedField({self.name!r}, {self.value!r})"
+
+
+class PlacedField(DecodedField):
+    """位置由解析过程确定的字段结果（变长字段之后的字段、重复记录中的字段）
+
+    start_pos/end_pos为在本帧中的实际位置，name可以覆盖（如 records[0].id）；
+    重复记录组的records保存每条记录的字段结果
+    """
+    __slots__ = ('_start', '_end', '_name', 'records')
+
+    def __init__(self, definition, value, hex_data, start_pos, end_pos, name=None, records=None):
+        super().__init__(definition, value, hex_data)
+        self._start = start_pos
+        self._end = end_pos
+        self._name = name
+        self.records = records
+
+    @property
+    def name(self):
+        return self._name if self._name is not None else self.definition.get('name', '')
+
+    @property
+    def start_pos(self):
+        return self._start
+
+    @property
+    def end_pos(self):
+        return self._end
+
+
+class DecodedBatch:
+    """一批帧的解析结果，按字段列存储
+
+    数值字段保存在array.array中，其他类型保存在列表中
+    """
+
+    def __init__(self, protocol, fields, frame_count=0):
+        self.protocol = protocol
+        self.fields = fields          # FieldDef列表
+        self.frame_count = frame_count
+        self.columns = {}             # 字段名 -> array / list
+        self.valid = array('B')       # 每帧是否长度足够完成解析
+
+    def __len__(self):
+        return self.frame_count
+
+    def column(self, field_name):
+        """获取一个字段所有帧的值"""
+        return self.columns.get(field_name)
+
+    def row(self, index):
+        """获取第index帧的解析结果，与parse_protocol_data的fields格式一致"""
+        return [DecodedField(field, self.columns[field.get('name', '')][index], None)
+                for field in self.fields]
+
+    def to_dict(self):
+        return {
+            'protocol_name': self.protocol.get('name', '') if self.protocol else '',
+            'frame_count': self.frame_count,
+            'columns': {name: list(values) for name, values in self.columns.items()}
+        }
+
+
+def normalize_fields(definition):
+    """将协议/命令定义（包括各分支布局）中的字段字典转换为FieldDef，返回定义本身"""
+    if isinstance(definition, dict):
+        fields = definition.get('fields')
+        if isinstance(fields, list):
+            definition['fields'] = [FieldDef.from_dict(field) if isinstance(field, dict) else field
+                                    for field in fields]
+        variants = definition.get('variants')
+        if isinstance(variants, dict):
+            for variant in variants.values():
+                normalize_fields(variant)
+    return definition
+
+
+def json_default(obj):
+    """json.dump的default回调，在文件边界将字段对象转换为字典"""
+    if isinstance(obj, (FieldDef, DecodedField, DecodedBatch)):
+        return obj.to_dict()
+    if isinstance(obj, array):
+        return obj.tolist()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
@@ -0,0 +1,318 @@
+# field_plot.py - 字段时序曲线模块
+import tkinter as tk
+from tkinter import ttk
+from array import array
+from datetime import datetime
+
+from frame_log import STATUS_UNMATCHED
+
+
+def _load_numpy():
+    """numpy可选，没有安装时使用纯Python实现"""
+    try:
+        import numpy
+        return numpy
+    except ImportError:
+        return None
+
+
+def _to_number(value):
+    """把解析值转换为浮点数，无法转换时返回None"""
+    if isinstance(value, (int, float)):
+        return float(value)
+    if isinstance(value, str):
+        text = value.strip()
+        try:
+            if text.lower().startswith('0x'):
+                return float(int(text, 16))
+            return float(text)
+        except ValueError:
+            return None
+    return None
+
+
+def load_field_series(protocol_manager, definition, field, frame_log=None, column_store=None):
+    """读取一个字段在历史报文中的全部值
+
+    优先读取列存储中的整列；否则从报文记录中取出该命令的报文，
+    只按这一个字段批量解析
+
+    参数:
+        protocol_manager: ProtocolManager
+        definition (dict): 当前协议/命令定义
+        field (dict): 字段定义
+        frame_log: FrameLog报文记录
+        column_store: ColumnStore列存储
+
+    返回:
+        tuple: (values, timestamps)，values为array('d')，timestamps为纳秒时间戳列表，
+               来自列存储时为None
+    """
+    command_key = protocol_manager.get_frame_log_key(definition)
+    field_name = field.get('name', '')
+
+    # 列存储只包含完整解析的帧，报文记录中有更多该命令的报文时改为从报文记录读取
+    if column_store is not None:
+        values = column_store.read_column(command_key, field_name)
+        logged = frame_log.command_keys().get(command_key, 0) if frame_log is not None else 0
+        if values and len(values) >= logged:
+            return values, None
+
+    values = array('d')
+    timestamps = []
+    if frame_log is None:
+        return values, timestamps
+    records = [record for record in frame_log.query(command_key) if record.status != STATUS_UNMATCHED]
+    if not records:
+        return values, timestamps
+
+    batch = protocol_manager.decode_batch([record.data for record in records],
+                                          {'name': definition.get('name', ''), 'fields': [field]})
+    column = batch.column(field_name) if batch else None
+    if column is None:
+        return values, timestamps
+    for record, is_valid, value in zip(records, batch.valid, column):
+        number = _to_number(value) if is_valid else None
+        if number is not None:
+            values.append(number)
+            timestamps.append(record.timestamp)
+    return values, timestamps
+
+
+class MinMaxPyramid:
+    """按2的幂逐级合并的最小/最大值金字塔
+
+    第k级的每个桶覆盖原始数据中连续的2^k个点，重绘时选用每像素不超过两个桶的层级，
+    因此绘制开销只与画布宽度有关，与帧数无关
+    """
+
+    def __init__(self, values):
+        self.count = len(values)
+        self.levels = [(values, values)]  # 第0级即原始数据
+        numpy = _load_numpy()
+        mins = maxs = values
+        while len(mins) > 1:
+            if numpy is not None:
+                mins, maxs = self._merge_numpy(numpy, mins, maxs)
+            else:
+                mins, maxs = self._merge(mins, maxs)
+            self.levels.append((mins, maxs))
+
+    @staticmethod
+    def _merge(mins, maxs):
+        size = len(mins)
+        merged_mins = array('d', (min(mins[i], mins[i + 1]) for i in range(0, size - 1, 2)))
+        merged_maxs = array('d', (max(maxs[i], maxs[i + 1]) for i in range(0, size - 1, 2)))
+        if size % 2:
+            merged_mins.append(mins[-1])
+            merged_maxs.append(maxs[-1])
+        return merged_mins, merged_maxs
+
+    @staticmethod
+    def _merge_numpy(numpy, mins, maxs):
+        mins = numpy.asarray(mins, dtype='d')
+        maxs = numpy.asarray(maxs, dtype='d')
+        even = len(mins) - len(mins) % 2
+        merged_mins = numpy.minimum(mins[0:even:2], mins[1:even:2])
+        merged_maxs = numpy.maximum(maxs[0:even:2], maxs[1:even:2])
+        if len(mins) % 2:
+            merged_mins = numpy.append(merged_mins, mins[-1])
+            merged_maxs = numpy.append(merged_maxs, maxs[-1])
+        return merged_mins, merged_maxs
+
+    def level_for(self, span, width):
+        """选择每像素不超过两个桶的最细层级"""
+        level = 0
+        while level + 1 < len(self.levels) and span > (width << (level + 1)):
+            level += 1
+        return level
+
+    def envelope(self, start, end, width, level=None):
+        """计算可见范围[start, end)内每个像素列的最小/最大值
+
+        参数:
+            start, end (int): 可见的帧序号范围
+            width (int): 像素列数
+            level (int): 使用的层级，默认按范围和宽度自动选择；
+                         指定更粗的层级可以快速绘制一个近似结果
+
+        返回:
+            list: (像素列, 最小值, 最大值)，跳过没有数据的像素列
+        """
+        start = max(0, start)
+        end = min(self.count, end)
+        if end <= start or width <= 0:
+            return []
+        span = end - start
+        if level is None:
+            level = self.level_for(span, width)
+        mins, maxs = self.levels[level]
+        shift = level
+        result = []
+        for column in range(width):
+            first = start + span * column // width
+            last = start + span * (column + 1) // width
+            if last <= first:
+                continue
+            bucket_first = first >> shift
+            bucket_last = max(bucket_first + 1, (last + (1 << shift) - 1) >> shift)
+            bucket_last = min(bucket_last, len(mins))
+            low = min(mins[bucket_first:bucket_last])
+            high = max(maxs[bucket_first:bucket_last])
+            result.append((column, float(low), float(high)))
+        return result
+
+
+class FieldPlotWindow(tk.Toplevel):
+    """字段时序曲线窗口：滚轮以光标为中心缩放，左键拖动平移"""
+
+    MARGIN = 50               # 纵轴标签留白(像素)
+    REFINE_DELAY = 60         # 粗略绘制后进行精细绘制的延迟(毫秒)
+    COARSE_LEVELS = 2         # 粗略绘制比精细绘制粗的层级数
+    MIN_SPAN = 8              # 最多放大到可见帧数
+
+    def __init__(self, parent, title, values, timestamps=None):
+        """
+        参数:
+            parent: 父窗口
+            title (str): 窗口标题
+            values (array): 字段值
+            timestamps (list): 每个值对应的纳秒时间戳，可为None
+        """
+        super().__init__(parent)
+        self.title(title)
+        self.geometry("900x400")
+        self.transient(parent)
+
+        self.values = values
+        self.timestamps = timestamps
+        self.pyramid = MinMaxPyramid(values)
+        self.view_start = 0
+        self.view_end = len(values)
+        self._refine_job = None
+        self._drag_x = None
+
+        toolbar = ttk.Frame(self, padding=(10, 5))
+        toolbar.pack(fill=tk.X)
+        ttk.Button(toolbar, text="重置", command=self._reset_view).pack(side=tk.LEFT)
+        ttk.Label(toolbar, text=f"共 {len(values)} 帧，滚轮缩放，拖动平移").pack(side=tk.LEFT, padx=10)
+
+        self.canvas = tk.Canvas(self, background="white", highlightthickness=0)
+        self.canvas.pack(fill=tk.BOTH, expand=True)
+
+        self.status_var = tk.StringVar(value="")
+        ttk.Label(self, textvariable=self.status_var, padding=(10, 0, 10, 5)).pack(anchor=tk.W)
+
+        self.canvas.bind("<Configure>", lambda e: self._redraw())
+        self.canvas.bind("<MouseWheel>", self._on_wheel)
+        self.canvas.bind("<Button-4>", lambda e: self._zoom(e.x, 0.5))
+        self.canvas.bind("<Button-5>", lambda e: self._zoom(e.x, 2.0))
+        self.canvas.bind("<ButtonPress-1>", self._on_press)
+        self.canvas.bind("<B1-Motion>", self._on_drag)
+        self.canvas.bind("<ButtonRelease-1>", lambda e: setattr(self, '_drag_x', None))
+        self.canvas.bind("<Motion>", self._on_motion)
+
+    def _plot_width(self):
+        return max(1, self.canvas.winfo_width() - self.MARGIN)
+
+    def _reset_view(self):
+        self.view_start = 0
+        self.view_end = len(self.values)
+        self._redraw()
+
+    def _on_wheel(self, event):
+        self._zoom(event.x, 0.5 if event.delta > 0 else 2.0)
+
+    def _zoom(self, x, factor):
+        """以x处为中心缩放可见范围"""
+        span = self.view_end - self.view_start
+        new_span = min(len(self.values), max(self.MIN_SPAN, int(span * factor)))
+        if new_span == span:
+            return
+        ratio = min(1.0, max(0.0, (x - self.MARGIN) / self._plot_width()))
+        center = self.view_start + span * ratio
+        self._set_view(int(center - new_span * ratio), new_span)
+
+    def _on_press(self, event):
+        self._drag_x = event.x
+
+    def _on_drag(self, event):
+        if self._drag_x is None:
+            return
+        span = self.view_end - self.view_start
+        shift = int((self._drag_x - event.x) * span / self._plot_width())
+        if shift:
+            self._drag_x = event.x
+            self._set_view(self.view_start + shift, span)
+
+    def _set_view(self, start, span):
+        start = max(0, min(start, len(self.values) - span))
+        self.view_start = start
+        self.view_end = start + span
+        self._redraw()
+
+    def _redraw(self):
+        """先用较粗的层级立即绘制，空闲后再用精细层级重绘"""
+        if self._refine_job is not None:
+            self.after_cancel(self._refine_job)
+            self._refine_job = None
+        width = self._plot_width()
+        level = self.pyramid.level_for(self.view_end - self.view_start, width)
+        coarse_level = min(level + self.COARSE_LEVELS, len(self.pyramid.levels) - 1)
+        self._draw(coarse_level)
+        if coarse_level != level:
+            self._refine_job = self.after(self.REFINE_DELAY, lambda: self._draw(level))
+
+    def _draw(self, level):
+        self._refine_job = None
+        canvas = self.canvas
+        canvas.delete("all")
+        width = self._plot_width()
+        height = max(1, canvas.winfo_height() - 20)
+        if not self.values:
+            canvas.create_text(canvas.winfo_width() // 2, height // 2, text="没有数据")
+            return
+
+        envelope = self.pyramid.envelope(self.view_start, self.view_end, width, level)
+        if not envelope:
+            return
+        low = min(item[1] for item in envelope)
+        high = max(item[2] for item in envelope)
+        if high == low:
+            high, low = high + 1, low - 1
+        scale = (height - 10) / (high - low)
+
+        def y_of(value):
+            return 5 + (high - value) * scale
+
+        points = []
+        for column, column_min, column_max in envelope:
+            x = self.MARGIN + column
+            points.extend((x, y_of(column_min), x, y_of(column_max)))
+        if len(points) >= 4:
+            canvas.create_line(*points, fill="#1f77b4")
+
+        # 坐标轴和范围标签
+        canvas.create_line(self.MARGIN, 0, self.MARGIN, height, fill="gray")
+        canvas.create_line(self.MARGIN, height, self.MARGIN + width, height, fill="gray")
+        canvas.create_text(self.MARGIN - 4, 5, text=f"{high:g}", anchor=tk.NE)
+        canvas.create_text(self.MARGIN - 4, height - 5, text=f"{low:g}", anchor=tk.SE)
+        canvas.create_text(self.MARGIN, height + 2, text=self._x_label(self.view_start), anchor=tk.NW)
+        canvas.create_text(self.MARGIN + width, height + 2, text=self._x_label(self.view_end - 1), anchor=tk.NE)
+
+        quality = "精细" if level == self.pyramid.level_for(self.view_end - self.view_start, width) else "粗略"
+        self.status_var.set(f"显示 {self.view_start}-{self.view_end - 1} 帧，层级 {level}（{quality}）")
+
+    def _x_label(self, index):
+        """横轴标签：有时间戳时显示时间，否则显示帧序号"""
+        if self.timestamps and 0 <= index < len(self.timestamps):
+            return datetime.fromtimestamp(self.timestamps[index] / 1e9).strftime("%H:%M:%S.%f")[:-3]
+        return str(index)
+
+    def _on_motion(self, event):
+        if not self.values or event.x < self.MARGIN:
+            return
+        span = self.view_end - self.view_start
+        index = self.view_start + int((event.x - self.MARGIN) * span / self._plot_width())
+        if 0 <= index < len(self.values):
+            self.status_var.set(f"第 {index} 帧 ({self._x_label(index)}): {self.values[index]:g}")
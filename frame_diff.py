@@ -0,0 +1,171 @@
+# frame_diff.py - 多帧报文逐字节对比模块
+from array import array
+
+METRICS = {
+    'variance': "方差",
+    'change': "变化频率",
+    'xor': "与参考帧异或",
+}
+HEAT_LEVELS = 5                    # 热力图颜色级数，0级（无变化）不着色
+HEAT_COLORS = ("#FFF3E0", "#FFD8A8", "#FFB26B", "#FF8A3D", "#F0542B")
+
+_POPCOUNT = bytes(bin(value).count('1') for value in range(256))
+
+
+def _load_numpy():
+    """numpy可选，没有安装时使用纯Python实现"""
+    try:
+        import numpy
+        return numpy
+    except ImportError:
+        return None
+
+
+def _to_bytes(frame):
+    return bytes.fromhex(frame) if isinstance(frame, str) else bytes(frame)
+
+
+def compute_byte_scores(frames, reference, metric='variance'):
+    """计算参考帧每个字节在多帧中的变化程度
+
+    参数:
+        frames (list): 同一命令的多帧数据，16进制字符串或bytes
+        reference (str|bytes): 参考帧，结果与它逐字节对应
+        metric (str): 'variance' 字节值方差（按最大值归一化），
+                      'change' 相邻两帧该字节发生变化的比例，
+                      'xor' 与参考帧异或后不同位所占比例
+
+    返回:
+        list: 每个字节一个0~1之间的分数；没有帧覆盖的字节为0
+    """
+    if metric not in METRICS:
+        raise ValueError(f"不支持的对比方式: {metric}")
+    reference = _to_bytes(reference)
+    frames = [_to_bytes(frame) for frame in frames]
+    if not reference or not frames:
+        return [0.0] * len(reference)
+
+    numpy = _load_numpy()
+    if numpy is not None:
+        scores = _scores_numpy(numpy, frames, reference, metric)
+    else:
+        scores = _scores_python(frames, reference, metric)
+    if metric == 'variance':
+        peak = max(scores, default=0.0)
+        scores = [score / peak for score in scores] if peak > 0 else scores
+    return scores
+
+
+def _scores_numpy(numpy, frames, reference, metric):
+    """把所有帧按参考帧长度截断/补0后堆叠成矩阵，按列计算"""
+    width = len(reference)
+    matrix = numpy.zeros((len(frames), width), dtype=numpy.uint8)
+    lengths = numpy.fromiter((min(len(frame), width) for frame in frames), dtype=numpy.int64,
+                             count=len(frames))
+    for row, frame in enumerate(frames):
+        matrix[row, :lengths[row]] = numpy.frombuffer(frame, dtype=numpy.uint8, count=lengths[row])
+    covered = numpy.arange(width) < lengths[:, None]          # 每帧实际包含的字节
+
+    if metric == 'variance':
+        values = matrix.astype(numpy.float64)
+        count = covered.sum(axis=0)
+        safe_count = numpy.maximum(count, 1)
+        mean = (values * covered).sum(axis=0) / safe_count
+        scores = (((values - mean) ** 2) * covered).sum(axis=0) / safe_count
+    elif metric == 'change':
+        both = covered[1:] & covered[:-1]
+        changed = (matrix[1:] != matrix[:-1]) & both
+        scores = changed.sum(axis=0) / numpy.maximum(both.sum(axis=0), 1)
+    else:
+        ref = numpy.frombuffer(reference, dtype=numpy.uint8)
+        popcount = numpy.frombuffer(_POPCOUNT, dtype=numpy.uint8)
+        bits = popcount[matrix ^ ref] * covered
+        scores = bits.sum(axis=0) / (8.0 * numpy.maximum(covered.sum(axis=0), 1))
+    return [float(score) for score in scores]
+
+
+def _scores_python(frames, reference, metric):
+    width = len(reference)
+    scores = array('d', [0.0]) * width
+    if metric == 'variance':
+        totals = array('d', scores)
+        squares = array('d', scores)
+        counts = array('l', [0] * width)
+        for frame in frames:
+            for position, value in enumerate(frame[:width]):
+                totals[position] += value
+                squares[position] += value * value
+                counts[position] += 1
+        for position in range(width):
+            if counts[position]:
+                mean = totals[position] / counts[position]
+                scores[position] = max(0.0, squares[position] / counts[position] - mean * mean)
+    elif metric == 'change':
+        changes = array('l', [0] * width)
+        pairs = array('l', [0] * width)
+        for previous, frame in zip(frames, frames[1:]):
+            for position in range(min(len(previous), len(frame), width)):
+                pairs[position] += 1
+                if previous[position] != frame[position]:
+                    changes[position] += 1
+        for position in range(width):
+            if pairs[position]:
+                scores[position] = changes[position] / pairs[position]
+    else:
+        bits = array('l', [0] * width)
+        counts = array('l', [0] * width)
+        for frame in frames:
+            for position, value in enumerate(frame[:width]):
+                bits[position] += _POPCOUNT[value ^ reference[position]]
+                counts[position] += 1
+        for position in range(width):
+            if counts[position]:
+                scores[position] = bits[position] / (8.0 * counts[position])
+    return list(scores)
+
+
+def heat_runs(scores, levels=HEAT_LEVELS):
+    """把分数量化为热力等级，并合并为连续区间
+
+    参数:
+        scores (list): 每个字节0~1之间的分数
+        levels (int): 等级数
+
+    返回:
+        list: (起始字节, 结束字节(包含), 等级)，等级从1开始，分数为0的字节不输出
+    """
+    runs = []
+    run_start = run_level = None
+    for position, score in enumerate(scores):
+        level = 0 if score <= 0 else min(levels, int(score * levels) + 1)
+        if level != run_level:
+            if run_level:
+                runs.append((run_start, position - 1, run_level))
+            run_start, run_level = position, level
+    if run_level:
+        runs.append((run_start, len(scores) - 1, run_level))
+    return runs
+
+
+if __name__ == "__main__":
+    import argparse
+    from frame_log import FrameLog
+
+    parser = argparse.ArgumentParser(description="对比报文记录中同一命令的多帧数据")
+    parser.add_argument("command", help="命令键(组/命令ID)或命令ID")
+    parser.add_argument("--log-dir", default="frame_log", help="报文记录目录")
+    parser.add_argument("--metric", choices=sorted(METRICS), default="variance", help="对比方式")
+    parser.add_argument("--limit", type=int, default=None, help="最多使用的帧数")
+    args = parser.parse_args()
+
+    frame_log = FrameLog(args.log_dir)
+    records = frame_log.query(args.command, limit=args.limit)
+    frame_log.close()
+    if not records:
+        print("没有找到报文")
+    else:
+        reference = records[-1].data
+        scores = compute_byte_scores([record.data for record in records], reference, args.metric)
+        print(f"{len(records)} 帧，{METRICS[args.metric]}:")
+        for start, end, level in heat_runs(scores):
+            print(f"  字节 {start}-{end}: 等级 {level}  最大分数 {max(scores[start:end + 1]):.3f}")
@@ -0,0 +1,266 @@
+# frame_encoder.py - 按协议定义生成报文模块
+import struct
+
+from field_model import FieldDef
+from decode_plan import is_dynamic_field
+
+_INTEGER_TYPES = {
+    'u8': False, 'u16': False, 'u32': False, 'u64': False,
+    'BYTE': False, 'WORD': False, 'DWORD': False, 'QWORD': False,
+    'i8': True, 'i16': True, 'i32': True, 'i64': True,
+    'bool': False, 'timestamp': False,
+}
+_RAW_TYPES = ('hex', 'bytes')
+_TEXT_ENCODINGS = {'ascii': 'ascii', 'char.ascii': 'ascii', 'char': 'utf-8', 'utf8': 'utf-8', 'string': 'utf-8'}
+
+
+def _text_type(field_type):
+    """与_convert_field_value一致地取出字符串类型
+
+    只有不带字节数的 char.ascii 按子类型解析，char.ascii.4 等带字节数的类型解析时按char处理
+    """
+    parts = field_type.split('.')
+    if len(parts) == 2 and not parts[1].isdigit():
+        return f"{parts[0]}.{parts[1]}"
+    return parts[0]
+
+
+def _to_raw_bytes(value):
+    """hex/bytes字段的值：bytes或16进制字符串（可带0x前缀和空格）"""
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return bytes(value)
+    text = str(value).replace(' ', '')
+    if text[:2].lower() == '0x':
+        text = text[2:]
+    if len(text) % 2:
+        text = '0' + text
+    return bytes.fromhex(text)
+
+
+def _compile_field(field):
+    """为一个字段生成写入函数 setter(buffer, value)"""
+    start, end, layout = field.get_layout()
+    length = end - start
+    field_type = field.get('type', 'u8')
+    base_type = field_type.split('.')[0]
+    name = field.get('name', '')
+
+    if is_dynamic_field(field):
+        # 变长字段和记录组的位置依赖报文内容，模板只对应样本中的一种布局
+        def set_dynamic(buffer, value):
+            raise ValueError(f"字段 {name} 为变长字段或记录组，不支持编码")
+        return set_dynamic
+
+    if field.is_bit_field():
+        # 位字段：读出容器整数，清除该字段的位后写入新值，同一容器中的其他位保持不变
+        _, _, shift, mask, container, byteorder = field.get_bit_layout()
+        keep = ~(mask << shift)
+
+        def set_bits(buffer, value):
+            try:
+                number = int(value, 0) if isinstance(value, str) else int(value)
+            except (ValueError, TypeError) as e:
+                raise ValueError(f"字段 {name} 的值 {value!r} 不是整数: {e}")
+            if number < 0 or number > mask:
+                raise ValueError(f"字段 {name} 的值 {value!r} 超出 {mask.bit_length()} 位")
+            if container:
+                current = container.unpack_from(buffer, start)[0]
+                container.pack_into(buffer, start, (current & keep) | (number << shift))
+            else:
+                current = int.from_bytes(buffer[start:end], byteorder)
+                buffer[start:end] = ((current & keep) | (number << shift)).to_bytes(length, byteorder)
+        return set_bits
+
+    if layout:
+        # 数值类型：与批量解析使用同一个struct布局，保证编码后能原样解析回来
+        packer = layout[1]
+        is_float = layout[0] == 'd'
+
+        def set_struct(buffer, value):
+            try:
+                if is_float:
+                    value = float(value)
+                elif isinstance(value, str):
+                    value = int(value, 0)
+                packer.pack_into(buffer, start, value)
+            except (struct.error, ValueError, TypeError) as e:
+                raise ValueError(f"字段 {name} 的值 {value!r} 无法按 {field_type} 编码: {e}")
+        return set_struct
+
+    if base_type in _INTEGER_TYPES:
+        # 长度与类型不一致的整数按解析时的规则：只有长度匹配才按小端，否则按大端
+        signed = _INTEGER_TYPES[base_type]
+
+        def set_int(buffer, value):
+            try:
+                number = int(value, 0) if isinstance(value, str) else int(value)
+                buffer[start:end] = number.to_bytes(length, 'big', signed=signed)
+            except (ValueError, OverflowError, TypeError) as e:
+                raise ValueError(f"字段 {name} 的值 {value!r} 超出 {length} 字节: {e}")
+        return set_int
+
+    if base_type in _RAW_TYPES:
+        def set_raw(buffer, value):
+            try:
+                data = _to_raw_bytes(value)
+            except ValueError as e:
+                raise ValueError(f"字段 {name} 的值 {value!r} 不是有效的16进制: {e}")
+            if len(data) > length:
+                raise ValueError(f"字段 {name} 的值超过 {length} 字节")
+            # 不足时高位补0，与按大端整数显示的习惯一致
+            buffer[start:end] = data.rjust(length, b'\0')
+        return set_raw
+
+    text_type = _text_type(field_type)
+    if text_type == 'char' and length <= 4:
+        # 不超过4字节的char解析时显示为十进制数字，编码时数字按大端整数写回
+        def set_short_char(buffer, value):
+            if isinstance(value, int) or (isinstance(value, str) and value.isdigit()):
+                try:
+                    buffer[start:end] = int(value).to_bytes(length, 'big')
+                    return
+                except OverflowError as e:
+                    raise ValueError(f"字段 {name} 的值 {value!r} 超出 {length} 字节: {e}")
+            set_text(buffer, value)
+    else:
+        set_short_char = None
+
+    encoding = _TEXT_ENCODINGS.get(text_type)
+    if encoding is not None:
+        def set_text(buffer, value):
+            data = value if isinstance(value, (bytes, bytearray)) else str(value).encode(encoding)
+            if len(data) > length:
+                raise ValueError(f"字段 {name} 的字符串超过 {length} 字节")
+            buffer[start:end] = bytes(data).ljust(length, b'\0')
+        return set_short_char or set_text
+
+    def set_unsupported(buffer, value):
+        raise ValueError(f"字段 {name} 的类型 {field_type} 不支持编码")
+    return set_unsupported
+
+
+class FrameEncoder:
+    """由一个协议/命令定义编译出的报文编码器
+
+    以报文样本为模板，只覆盖给定的字段，其余字节（报文头、保留字节等）保持模板内容。
+    每个字段的写入函数在创建时生成，编码时只是逐个调用。
+    有分支布局的定义为每个分支的合并定义各生成一组写入函数，编码时先写入选择字段，
+    再按报文中选择字段的值（没有给出时为模板中的值）选用分支，与解析时的分派一致
+    """
+
+    def __init__(self, definition, template, variants=None, decode_selector=None):
+        """
+        参数:
+            definition (dict): 协议/命令定义
+            template (str|bytes): 报文模板（16进制字符串或bytes）
+            variants (VariantTable): 定义有分支布局时的分派表
+            decode_selector (callable): decode_selector(bytes) -> 选择字段的值，与解析时的取值一致，
+                有variants时必须提供
+
+        异常:
+            ValueError: 模板无效或比字段定义短
+        """
+        if isinstance(template, str):
+            template = bytes.fromhex(template.replace(' ', ''))
+        self.name = definition.get('name', '')
+        self.template = bytes(template)
+        self._setters, max_end = self._compile_fields(definition.get('fields', []))
+        if len(self.template) < max_end:
+            raise ValueError(f"报文模板长度 {len(self.template)} 小于字段定义需要的 {max_end} 字节")
+        self.field_names = list(self._setters)
+
+        self._variants = variants
+        self._decode_selector = decode_selector
+        self._variant_setters = {}  # id(分支合并定义) -> 写入函数字典，模板放不下该分支时为错误消息
+        self._selector_end = variants.selector.get('end_pos', 0) + 1 if variants is not None else 0
+        if variants is not None:
+            if decode_selector is None:
+                raise ValueError(f"{self.name} 有分支布局，需要提供选择字段的解析函数")
+            for merged in variants.definitions():
+                setters, max_end = self._compile_fields(merged['fields'])
+                if len(self.template) < max_end:
+                    setters = f"报文模板长度 {len(self.template)} 小于分支 {merged['variant']} 需要的 {max_end} 字节"
+                else:
+                    self.field_names.extend(name for name in setters if name not in self._setters)
+                self._variant_setters[id(merged)] = setters
+            self.field_names = list(dict.fromkeys(self.field_names))
+
+    @staticmethod
+    def _compile_fields(fields):
+        """生成 (字段名 -> 写入函数, 字段需要的模板长度)"""
+        setters = {}
+        max_end = 0
+        for field in fields:
+            field = FieldDef.from_dict(field)
+            setters[field.get('name', '')] = _compile_field(field)
+            max_end = max(max_end, field.get_layout()[1])
+        return setters, max_end
+
+    def _select_setters(self, buffer, values):
+        """写入选择字段，再按缓冲区中选择字段的值取分支的写入函数
+
+        返回:
+            tuple: (写入函数字典, 分支名)，没有匹配的分支时为公共字段的写入函数
+        """
+        selector_name = self._variants.selector_name
+        if selector_name in values:
+            self._setters[selector_name](buffer, values[selector_name])
+        merged = self._variants.select(self._decode_selector(bytes(buffer[:self._selector_end])))
+        if merged is None:
+            return self._setters, None
+        setters = self._variant_setters[id(merged)]
+        if isinstance(setters, str):
+            raise ValueError(setters)
+        return setters, merged['variant']
+
+    def encode_into(self, buffer, values):
+        """把字段值写入已有的缓冲区（长度与模板相同）"""
+        if self._variants is not None:
+            setters, variant = self._select_setters(buffer, values)
+        else:
+            setters, variant = self._setters, None
+        for name, value in values.items():
+            setter = setters.get(name)
+            if setter is None:
+                if variant is not None:
+                    raise ValueError(f"{self.name} 的分支 {variant} 中没有字段 {name}")
+                raise ValueError(f"{self.name} 中没有字段 {name}")
+            setter(buffer, value)
+        return buffer
+
+    def encode(self, values):
+        """生成一帧
+
+        参数:
+            values (dict): 字段名 -> 值，没有给出的字段保持模板中的内容
+
+        返回:
+            bytes: 报文
+        """
+        return bytes(self.encode_into(bytearray(self.template), values))
+
+    def encode_many(self, rows):
+        """按顺序生成多帧，rows为字段值字典的可迭代对象"""
+        buffer = bytearray(self.template)
+        template = self.template
+        frames = []
+        for values in rows:
+            buffer[:] = template
+            frames.append(bytes(self.encode_into(buffer, values)))
+        return frames
+
+
+if __name__ == "__main__":
+    import argparse
+    import json
+    from protocol_manager import ProtocolManager
+
+    parser = argparse.ArgumentParser(description="按协议定义生成报文")
+    parser.add_argument("protocol_key", help="协议/命令键，如 livewire/DB")
+    parser.add_argument("values", nargs="?", default="{}", help='字段值JSON，如 \'{"目标扭矩": 12.5}\'')
+    parser.add_argument("--data-dir", default="protocols", help="协议目录")
+    args = parser.parse_args()
+
+    manager = ProtocolManager(args.data_dir)
+    success, result = manager.encode_frame(args.protocol_key, json.loads(args.values))
+    print(result)
@@ -0,0 +1,377 @@
+# frame_log.py - 报文记录模块
+import os
+import mmap
+import time
+import heapq
+import struct
+import bisect
+import threading
+from collections import namedtuple
+from datetime import datetime
+from urllib.parse import quote, unquote
+
+
+# 解码状态
+STATUS_UNMATCHED = 0  # 没有匹配的协议/命令
+STATUS_DECODED = 1    # 所有字段解析成功
+STATUS_PARTIAL = 2    # 匹配到定义但部分字段未能解析（报文长度不足等）
+
+STATUS_NAMES = {
+    STATUS_UNMATCHED: "未匹配",
+    STATUS_DECODED: "已解析",
+    STATUS_PARTIAL: "部分解析",
+}
+
+UNMATCHED_GROUP = "_unmatched"
+
+# 记录头: 记录总长度, 时间戳(纳秒), 解码状态, 命令键长度；之后是命令键(utf-8)和报文字节
+RECORD_HEADER = struct.Struct('<IqBH')
+# 索引项: 时间戳(纳秒), 记录在日志中的偏移
+INDEX_ENTRY = struct.Struct('<qQ')
+
+ALL_INDEX = "all"
+
+
+class FrameRecord(namedtuple('FrameRecord', 'timestamp command_key status data offset')):
+    """一条报文记录，timestamp为纳秒时间戳，data为报文字节"""
+    __slots__ = ()
+
+    @property
+    def hex(self):
+        return self.data.hex().upper()
+
+    @property
+    def time(self):
+        return datetime.fromtimestamp(self.timestamp / 1e9)
+
+    @property
+    def status_name(self):
+        return STATUS_NAMES.get(self.status, str(self.status))
+
+
+class _IndexTimestamps:
+    """把映射到内存的索引文件当作时间戳序列，供bisect二分查找"""
+
+    def __init__(self, buffer):
+        self.buffer = buffer
+
+    def __len__(self):
+        return len(self.buffer) // INDEX_ENTRY.size
+
+    def __getitem__(self, i):
+        return INDEX_ENTRY.unpack_from(self.buffer, i * INDEX_ENTRY.size)[0]
+
+
+class FrameLog:
+    """只追加的报文记录
+
+    所有报文按长度前缀写入 frames.log，同时在 index/ 下为每个命令键(组/命令ID)
+    和全部报文各维护一个按时间排序的索引文件，查询某个命令在某段时间内的报文时
+    只需在索引中二分查找，再通过内存映射读取对应记录
+    """
+
+    def __init__(self, log_dir="frame_log"):
+        self.log_dir = str(log_dir)
+        self.index_dir = os.path.join(self.log_dir, "index")
+        os.makedirs(self.index_dir, exist_ok=True)
+        self.log_path = os.path.join(self.log_dir, "frames.log")
+        self._lock = threading.Lock()
+        self._index_files = {}  # 命令键 -> 追加写入的索引文件
+        self._recover()
+        self._log = open(self.log_path, 'ab')
+        # 索引按时间二分查找，写入的时间戳不能比上一条小
+        last_entry = self._last_index_entry(ALL_INDEX)
+        self._last_timestamp = last_entry[0] if last_entry else 0
+
+    @staticmethod
+    def make_command_key(group, command_id):
+        """组合命令键，如 livewire/DB"""
+        return f"{group}/{command_id.upper()}"
+
+    def _index_path(self, command_key):
+        return os.path.join(self.index_dir, quote(command_key, safe='') + ".idx")
+
+    # ---------- 写入 ----------
+
+    def append(self, data, command_key, status, timestamp=None):
+        """追加一条报文记录
+
+        参数:
+            data (bytes): 报文字节
+            command_key (str): 命令键，如 livewire/DB
+            status (int): 解码状态 STATUS_*
+            timestamp (int): 纳秒时间戳，默认为当前时间；比上一条记录小时按上一条记录的时间写入
+
+        返回:
+            int: 记录在日志中的偏移
+        """
+        key_bytes = command_key.encode('utf-8')
+        with self._lock:
+            # 在锁内取时间，多个线程并发写入时索引中的时间戳仍然有序
+            if timestamp is None:
+                timestamp = time.time_ns()
+            timestamp = max(timestamp, self._last_timestamp)
+            self._last_timestamp = timestamp
+            header = RECORD_HEADER.pack(RECORD_HEADER.size + len(key_bytes) + len(data),
+                                        timestamp, status, len(key_bytes))
+            offset = self._log.tell()
+            self._log.write(header + key_bytes + data)
+            self._log.flush()
+            # 先写日志再写索引，异常退出时最多丢失索引，打开时可以补建
+            entry = INDEX_ENTRY.pack(timestamp, offset)
+            for entry_key in (ALL_INDEX, command_key):
+                self._index_file(entry_key).write(entry)
+                self._index_files[entry_key].flush()
+        return offset
+
+    def _index_file(self, command_key):
+        index_file = self._index_files.get(command_key)
+        if index_file is None:
+            index_file = open(self._index_path(command_key), 'ab')
+            self._index_files[command_key] = index_file
+        return index_file
+
+    def close(self):
+        """关闭日志和索引文件"""
+        with self._lock:
+            self._log.close()
+            for index_file in self._index_files.values():
+                index_file.close()
+            self._index_files = {}
+
+    # ---------- 恢复 ----------
+
+    def _recover(self):
+        """打开时检查日志尾部：截掉不完整的记录，为未写入索引的记录补建索引"""
+        if not os.path.exists(self.log_path):
+            return
+        log_size = os.path.getsize(self.log_path)
+        # 截掉不完整的索引项
+        for name in os.listdir(self.index_dir):
+            path = os.path.join(self.index_dir, name)
+            index_size = os.path.getsize(path)
+            if name.endswith(".idx") and index_size % INDEX_ENTRY.size:
+                os.truncate(path, index_size - index_size % INDEX_ENTRY.size)
+
+        indexed_end = 0
+        all_path = self._index_path(ALL_INDEX)
+        if os.path.exists(all_path):
+            index_size = os.path.getsize(all_path)
+            if index_size:
+                with open(all_path, 'rb') as f:
+                    f.seek(index_size - INDEX_ENTRY.size)
+                    last_offset = INDEX_ENTRY.unpack(f.read(INDEX_ENTRY.size))[1]
+                with open(self.log_path, 'rb') as f:
+                    f.seek(last_offset)
+                    length = RECORD_HEADER.unpack(f.read(RECORD_HEADER.size))[0]
+                indexed_end = last_offset + length
+        else:
+            # 没有总索引时全部重建，避免命令索引中出现重复项
+            for name in os.listdir(self.index_dir):
+                if name.endswith(".idx"):
+                    os.remove(os.path.join(self.index_dir, name))
+        if indexed_end < log_size:
+            count = self._index_records(indexed_end, log_size)
+            if count:
+                print(f"报文记录: 为 {count} 条未索引的记录补建索引")
+
+    def _index_records(self, start, log_size):
+        """扫描日志中从start开始的记录并写入索引，返回补建的记录数"""
+        count = 0
+        offset = start
+        last_offsets = {}  # 命令键 -> 索引中最后一条记录的偏移，已有的索引项不重复写入
+        with open(self.log_path, 'rb') as f:
+            f.seek(offset)
+            while offset + RECORD_HEADER.size <= log_size:
+                length, timestamp, status, key_length = RECORD_HEADER.unpack(f.read(RECORD_HEADER.size))
+                if length < RECORD_HEADER.size + key_length or offset + length > log_size:
+                    break
+                command_key = f.read(key_length).decode('utf-8')
+                f.seek(offset + length)
+                entry = INDEX_ENTRY.pack(timestamp, offset)
+                for entry_key in (ALL_INDEX, command_key):
+                    if entry_key not in last_offsets:
+                        last_offsets[entry_key] = self._last_indexed_offset(entry_key)
+                    if last_offsets[entry_key] >= offset:
+                        continue
+                    with open(self._index_path(entry_key), 'ab') as index_file:
+                        index_file.write(entry)
+                    last_offsets[entry_key] = offset
+                offset += length
+                count += 1
+        if offset < log_size:
+            # 最后一条记录没有写完
+            print(f"报文记录: 截掉日志尾部不完整的 {log_size - offset} 字节")
+            os.truncate(self.log_path, offset)
+        return count
+
+    def _last_indexed_offset(self, command_key):
+        """索引文件中最后一条记录的偏移，没有索引时为-1"""
+        last_entry = self._last_index_entry(command_key)
+        return last_entry[1] if last_entry else -1
+
+    def _last_index_entry(self, command_key):
+        """索引文件中最后一项 (时间戳, 偏移)，没有索引时为None"""
+        path = self._index_path(command_key)
+        if not os.path.exists(path):
+            return None
+        index_size = os.path.getsize(path) - os.path.getsize(path) % INDEX_ENTRY.size
+        if not index_size:
+            return None
+        with open(path, 'rb') as f:
+            f.seek(index_size - INDEX_ENTRY.size)
+            return INDEX_ENTRY.unpack(f.read(INDEX_ENTRY.size))
+
+    def rebuild_index(self):
+        """删除并重新建立全部索引"""
+        with self._lock:
+            for index_file in self._index_files.values():
+                index_file.close()
+            self._index_files = {}
+            for name in os.listdir(self.index_dir):
+                if name.endswith(".idx"):
+                    os.remove(os.path.join(self.index_dir, name))
+            self._log.flush()
+            return self._index_records(0, os.path.getsize(self.log_path))
+
+    # ---------- 查询 ----------
+
+    def command_keys(self):
+        """获取所有命令键及其记录数
+
+        返回:
+            dict: 命令键 -> 记录数
+        """
+        result = {}
+        for name in sorted(os.listdir(self.index_dir)):
+            if not name.endswith(".idx"):
+                continue
+            command_key = unquote(name[:-4])
+            if command_key != ALL_INDEX:
+                result[command_key] = os.path.getsize(os.path.join(self.index_dir, name)) // INDEX_ENTRY.size
+        return result
+
+    def resolve_command_keys(self, command):
+        """把查询条件转换为命令键列表
+
+        "livewire/DB" 精确匹配；只给出命令ID（如 "DB"）时匹配所有组中的该命令
+        """
+        if not command:
+            return [ALL_INDEX]
+        if '/' in command:
+            group, command_id = command.rsplit('/', 1)
+            return [self.make_command_key(group, command_id)]
+        suffix = "/" + command.upper()
+        return [key for key in self.command_keys() if key.endswith(suffix)]
+
+    def query(self, command=None, start=None, end=None, limit=None, last=None):
+        """按命令和时间范围查询报文
+
+        参数:
+            command (str): 命令键(组/命令ID)或命令ID，为None时查询全部报文
+            start, end (datetime|int): 时间范围[start, end)，可以是datetime或纳秒时间戳
+            limit (int): 最多返回的记录数
+            last (int): 只返回时间范围内最后的若干条记录，只读取索引末尾的对应项
+
+        返回:
+            list: 按时间排序的FrameRecord
+        """
+        start_ns = self._to_ns(start, 0)
+        end_ns = self._to_ns(end, 2 ** 63 - 1)
+        with self._lock:
+            self._log.flush()
+        if not os.path.exists(self.log_path) or os.path.getsize(self.log_path) == 0:
+            return []
+
+        with open(self.log_path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as log_map:
+            streams = [self._iter_index(key, start_ns, end_ns, last) for key in self.resolve_command_keys(command)]
+            entries = heapq.merge(*streams)
+            if last is not None:
+                # 每个索引各取最后last项，合并后再取最后last项
+                entries = list(entries)[-last:] if last > 0 else []
+            records = []
+            for timestamp, offset in entries:
+                if offset + RECORD_HEADER.size > len(log_map):
+                    break
+                records.append(self._read_record(log_map, offset))
+                if limit is not None and len(records) >= limit:
+                    break
+            return records
+
+    def _iter_index(self, command_key, start_ns, end_ns, last=None):
+        """在索引中二分查找时间范围，逐个产出 (时间戳, 偏移)；给出last时只产出范围内最后last项"""
+        path = self._index_path(command_key)
+        if not os.path.exists(path) or os.path.getsize(path) < INDEX_ENTRY.size:
+            return
+        with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as index_map:
+            timestamps = _IndexTimestamps(index_map)
+            first = bisect.bisect_left(timestamps, start_ns)
+            stop = bisect.bisect_left(timestamps, end_ns)
+            if last is not None:
+                first = max(first, stop - last)
+            for i in range(first, stop):
+                yield INDEX_ENTRY.unpack_from(index_map, i * INDEX_ENTRY.size)
+
+    def _read_record(self, log_map, offset):
+        length, timestamp, status, key_length = RECORD_HEADER.unpack_from(log_map, offset)
+        key_start = offset + RECORD_HEADER.size
+        command_key = log_map[key_start:key_start + key_length].decode('utf-8')
+        data = log_map[key_start + key_length:offset + length]
+        return FrameRecord(timestamp, command_key, status, data, offset)
+
+    @staticmethod
+    def _to_ns(value, default):
+        if value is None:
+            return default
+        if isinstance(value, datetime):
+            return int(value.timestamp() * 1e9)
+        return int(value)
+
+
+def parse_time(text):
+    """解析命令行/界面输入的时间，支持 2025-04-01 和 2025-04-01 10:30:00"""
+    text = text.strip()
+    if not text:
+        return None
+    return datetime.fromisoformat(text)
+
+
+def format_record(record, max_bytes=32):
+    """格式化一条记录用于显示"""
+    hex_data = record.hex
+    if max_bytes is not None and len(record.data) > max_bytes:
+        hex_data = hex_data[:max_bytes * 2] + "..."
+    return (f"{record.time:%Y-%m-%d %H:%M:%S.%f}"[:-3] +
+            f"  {record.command_key:<20} {record.status_name:<6} {len(record.data):>5}B  {hex_data}")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="查询报文记录")
+    parser.add_argument("--dir", default="frame_log", help="报文记录目录")
+    subparsers = parser.add_subparsers(dest="action", required=True)
+    subparsers.add_parser("list", help="列出所有命令及记录数")
+    query_parser = subparsers.add_parser("query", help="按命令和时间查询报文")
+    query_parser.add_argument("--command", help="命令键(组/命令ID)或命令ID，如 livewire/DB 或 DB")
+    query_parser.add_argument("--since", default="", help="开始时间，如 2025-04-01 或 '2025-04-01 10:00:00'")
+    query_parser.add_argument("--until", default="", help="结束时间（不包含）")
+    query_parser.add_argument("--limit", type=int, default=None, help="最多显示的记录数")
+    query_parser.add_argument("--full", action="store_true", help="显示完整报文")
+    subparsers.add_parser("reindex", help="重新建立索引")
+    args = parser.parse_args()
+
+    frame_log = FrameLog(args.dir)
+    try:
+        if args.action == "list":
+            for command_key, count in frame_log.command_keys().items():
+                print(f"{command_key:<24} {count}")
+        elif args.action == "query":
+            records = frame_log.query(args.command, parse_time(args.since), parse_time(args.until), args.limit)
+            for record in records:
+                print(format_record(record, max_bytes=None if args.full else 32))
+            print(f"共 {len(records)} 条记录")
+        else:
+            print(f"已为 {frame_log.rebuild_index()} 条记录建立索引")
+    finally:
+        frame_log.close()
@@ -0,0 +1,82 @@
+# framing.py - 字节流分帧模块
+
+
+class FrameAssembler:
+    """把TCP/串口字节流切分为完整的报文帧
+
+    livewire报文头固定12字节，以0x5B/0x5D开头，第4-5字节为大端的数据区长度，
+    整帧长度 = 报文头 + 数据区长度。遇到无法识别的字节时丢弃到下一个帧头重新同步
+    """
+
+    def __init__(self, header_size=12, length_offset=4, length_size=2, byteorder='big',
+                 start_bytes=b'\x5b\x5d', max_frame_size=65536 + 12):
+        """
+        参数:
+            header_size (int): 报文头长度
+            length_offset (int): 长度字段在报文头中的偏移
+            length_size (int): 长度字段字节数
+            byteorder (str): 长度字段字节序
+            start_bytes (bytes): 合法的帧起始字节，为空时不检查
+            max_frame_size (int): 超过该长度的帧视为失步
+        """
+        self.header_size = header_size
+        self.length_offset = length_offset
+        self.length_size = length_size
+        self.byteorder = byteorder
+        self.start_bytes = bytes(start_bytes)
+        self.max_frame_size = max_frame_size
+        self._buffer = bytearray()
+        self.discarded = 0  # 为重新同步丢弃的字节数
+
+    def feed(self, data):
+        """追加收到的数据，返回其中所有完整的帧
+
+        参数:
+            data (bytes|memoryview): 新收到的数据
+
+        返回:
+            list: bytes帧列表
+        """
+        buffer = self._buffer
+        buffer += data
+        frames = []
+        position = 0
+        size = len(buffer)
+        view = memoryview(buffer)
+        try:
+            while size - position >= self.header_size:
+                if self.start_bytes and buffer[position] not in self.start_bytes:
+                    position = self._resync(buffer, position + 1)
+                    continue
+                length_start = position + self.length_offset
+                frame_size = self.header_size + int.from_bytes(
+                    view[length_start:length_start + self.length_size], self.byteorder)
+                if frame_size > self.max_frame_size:
+                    position = self._resync(buffer, position + 1)
+                    continue
+                if size - position < frame_size:
+                    break
+                frames.append(bytes(view[position:position + frame_size]))
+                position += frame_size
+        finally:
+            view.release()
+        # 每次只移除一次已处理的前缀，避免逐帧移动缓冲区
+        if position:
+            del buffer[:position]
+        return frames
+
+    def _resync(self, buffer, position):
+        """从position开始找下一个可能的帧头"""
+        candidates = [index for index in (buffer.find(bytes([start]), position) for start in self.start_bytes)
+                      if index >= 0]
+        next_position = min(candidates) if candidates else len(buffer)
+        self.discarded += next_position - position + 1
+        return next_position
+
+    @property
+    def pending(self):
+        """缓冲区中尚未组成完整帧的字节数"""
+        return len(self._buffer)
+
+    def reset(self):
+        self._buffer.clear()
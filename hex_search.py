@@ -0,0 +1,162 @@
+# hex_search.py - 报文字节/数值搜索模块
+import re
+import struct
+
+# 数值类型 -> struct格式
+VALUE_FORMATS = {
+    'u8': 'B', 'u16': 'H', 'u32': 'I', 'u64': 'Q',
+    'i8': 'b', 'i16': 'h', 'i32': 'i', 'i64': 'q',
+    'float': 'f', 'double': 'd',
+}
+BYTES_TYPE = 'bytes'
+MAX_HITS = 100000  # 最多返回的命中数
+
+
+def parse_byte_pattern(text):
+    """解析16进制字节模式
+
+    支持空格分隔或连续书写，'??' 匹配任意字节，'?' 匹配任意半字节，例如 "0A ?? 27" 或 "0a2?"
+
+    返回:
+        tuple: (模式, 字节数)，模式为固定字节bytes，含通配符时为编译好的正则
+
+    异常:
+        ValueError: 模式格式不正确
+    """
+    digits = re.sub(r'\s+', '', text).upper()
+    if digits.startswith('0X'):
+        digits = digits[2:]
+    if not digits or len(digits) % 2 or not re.fullmatch(r'[0-9A-F?]+', digits):
+        raise ValueError(f"无效的字节模式: {text}")
+    if '?' not in digits:
+        return bytes.fromhex(digits), len(digits) // 2
+
+    parts = []
+    for i in range(0, len(digits), 2):
+        high, low = digits[i], digits[i + 1]
+        if high == '?' and low == '?':
+            parts.append(b'.')
+        elif high == '?':
+            parts.append(b'[' + b''.join(re.escape(bytes([(h << 4) | int(low, 16)])) for h in range(16)) + b']')
+        elif low == '?':
+            base = int(high, 16) << 4
+            parts.append(b'[' + re.escape(bytes([base])) + b'-' + re.escape(bytes([base | 0x0F])) + b']')
+        else:
+            parts.append(re.escape(bytes([int(high + low, 16)])))
+    # 零宽前瞻以便找出重叠的命中
+    return re.compile(b'(?=(' + b''.join(parts) + b'))', re.DOTALL), len(parts)
+
+
+def encode_value(text, value_type, endian='big'):
+    """把数值编码为要搜索的字节
+
+    参数:
+        text (str): 数值，整数支持0x前缀
+        value_type (str): VALUE_FORMATS中的类型
+        endian (str): 'big' 或 'little'
+
+    异常:
+        ValueError: 类型不支持或数值超出范围
+    """
+    fmt = VALUE_FORMATS.get(value_type)
+    if fmt is None:
+        raise ValueError(f"不支持的数值类型: {value_type}")
+    try:
+        value = float(text) if fmt in 'fd' else int(text.strip(), 0)
+        return struct.pack(('<' if endian == 'little' else '>') + fmt, value)
+    except (ValueError, struct.error) as e:
+        raise ValueError(f"无法按 {value_type} 编码 {text}: {e}")
+
+
+def find_all(data, pattern, max_hits=MAX_HITS):
+    """查找全部命中（允许重叠）
+
+    参数:
+        data (bytes): 被搜索的数据
+        pattern: 要查找的bytes，或parse_byte_pattern返回的正则
+
+    返回:
+        list: 命中的起始字节偏移
+    """
+    hits = []
+    if isinstance(pattern, re.Pattern):
+        for match in pattern.finditer(data):
+            hits.append(match.start())
+            if len(hits) >= max_hits:
+                break
+        return hits
+
+    # 固定字节直接用bytes.find，整体仍是线性扫描
+    position = data.find(pattern)
+    while position >= 0 and len(hits) < max_hits:
+        hits.append(position)
+        position = data.find(pattern, position + 1)
+    return hits
+
+
+def search(data, query, value_type=BYTES_TYPE, endian='big', max_hits=MAX_HITS):
+    """按字节模式或数值搜索
+
+    返回:
+        tuple: (命中偏移列表, 每个命中的字节数)
+
+    异常:
+        ValueError: 搜索条件不正确
+    """
+    if value_type == BYTES_TYPE:
+        pattern, length = parse_byte_pattern(query)
+    else:
+        pattern = encode_value(query, value_type, endian)
+        length = len(pattern)
+    return find_all(data, pattern, max_hits), length
+
+
+class SearchCursor:
+    """在命中列表中前后移动"""
+
+    def __init__(self, hits, length):
+        self.hits = hits
+        self.length = length
+        self.index = -1
+
+    def __len__(self):
+        return len(self.hits)
+
+    def current(self):
+        """当前命中的 (起始字节, 结束字节(包含))，没有时返回None"""
+        if not 0 <= self.index < len(self.hits):
+            return None
+        start = self.hits[self.index]
+        return start, start + self.length - 1
+
+    def next(self):
+        if self.hits:
+            self.index = (self.index + 1) % len(self.hits)
+        return self.current()
+
+    def previous(self):
+        if self.hits:
+            self.index = (self.index - 1) % len(self.hits)
+        return self.current()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="在二进制/16进制文件中搜索字节模式或数值")
+    parser.add_argument("file", help="要搜索的文件")
+    parser.add_argument("query", help="字节模式（如 \"0A ?? 27\"）或数值")
+    parser.add_argument("--type", default=BYTES_TYPE, choices=[BYTES_TYPE] + list(VALUE_FORMATS),
+                        help="搜索类型")
+    parser.add_argument("--endian", default="big", choices=["big", "little"], help="数值字节序")
+    parser.add_argument("--hex-text", action="store_true", help="文件内容是16进制文本")
+    args = parser.parse_args()
+
+    with open(args.file, 'rb') as f:
+        content = f.read()
+    if args.hex_text:
+        content = bytes.fromhex(re.sub(rb'[^0-9a-fA-F]', b'', content).decode('ascii'))
+    hits, length = search(content, args.query, args.type, args.endian)
+    print(f"共 {len(hits)} 处命中，每处 {length} 字节")
+    for offset in hits[:50]:
+        print(f"  0x{offset:08x}: {content[offset:offset + length].hex(' ').upper()}")
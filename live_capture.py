@@ -0,0 +1,389 @@
+# live_capture.py - 实时TCP抓包模块
+import asyncio
+import queue
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+from framing import FrameAssembler
+
+MODE_CLIENT = 'client'  # 连接控制器，解析收到的数据
+MODE_PROXY = 'proxy'    # 在本地监听，工具连上来后转发到控制器，双向解析
+MODE_SERIAL = 'serial'  # 读取串口/伪终端
+
+DIRECTION_RX = 'rx'                # 客户端模式下控制器发来的数据
+DIRECTION_TO_SERVER = 'tool->ctrl'
+DIRECTION_TO_CLIENT = 'ctrl->tool'
+
+READ_SIZE = 65536
+
+CaptureResult = namedtuple('CaptureResult', 'timestamp direction data protocol parsed_data')
+
+
+class LiveCapture:
+    """实时抓包：在后台线程运行asyncio事件循环接收并分帧，解码在单独的工作线程进行
+
+    数据流: socket -> FrameAssembler -> 帧队列(有界) -> 解码线程 -> 结果队列(有界) -> 界面轮询
+
+    客户端模式下帧队列满时停止读取socket，由TCP流控让对端减速；
+    代理模式下转发不能被界面拖慢，串口没有流控，这两种模式队列满时丢弃该帧的解析并计数
+    """
+
+    def __init__(self, protocol_manager, mode=MODE_CLIENT, host="127.0.0.1", port=9000,
+                 listen_host="127.0.0.1", listen_port=9001, frame_queue_size=1000,
+                 result_queue_size=5000, batch_size=64, record=True, device=None, baudrate=115200):
+        """
+        参数:
+            protocol_manager: ProtocolManager
+            mode (str): MODE_CLIENT、MODE_PROXY 或 MODE_SERIAL
+            host, port: 控制器地址
+            listen_host, listen_port: 代理模式的本地监听地址
+            frame_queue_size (int): 等待解码的帧数上限
+            result_queue_size (int): 等待界面取走的结果数上限
+            batch_size (int): 解码线程每次处理的最大帧数
+            record (bool): 是否写入报文记录
+            device (str): 串口模式的设备路径
+            baudrate (int): 串口波特率
+        """
+        if mode not in (MODE_CLIENT, MODE_PROXY, MODE_SERIAL):
+            raise ValueError(f"不支持的抓包模式: {mode}")
+        self.protocol_manager = protocol_manager
+        self.mode = mode
+        self.host = host
+        self.port = port
+        self.listen_host = listen_host
+        self.listen_port = listen_port
+        self.frame_queue_size = frame_queue_size
+        self.batch_size = batch_size
+        self.record = record
+        self.device = device
+        self.baudrate = baudrate
+
+        self.results = queue.Queue(maxsize=result_queue_size)
+        self.frame_count = 0
+        self.byte_count = 0
+        self.dropped = 0
+        self.error = None
+
+        self._loop = None
+        self._stop_event = None
+        self._thread = None
+        self._stopping = threading.Event()
+        self._ready = threading.Event()
+
+    # ---- 界面线程调用 ----
+
+    def start(self):
+        """启动后台线程，等待连接/监听建立
+
+        返回:
+            tuple: (是否成功, 消息)
+        """
+        if self.is_running():
+            return False, "抓包已在运行"
+        self._stopping.clear()
+        self._ready.clear()
+        self.error = None
+        self._thread = threading.Thread(target=self._run, name="live-capture", daemon=True)
+        self._thread.start()
+        self._ready.wait(timeout=10)
+        if self.error:
+            return False, self.error
+        if self.mode == MODE_SERIAL:
+            return True, f"已打开串口 {self.device}"
+        if self.mode == MODE_PROXY:
+            return True, f"正在监听 {self.listen_host}:{self.listen_port}，转发到 {self.host}:{self.port}"
+        return True, f"已连接 {self.host}:{self.port}"
+
+    def stop(self, timeout=5):
+        """停止抓包，已解码的结果仍可通过get_results取走"""
+        self._stopping.set()
+        if self._loop is not None and self._stop_event is not None:
+            try:
+                self._loop.call_soon_threadsafe(self._stop_event.set)
+            except RuntimeError:
+                pass  # 事件循环已经结束
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def is_running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def get_results(self, max_items=200):
+        """取走最多max_items个解码结果，不阻塞"""
+        items = []
+        try:
+            while len(items) < max_items:
+                items.append(self.results.get_nowait())
+        except queue.Empty:
+            pass
+        return items
+
+    # ---- 后台线程 ----
+
+    def _run(self):
+        try:
+            asyncio.run(self._main())
+        except Exception as e:
+            self.error = self.error or f"抓包出错: {e}"
+            print(self.error)
+        finally:
+            self._ready.set()
+
+    async def _main(self):
+        self._loop = asyncio.get_running_loop()
+        self._stop_event = asyncio.Event()
+        frames = asyncio.Queue(maxsize=self.frame_queue_size)
+        # 单个解码线程，保证同一连接上的帧按顺序解码
+        executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="live-decode")
+        decoder = asyncio.create_task(self._decode_loop(frames, executor))
+        server = None
+        client_writer = None
+        serial_reader = None
+        tasks = []
+        try:
+            if self.mode == MODE_CLIENT:
+                try:
+                    reader, client_writer = await asyncio.wait_for(
+                        asyncio.open_connection(self.host, self.port), 5)
+                except (OSError, asyncio.TimeoutError) as e:
+                    self.error = f"无法连接 {self.host}:{self.port}: {e}"
+                    return
+                tasks.append(asyncio.create_task(
+                    self._read_stream(reader, DIRECTION_RX, frames, backpressure=True)))
+            elif self.mode == MODE_SERIAL:
+                from serial_capture import SerialFrameReader, open_serial
+                try:
+                    serial_reader = SerialFrameReader(open_serial(self.device, self.baudrate))
+                except (OSError, ValueError) as e:
+                    self.error = f"无法打开串口 {self.device}: {e}"
+                    return
+                self._loop.add_reader(serial_reader.fd, self._on_serial_readable, serial_reader, frames)
+            else:
+                try:
+                    server = await asyncio.start_server(
+                        lambda r, w: self._handle_proxy_client(r, w, frames, tasks),
+                        self.listen_host, self.listen_port)
+                except OSError as e:
+                    self.error = f"无法监听 {self.listen_host}:{self.listen_port}: {e}"
+                    return
+            self._ready.set()
+            await self._stop_event.wait()
+            if not self._stopping.is_set():
+                # 对端关闭连接：把已经收到的帧解码完再退出
+                await frames.join()
+        finally:
+            if server is not None:
+                server.close()
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            self._stopping.set()
+            decoder.cancel()
+            await asyncio.gather(decoder, return_exceptions=True)
+            executor.shutdown(wait=True)
+            if client_writer is not None:
+                client_writer.close()
+            if serial_reader is not None:
+                if serial_reader.fd is not None:
+                    self._loop.remove_reader(serial_reader.fd)
+                serial_reader.close()
+
+    async def _read_stream(self, reader, direction, frames, backpressure, writer=None):
+        """读取一个方向的数据并分帧；代理模式下先把数据原样转发给writer"""
+        assembler = FrameAssembler()
+        try:
+            while True:
+                data = await reader.read(READ_SIZE)
+                if not data:
+                    break
+                if writer is not None:
+                    writer.write(data)
+                    await writer.drain()
+                self.byte_count += len(data)
+                timestamp = time.time_ns()
+                for frame in assembler.feed(data):
+                    item = (timestamp, direction, frame)
+                    if backpressure:
+                        await frames.put(item)
+                    else:
+                        try:
+                            frames.put_nowait(item)
+                        except asyncio.QueueFull:
+                            self.dropped += 1
+        except (ConnectionError, OSError) as e:
+            print(f"抓包连接断开({direction}): {e}")
+        finally:
+            if writer is not None:
+                writer.close()
+            if self.mode == MODE_CLIENT:
+                self._stop_event.set()
+
+    def _on_serial_readable(self, serial_reader, frames):
+        """串口可读：成块读取并分帧，串口无法让对端减速，队列满时丢弃"""
+        timestamp = time.time_ns()
+        before = serial_reader.byte_count
+        for frame in serial_reader.read_frames():
+            try:
+                frames.put_nowait((timestamp, DIRECTION_RX, frame))
+            except asyncio.QueueFull:
+                self.dropped += 1
+        self.byte_count += serial_reader.byte_count - before
+        if serial_reader.closed:
+            self._loop.remove_reader(serial_reader.fd)
+            self._stop_event.set()
+
+    async def _handle_proxy_client(self, client_reader, client_writer, frames, tasks):
+        """代理模式：为连上来的工具建立到控制器的连接，双向转发"""
+        try:
+            server_reader, server_writer = await asyncio.open_connection(self.host, self.port)
+        except OSError as e:
+            print(f"无法连接控制器 {self.host}:{self.port}: {e}")
+            client_writer.close()
+            return
+        for reader, writer, direction in ((client_reader, server_writer, DIRECTION_TO_SERVER),
+                                          (server_reader, client_writer, DIRECTION_TO_CLIENT)):
+            tasks.append(asyncio.create_task(
+                self._read_stream(reader, direction, frames, backpressure=False, writer=writer)))
+
+    async def _decode_loop(self, frames, executor):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await frames.get()]
+            while len(batch) < self.batch_size and not frames.empty():
+                batch.append(frames.get_nowait())
+            # 解码在工作线程进行；结果队列满时工作线程阻塞，帧队列随之积压形成背压
+            await loop.run_in_executor(executor, self._decode_batch, batch)
+            for _ in batch:
+                frames.task_done()
+
+    def _decode_batch(self, batch):
+        for timestamp, direction, frame in batch:
+            hex_data = frame.hex().upper()
+            try:
+                protocol, parsed_data = self.protocol_manager.decode_frame(hex_data, record=self.record)
+            except Exception as e:
+                print(f"实时解码失败: {e}")
+                protocol, parsed_data = None, None
+            result = CaptureResult(timestamp, direction, hex_data, protocol, parsed_data)
+            while not self._stopping.is_set():
+                try:
+                    self.results.put(result, timeout=0.2)
+                    self.frame_count += 1
+                    break
+                except queue.Full:
+                    continue
+
+
+def collect_sample_frames(protocol_manager):
+    """收集所有协议/命令的报文样本，用于模拟控制器回放"""
+    frames = []
+    definitions = [protocol for protocol in protocol_manager.protocols.values() if isinstance(protocol, dict)]
+    # protocol_commands: 协议组 -> 命令ID -> 命令列表（同一ID可按follow区分多条）
+    for commands in protocol_manager.protocol_commands.values():
+        if not isinstance(commands, dict):
+            continue
+        for command_list in commands.values():
+            if isinstance(command_list, dict):
+                command_list = [command_list]
+            definitions.extend(command for command in command_list if isinstance(command, dict))
+    seen = set()
+    for definition in definitions:
+        for hex_data in protocol_manager.get_command_samples(definition):
+            hex_data = hex_data.replace(' ', '').upper()
+            if hex_data not in seen:
+                seen.add(hex_data)
+                frames.append(bytes.fromhex(hex_data))
+    return frames
+
+
+async def serve_samples(frames, host="127.0.0.1", port=9000, interval=0.01, repeat=True, chunk_size=0):
+    """模拟控制器：每个连接上循环发送样本帧
+
+    参数:
+        frames (list): 要发送的帧
+        interval (float): 帧间隔(秒)，0表示尽快发送
+        repeat (bool): 发送完后是否从头继续
+        chunk_size (int): 大于0时把数据切成小块发送，用于验证分帧
+
+    返回:
+        asyncio.Server
+    """
+    async def handle(reader, writer):
+        try:
+            while True:
+                for frame in frames:
+                    if chunk_size > 0:
+                        for i in range(0, len(frame), chunk_size):
+                            writer.write(frame[i:i + chunk_size])
+                    else:
+                        writer.write(frame)
+                    await writer.drain()
+                    if interval:
+                        await asyncio.sleep(interval)
+                if not repeat:
+                    break
+        except (ConnectionError, OSError):
+            pass
+        finally:
+            writer.close()
+
+    return await asyncio.start_server(handle, host, port)
+
+
+if __name__ == "__main__":
+    import argparse
+    from protocol_manager import ProtocolManager
+
+    parser = argparse.ArgumentParser(description="实时TCP抓包和模拟控制器")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    mock_parser = subparsers.add_parser("mock", help="回放协议样本的模拟控制器")
+    mock_parser.add_argument("--data-dir", default="protocols", help="协议目录")
+    mock_parser.add_argument("--port", type=int, default=9000)
+    mock_parser.add_argument("--interval", type=float, default=0.01, help="帧间隔(秒)")
+    mock_parser.add_argument("--chunk-size", type=int, default=0, help="按小块发送以测试分帧")
+
+    capture_parser = subparsers.add_parser("capture", help="连接或代理并打印解码结果")
+    capture_parser.add_argument("--data-dir", default="protocols", help="协议目录")
+    capture_parser.add_argument("--mode", choices=[MODE_CLIENT, MODE_PROXY, MODE_SERIAL], default=MODE_CLIENT)
+    capture_parser.add_argument("--host", default="127.0.0.1")
+    capture_parser.add_argument("--port", type=int, default=9000)
+    capture_parser.add_argument("--listen-port", type=int, default=9001)
+    capture_parser.add_argument("--device", help="串口模式的设备路径")
+    capture_parser.add_argument("--baudrate", type=int, default=115200)
+    capture_parser.add_argument("--seconds", type=float, default=5, help="抓包时长")
+    args = parser.parse_args()
+
+    manager = ProtocolManager(args.data_dir)
+    if args.command == "mock":
+        sample_frames = collect_sample_frames(manager)
+        print(f"回放 {len(sample_frames)} 个样本帧，端口 {args.port}")
+
+        async def run_mock():
+            server = await serve_samples(sample_frames, port=args.port, interval=args.interval,
+                                         chunk_size=args.chunk_size)
+            async with server:
+                await server.serve_forever()
+
+        try:
+            asyncio.run(run_mock())
+        except KeyboardInterrupt:
+            pass
+    else:
+        capture = LiveCapture(manager, mode=args.mode, host=args.host, port=args.port,
+                              listen_port=args.listen_port, record=False, device=args.device,
+                              baudrate=args.baudrate)
+        success, message = capture.start()
+        print(message)
+        if success:
+            deadline = time.time() + args.seconds
+            while time.time() < deadline:
+                for result in capture.get_results():
+                    name = result.protocol.get('name', '') if result.protocol else '未匹配'
+                    print(f"{result.direction:<11} {name:<20} {result.data[:48]}")
+                time.sleep(0.1)
+            capture.stop()
+            print(f"共 {capture.frame_count} 帧，{capture.byte_count} 字节，丢弃 {capture.dropped} 帧")
@@ -0,0 +1,331 @@
+# load_generator.py - 按协议定义生成压测报文/回放报文记录模块
+import os
+import random
+import socket
+import time
+
+from field_model import FieldDef
+
+MODE_RANDOM = 'random'  # 字段值在类型范围内随机
+MODE_SWEEP = 'sweep'    # 字段值从最小到最大等间隔扫描
+
+POOL_SIZE = 1024        # 每个命令预先编码的帧数
+BATCH_SIZE = 256        # 每次写入的帧数
+FLOAT_RANGE = (-10000.0, 10000.0)
+
+# 整数类型 -> (字节数, 是否有符号)
+_INTEGER_RANGES = {
+    'u8': (1, False), 'u16': (2, False), 'u32': (4, False), 'u64': (8, False),
+    'BYTE': (1, False), 'WORD': (2, False), 'DWORD': (4, False), 'QWORD': (8, False),
+    'i8': (1, True), 'i16': (2, True), 'i32': (4, True), 'i64': (8, True),
+}
+
+
+def value_generator(field, mode=MODE_RANDOM, steps=POOL_SIZE, rng=None):
+    """生成字段取值的函数 f(i) -> 值，不支持的类型返回None（保持模板内容）
+
+    参数:
+        field (dict): 字段定义
+        mode (str): MODE_RANDOM 或 MODE_SWEEP
+        steps (int): 扫描模式下从最小到最大的步数
+        rng (random.Random): 随机数发生器
+    """
+    field = FieldDef.from_dict(field)
+    rng = rng or random.Random()
+    start, end, layout = field.get_layout()
+    length = end - start
+    base_type = field.get('type', 'u8').split('.')[0]
+
+    if base_type in ('float', 'double') and layout:
+        low, high = FLOAT_RANGE
+        if mode == MODE_SWEEP:
+            return lambda i: round(low + (high - low) * (i % steps) / max(1, steps - 1), 3)
+        return lambda i: round(rng.uniform(low, high), 3)
+
+    if field.is_bit_field():
+        high = field.get_bit_layout()[3]
+        if mode == MODE_SWEEP:
+            return lambda i: high * (i % steps) // max(1, steps - 1)
+        return lambda i: rng.randint(0, high)
+
+    if base_type in _INTEGER_RANGES or base_type in ('hex', 'bytes', 'bool'):
+        # 整数按字段实际长度取范围，hex/bytes看作无符号大端整数
+        signed = _INTEGER_RANGES.get(base_type, (length, False))[1]
+        if base_type == 'bool':
+            low, high = 0, 1
+        elif signed:
+            low, high = -(1 << (8 * length - 1)), (1 << (8 * length - 1)) - 1
+        else:
+            low, high = 0, (1 << (8 * length)) - 1
+        if base_type in ('hex', 'bytes'):
+            to_value = lambda number: number.to_bytes(length, 'big')
+        else:
+            to_value = lambda number: number
+        if mode == MODE_SWEEP:
+            span = high - low
+            return lambda i: to_value(low + span * (i % steps) // max(1, steps - 1))
+        return lambda i: to_value(rng.randint(low, high))
+
+    return None
+
+
+def build_frame_pool(protocol_manager, definition, mode=MODE_RANDOM, size=POOL_SIZE, fields=None, seed=None):
+    """为一个命令预先编码一批帧
+
+    参数:
+        protocol_manager: ProtocolManager
+        definition (dict): 命令定义
+        mode (str): MODE_RANDOM 或 MODE_SWEEP
+        size (int): 帧数；扫描模式下也是从最小到最大的步数
+        fields (list): 只改变这些字段，为None时改变所有支持的字段
+        seed (int): 随机种子
+
+    返回:
+        list: bytes帧；命令没有报文样本时为空列表
+    """
+    encoder = protocol_manager.get_frame_encoder(definition)
+    if encoder is None:
+        return []
+    rng = random.Random(seed)
+    generators = {}
+    for field in definition.get('fields', []):
+        name = field.get('name', '')
+        if fields is not None and name not in fields:
+            continue
+        generator = value_generator(field, mode, size, rng)
+        if generator is not None:
+            generators[name] = generator
+    return encoder.encode_many({name: generator(i) for name, generator in generators.items()}
+                               for i in range(size))
+
+
+def iter_group_commands(protocol_manager, group, command_ids=None):
+    """列出协议组中的命令定义，command_ids为命令ID列表时只返回这些命令"""
+    wanted = {command_id.upper() for command_id in command_ids} if command_ids else None
+    commands = protocol_manager.protocol_commands.get(group, {})
+    for command_id, command_list in commands.items():
+        if wanted is not None and command_id.upper() not in wanted:
+            continue
+        if isinstance(command_list, dict):
+            command_list = [command_list]
+        for command in command_list:
+            if isinstance(command, dict):
+                yield command
+
+
+# ---- 输出目标 ----
+
+class FileSink:
+    """写入文件"""
+
+    def __init__(self, path):
+        self.name = path
+        self._file = open(path, 'wb')
+
+    def write(self, data):
+        self._file.write(data)
+
+    def close(self):
+        self._file.close()
+
+
+class TcpSink:
+    """写入TCP连接"""
+
+    def __init__(self, host, port):
+        self.name = f"{host}:{port}"
+        self._socket = socket.create_connection((host, port))
+        self._socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def write(self, data):
+        self._socket.sendall(data)
+
+    def close(self):
+        self._socket.close()
+
+
+class PtySink:
+    """写入伪终端主端，读取方打开name对应的从端"""
+
+    def __init__(self):
+        import pty
+        from serial_capture import configure_raw
+        self._master, self._slave = pty.openpty()
+        configure_raw(self._slave)
+        self.name = os.ttyname(self._slave)
+
+    def write(self, data):
+        view = memoryview(data)
+        while view:
+            written = os.write(self._master, view)
+            view = view[written:]
+
+    def close(self):
+        os.close(self._master)
+        os.close(self._slave)
+
+
+def open_sink(spec):
+    """按描述打开输出目标: file:<路径>、tcp:<主机>:<端口> 或 pty"""
+    kind, _, rest = spec.partition(':')
+    if kind == 'file' and rest:
+        return FileSink(rest)
+    if kind == 'tcp' and rest:
+        host, _, port = rest.rpartition(':')
+        return TcpSink(host or '127.0.0.1', int(port))
+    if kind == 'pty':
+        return PtySink()
+    raise ValueError(f"无效的输出目标: {spec}")
+
+
+# ---- 发送 ----
+
+def stream_frames(frame_pool, sink, rate=0, count=None, duration=None, batch_size=BATCH_SIZE, progress=None):
+    """循环发送预编码的帧，按批拼接后一次写入
+
+    参数:
+        frame_pool (list): 预编码的帧，按顺序循环使用
+        sink: 输出目标
+        rate (float): 目标帧率(帧/秒)，0表示尽快发送
+        count (int): 最多发送的帧数
+        duration (float): 最长发送时间(秒)
+        batch_size (int): 每次写入的帧数
+        progress (callable): 每批发送后调用，参数为(已发送帧数, 已用秒数)
+
+    返回:
+        tuple: (发送帧数, 发送字节数, 用时秒数)
+    """
+    if not frame_pool:
+        return 0, 0, 0.0
+    # 预先把帧池拼成若干批，发送时只需取出写入
+    pool_size = len(frame_pool)
+    batches = []
+    for start in range(0, pool_size, batch_size):
+        batch = [frame_pool[(start + i) % pool_size] for i in range(batch_size)]
+        batches.append((b''.join(batch), batch))
+
+    sent_frames = sent_bytes = 0
+    started = time.perf_counter()
+    index = 0
+    while True:
+        if count is not None and sent_frames >= count:
+            break
+        elapsed = time.perf_counter() - started
+        if duration is not None and elapsed >= duration:
+            break
+        blob, batch = batches[index % len(batches)]
+        index += 1
+        frames_in_batch = len(batch)
+        if count is not None and sent_frames + frames_in_batch > count:
+            frames_in_batch = count - sent_frames
+            blob = b''.join(batch[:frames_in_batch])
+        if rate > 0:
+            # 按目标帧率计算这一批应当发出的时间，提前时等待
+            delay = sent_frames / rate - elapsed
+            if delay > 0:
+                time.sleep(delay)
+        sink.write(blob)
+        sent_frames += frames_in_batch
+        sent_bytes += len(blob)
+        if progress is not None:
+            progress(sent_frames, time.perf_counter() - started)
+    return sent_frames, sent_bytes, time.perf_counter() - started
+
+
+def replay_records(records, sink, speed=1.0, batch_window=0.001):
+    """按记录的时间间隔回放报文
+
+    参数:
+        records (list): FrameRecord列表（按时间排序）
+        sink: 输出目标
+        speed (float): 回放速度倍数，2表示两倍速，0表示不等待尽快发送
+        batch_window (float): 在该时间窗口(秒)内到期的帧合并为一次写入
+
+    返回:
+        tuple: (发送帧数, 发送字节数, 用时秒数)
+    """
+    if not records:
+        return 0, 0, 0.0
+    first_timestamp = records[0].timestamp
+    started = time.perf_counter()
+    sent_frames = sent_bytes = 0
+    index = 0
+    while index < len(records):
+        if speed > 0:
+            due = (records[index].timestamp - first_timestamp) / 1e9 / speed
+            delay = due - (time.perf_counter() - started)
+            if delay > 0:
+                time.sleep(delay)
+            # 已经到期以及即将到期的帧一起写
+            horizon = (time.perf_counter() - started + batch_window) * speed * 1e9 + first_timestamp
+            end = index + 1
+            while end < len(records) and records[end].timestamp <= horizon:
+                end += 1
+        else:
+            end = min(len(records), index + BATCH_SIZE)
+        blob = b''.join(record.data for record in records[index:end])
+        sink.write(blob)
+        sent_frames += end - index
+        sent_bytes += len(blob)
+        index = end
+    return sent_frames, sent_bytes, time.perf_counter() - started
+
+
+if __name__ == "__main__":
+    import argparse
+    import itertools
+    from protocol_manager import ProtocolManager
+
+    parser = argparse.ArgumentParser(description="按协议定义生成压测报文，或回放报文记录")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    generate_parser = subparsers.add_parser("generate", help="生成报文")
+    generate_parser.add_argument("group", help="协议组，如 livewire")
+    generate_parser.add_argument("--commands", default="", help="命令ID列表，逗号分隔，默认全部")
+    generate_parser.add_argument("--fields", default="", help="只改变这些字段，逗号分隔，默认全部")
+    generate_parser.add_argument("--mode", choices=[MODE_RANDOM, MODE_SWEEP], default=MODE_RANDOM)
+    generate_parser.add_argument("--pool-size", type=int, default=POOL_SIZE, help="每个命令预编码的帧数/扫描步数")
+    generate_parser.add_argument("--seed", type=int, default=None)
+    generate_parser.add_argument("--data-dir", default="protocols", help="协议目录")
+
+    replay_parser = subparsers.add_parser("replay", help="回放报文记录")
+    replay_parser.add_argument("--log-dir", default="frame_log", help="报文记录目录")
+    replay_parser.add_argument("--filter", default=None, help="命令键(组/命令ID)或命令ID")
+    replay_parser.add_argument("--start", default="", help="开始时间")
+    replay_parser.add_argument("--end", default="", help="结束时间")
+    replay_parser.add_argument("--speed", type=float, default=1.0, help="回放速度倍数，0表示尽快发送")
+
+    for sub in (generate_parser, replay_parser):
+        sub.add_argument("--sink", default="file:load.bin", help="file:<路径>、tcp:<主机>:<端口> 或 pty")
+    generate_parser.add_argument("--rate", type=float, default=0, help="目标帧率(帧/秒)，0表示尽快发送")
+    generate_parser.add_argument("--count", type=int, default=None, help="发送帧数")
+    generate_parser.add_argument("--duration", type=float, default=None, help="发送时长(秒)")
+    args = parser.parse_args()
+
+    sink = open_sink(args.sink)
+    print(f"输出到 {sink.name}")
+    try:
+        if args.command == "generate":
+            manager = ProtocolManager(args.data_dir)
+            command_ids = [c for c in args.commands.split(',') if c] or None
+            field_names = [f for f in args.fields.split(',') if f] or None
+            pools = [build_frame_pool(manager, command, args.mode, args.pool_size, field_names, args.seed)
+                     for command in iter_group_commands(manager, args.group, command_ids)]
+            pools = [pool for pool in pools if pool]
+            if not pools:
+                raise SystemExit("没有可用的命令（命令需要有报文样本）")
+            # 多个命令交替发送
+            pool = [frame for frames in itertools.zip_longest(*pools) for frame in frames if frame]
+            if args.count is None and args.duration is None:
+                args.count = len(pool)
+            frames, total_bytes, seconds = stream_frames(pool, sink, args.rate, args.count, args.duration)
+        else:
+            from frame_log import FrameLog, parse_time
+            frame_log = FrameLog(args.log_dir)
+            records = frame_log.query(args.filter, parse_time(args.start), parse_time(args.end))
+            frame_log.close()
+            frames, total_bytes, seconds = replay_records(records, sink, args.speed)
+        rate = frames / seconds if seconds else 0
+        print(f"发送 {frames} 帧，{total_bytes} 字节，用时 {seconds:.3f} 秒，{rate:.0f} 帧/秒")
+    finally:
+        sink.close()
@@ -3,13 +3,32 @@ import tkinter as tk
 from tkinter import ttk, scrolledtext, messagebox, IntVar
 import re
 from protocol_manager import ProtocolManager
-from ui_dialogs import ProtocolSelectionDialog, ProtocolEditor, ProtocolFieldDialog
+from field_model import json_default
+from ui_dialogs import (ProtocolSelectionDialog, ProtocolEditor, ProtocolFieldDialog, FrameLogDialog,
+                        LiveCaptureDialog, FrameEncoderDialog)
+from action_profiler import ActionProfiler
+from protocol_watcher import ProtocolWatcher
+from protocol_store import SQLiteProtocolStore
+from frame_log import FrameLog
+from column_store import ColumnStore
+from field_plot import FieldPlotWindow, load_field_series
+import frame_diff
+import hex_search
+from decode_session import DecodeSession, HexLayout
+from decode_plan import expand_records
 import json
 import os
+import multiprocessing
 
 class HexParserTool:
     """16进制数据解析工具主界面"""
     
+    PROTOCOL_POLL_INTERVAL = 1000  # 检查协议文件变化的间隔(毫秒)
+    PROTOCOL_DB_PATH = "protocols.db"  # 存在该文件时使用SQLite协议库代替json文件
+    FRAME_LOG_DIR = "frame_log"  # 解码过的报文记录目录
+    FRAME_DIFF_MAX_FRAMES = 5000  # 对比报文时最多使用的最近帧数
+    SEARCH_MAX_PAINTED = 2000  # 搜索时最多同时高亮的命中数
+    
     def __init__(self, root):
         """初始化数据解析工具"""
         self.root = root
@@ -21,7 +40,27 @@ class HexParserTool:
         # self.root.bind_all("<Key>", self._on_key_press)
         
         # 初始化协议管理器
-        self.protocol_manager = ProtocolManager()
+        self.protocol_store = None
+        if os.path.exists(self.PROTOCOL_DB_PATH):
+            self.protocol_store = SQLiteProtocolStore(self.PROTOCOL_DB_PATH)
+        # 解码过的报文都写入报文记录，便于之后按命令和时间查询
+        self.frame_log = FrameLog(self.FRAME_LOG_DIR)
+        # 完整解析的帧按字段写入列存储，用于按字段值过滤历史报文
+        self.column_store = ColumnStore(os.path.join(self.FRAME_LOG_DIR, "columns"))
+        self.protocol_manager = ProtocolManager(store=self.protocol_store, frame_log=self.frame_log,
+                                                column_store=self.column_store)
+        
+        # 监视协议目录，其他人更新的协议文件无需重启即可生效（使用数据库时不需要）
+        self.protocol_watcher = None
+        if self.protocol_store is None:
+            self.protocol_watcher = ProtocolWatcher(self.protocol_manager)
+        
+        # 性能分析器，报告与last_session.json写在同一目录
+        self.profile_next_var = tk.BooleanVar(value=False)
+        self.action_profiler = ActionProfiler(
+            output_dir=os.path.dirname(os.path.abspath('last_session.json')),
+            on_report=self._on_profile_report
+        )
         
         # 命令相关变量
         self.command_name_var = tk.StringVar()
@@ -34,6 +73,10 @@ class HexParserTool:
         self.raw_hex_data = ""
         self.offset = 0
         
+        # 当前数据的解码会话和显示布局，各操作共享同一次匹配和解析结果
+        self.decode_session = None
+        self.hex_layout = None
+        
         # 当前选中的协议
         self.current_protocol = None
         self.current_protocol_key = None
@@ -63,6 +106,10 @@ class HexParserTool:
         
         # 绑定窗口关闭事件
         self.root.protocol("WM_DELETE_WINDOW", self._on_closing)
+        
+        # 定时检查协议文件变化
+        if self.protocol_watcher is not None:
+            self.root.after(self.PROTOCOL_POLL_INTERVAL, self._poll_protocol_changes)
     
     def _setup_styles(self):
         """设置界面样式"""
@@ -88,10 +135,144 @@ class HexParserTool:
         file_menu.add_command(label="退出", command=self.root.quit)
         menubar.add_cascade(label="文件", menu=file_menu)
         
+        # 工具菜单
+        tools_menu = tk.Menu(menubar, tearoff=0)
+        tools_menu.add_checkbutton(label="性能分析下一次操作", variable=self.profile_next_var,
+                                   command=self._toggle_profile_next_action)
+        tools_menu.add_command(label="报文记录查询", command=self._open_frame_log)
+        tools_menu.add_command(label="实时抓包", command=self._open_live_capture)
+        tools_menu.add_command(label="生成报文", command=self._open_frame_encoder)
+        tools_menu.add_command(label="识别字符串编码", command=self._learn_text_encodings)
+        diff_menu = tk.Menu(tools_menu, tearoff=0)
+        for metric, label in frame_diff.METRICS.items():
+            diff_menu.add_command(label=label, command=lambda m=metric: self._show_frame_diff(m))
+        diff_menu.add_separator()
+        diff_menu.add_command(label="清除对比", command=self._clear_frame_diff)
+        tools_menu.add_cascade(label="对比报文", menu=diff_menu)
+        menubar.add_cascade(label="工具", menu=tools_menu)
+        
         # 帮助菜单
         help_menu = tk.Menu(menubar, tearoff=0)
         help_menu.add_command(label="关于", command=self._show_about)
         menubar.add_cascade(label="帮助", menu=help_menu)
+    
+    def _open_frame_log(self):
+        """打开报文记录查询对话框"""
+        FrameLogDialog(self.root, self.frame_log, on_open=self._load_logged_frame)
+    
+    def _show_frame_diff(self, metric):
+        """用报文记录中同一命令的多帧与当前报文逐字节对比，按变化程度给16进制显示着色"""
+        if not self.raw_hex_data or not self.current_protocol:
+            messagebox.showinfo("提示", "请先解析一条匹配协议的报文")
+            return
+        
+        command_key = self.protocol_manager.get_frame_log_key(self.current_protocol)
+        records = self.frame_log.query(command_key, last=self.FRAME_DIFF_MAX_FRAMES)
+        if len(records) < 2:
+            messagebox.showinfo("提示", f"报文记录中 {command_key} 的报文不足两帧，无法对比")
+            return
+        
+        scores = frame_diff.compute_byte_scores([record.data for record in records], self.raw_hex_data, metric)
+        runs = frame_diff.heat_runs(scores)
+        self._paint_frame_diff(runs)
+        self.status_var.set(f"对比 {len(records)} 帧（{frame_diff.METRICS[metric]}），"
+                            f"{sum(end - start + 1 for start, end, _ in runs)} 个字节有变化")
+    
+    def _paint_frame_diff(self, runs):
+        """按热力等级着色，每个等级只调用一次tag_add"""
+        self._clear_frame_diff()
+        layout = self._get_hex_layout()
+        ranges_by_level = {}
+        for start, end, level in runs:
+            ranges = ranges_by_level.setdefault(level, [])
+            for hex_start, hex_end, ascii_start, ascii_end in layout.byte_spans(start, end):
+                ranges.extend((hex_start, hex_end, ascii_start, ascii_end))
+        
+        for level, ranges in ranges_by_level.items():
+            tag = f"diff_heat_{level}"
+            self.output_text.tag_config(tag, background=frame_diff.HEAT_COLORS[level - 1])
+            self.output_text.tag_add(tag, *ranges)
+            # 字段底色覆盖了第一个字段之后的全部字节，热力图放在字段底色之上
+            for field_tag in ("defined_field", "undefined_field"):
+                self.output_text.tag_config(field_tag)
+                self.output_text.tag_raise(tag, field_tag)
+        
+        # 字段高亮、搜索命中和选择仍然显示在热力图之上，选择在最上层
+        existing_tags = self.output_text.tag_names()
+        for tag in ("field_highlight", "search_hit", "search_current", "selection"):
+            if tag in existing_tags:
+                self.output_text.tag_raise(tag)
+    
+    def _clear_frame_diff(self):
+        """清除对比着色"""
+        for level in range(1, frame_diff.HEAT_LEVELS + 1):
+            self.output_text.tag_remove(f"diff_heat_{level}", "1.0", tk.END)
+    
+    def _open_live_capture(self):
+        """打开实时抓包对话框，抓到的帧在后台解码并写入报文记录"""
+        LiveCaptureDialog(self.root, self.protocol_manager, on_open=self._load_logged_frame)
+    
+    def _open_frame_encoder(self):
+        """以当前报文的解析结果为初始值，修改字段后生成新报文"""
+        if not self.current_protocol:
+            messagebox.showinfo("提示", "请先解析一条匹配协议的报文")
+            return
+        if not self.protocol_manager.get_command_sample(self.current_protocol):
+            messagebox.showinfo("提示", "当前协议没有报文样本，无法作为模板")
+            return
+        
+        initial_values = {}
+        if self.raw_hex_data:
+            _, parsed_data = self.protocol_manager.decode_frame(self.raw_hex_data, record=False)
+            if parsed_data:
+                initial_values = {field.name: field.value for field in parsed_data.get('fields', [])}
+        FrameEncoderDialog(self.root, self.protocol_manager, self.current_protocol,
+                           initial_values=initial_values, on_generate=self._load_logged_frame)
+    
+    def _learn_text_encodings(self):
+        """用当前协议的样本和报文记录识别字符串字段的编码，之后按识别的编码解析"""
+        if not self.current_protocol:
+            messagebox.showinfo("提示", "请先解析一条匹配协议的报文")
+            return
+        
+        success, message = self.protocol_manager.learn_text_encodings(self.current_protocol)
+        if not success:
+            messagebox.showinfo("提示", message)
+            return
+        self.status_var.set(message)
+        if self.raw_hex_data:
+            _, parsed_data = self.protocol_manager.decode_frame(self.raw_hex_data, record=False)
+            if parsed_data:
+                self._update_parameter_table(parsed_data.get('fields', []))
+    
+    def _load_logged_frame(self, hex_data):
+        """把报文记录中的一帧载入输入区并解析"""
+        self.input_text.delete("1.0", tk.END)
+        self.input_text.insert("1.0", hex_data)
+        # 已经记录过的报文，重新解析时不再写入
+        self._run_auto_format(record=False)
+    
+    def _toggle_profile_next_action(self):
+        """开启/关闭对下一次操作的性能分析"""
+        if self.profile_next_var.get():
+            self.action_profiler.arm()
+            self.status_var.set("已开启性能分析：下一次自动格式化/识别协议/编辑器保存将被记录")
+        else:
+            self.action_profiler.disarm()
+            self.status_var.set("已关闭性能分析")
+    
+    def _on_profile_report(self, report):
+        """性能分析报告生成后的回调"""
+        # 分析只针对一次操作，完成后复位菜单勾选状态
+        self.profile_next_var.set(False)
+        self.status_var.set(f"性能分析报告已保存: {os.path.basename(report['prof_path'])}")
+        messagebox.showinfo(
+            "性能分析完成",
+            f"操作: {report['action']}\n\n"
+            f"cProfile数据: {report['prof_path']}\n"
+            f"内存分配报告: {report['alloc_path']}\n\n"
+            "请将以上文件发送给开发人员。"
+        )
         
     def _export_protocol_commands(self):
         """导出协议命令为JSON格式"""
@@ -127,7 +308,7 @@ class HexParserTool:
         try:
             filename = f"{protocol_name}_commands.json"
             with open(filename, 'w', encoding='utf-8') as f:
-                json.dump(command_data, f, ensure_ascii=False, indent=2)
+                json.dump(command_data, f, ensure_ascii=False, indent=2, default=json_default)
             messagebox.showinfo("成功", f"命令已导出到文件: {filename}")
         except Exception as e:
             messagebox.showerror("错误", f"导出命令失败: {str(e)}")
@@ -281,6 +462,9 @@ class HexParserTool:
         )
         self.radio_16bytes.pack(side=tk.LEFT, padx=3)
         
+        # 搜索栏放在底部，先pack以免被输出区域挤出窗口
+        self._create_search_bar()
+        
         self.output_text = scrolledtext.ScrolledText(
             self.output_left, width=80, height=15, font=('Courier New', 10))
         self.output_text.pack(fill=tk.BOTH, expand=True)
@@ -335,7 +519,7 @@ class HexParserTool:
     
     def _open_protocol_editor(self):
         """打开协议编辑器"""
-        ProtocolEditor(self.root, self.protocol_manager)
+        ProtocolEditor(self.root, self.protocol_manager, action_profiler=self.action_profiler)
         
         # 更新协议下拉框
         self._update_protocol_dropdown()
@@ -379,6 +563,14 @@ class HexParserTool:
     
     def _auto_format(self):
         """自动格式化数据"""
+        self.action_profiler.run("auto_format", self._run_auto_format)
+    
+    def _run_auto_format(self, record=True):
+        """执行自动格式化
+        
+        参数:
+            record (bool): 解码时是否写入报文记录
+        """
         # 获取输入文本
         raw_input = self.input_text.get(1.0, tk.END).strip()
         if not raw_input:
@@ -422,22 +614,27 @@ class HexParserTool:
             
         # 打印提取结果，帮助调试
         print(f"提取的16进制数据前20个字符: {hex_only[:20]}")
+        
+        # 先格式化显示，后续的高亮都基于格式化后的布局
+        if len(hex_only) % 2 != 0:
+            if messagebox.askyesno("警告", "16进制数据长度为奇数，是否在末尾添加'0'?"):
+                hex_only += '0'
+            else:
+                return
+                
+        self._format_by_columns(hex_only)
             
-        # 保存原始16进制数据
+        # 保存原始16进制数据，并为这份数据建立解码会话
         self.raw_hex_data = hex_only
-        
-        # 尝试提取命令ID (第4个字节，索引6-7)
-        command_id_hex = ""
-        if len(hex_only) >= 8:
-            command_id_hex = hex_only[6:8].upper()
-            print(f"提取的命令ID: {command_id_hex}")
+        self.decode_session = DecodeSession(hex_only, self.protocol_manager, record=record)
         
         # 尝试匹配协议
         protocol = None
+        parsed_data = None
         try:
             print("=" * 50)
-            print(f"尝试匹配协议，数据: {hex_only[:20]}..., 命令ID: {command_id_hex}")
-            protocol = self.protocol_manager.find_matching_protocol(hex_only)
+            print(f"尝试匹配协议，数据: {hex_only[:20]}..., 命令ID: {self.decode_session.command_id}")
+            protocol, parsed_data = self.decode_session.decode()
             print(f"匹配结果: {protocol.get('name', 'None') if protocol else 'None'}")
         except Exception as e:
             print(f"匹配协议过程中出错: {e}")
@@ -451,19 +648,7 @@ class HexParserTool:
             
             print(f"匹配到{'命令' if protocol_type == 'command' else '协议'}: {protocol_name} (ID: {protocol_id})")
             
-            # 直接解析协议数据
-            try:
-                parsed_data = self.protocol_manager.parse_protocol_data(hex_only, protocol)
-                if parsed_data and 'fields' in parsed_data:
-                    self._update_parameter_table(parsed_data['fields'])
-                else:
-                    # 使用协议的字段定义更新表格
-                    self._update_parameter_table(protocol.get('fields', []))
-            except Exception as e:
-                print(f"解析协议数据出错: {e}")
-                self.status_var.set(f"解析协议数据出错: {str(e)[:50]}")
-            
-            # 自动选择匹配到的协议
+            # 自动选择匹配到的协议，选择命令时会从会话中读取解析结果
             if protocol_type == 'command':
                 # 如果是命令，需要先选择其父协议
                 parent_name = protocol.get('protocol_name', '')
@@ -484,6 +669,10 @@ class HexParserTool:
                         self._on_protocol_selected(None)
                         self.view_template_btn.config(state=tk.NORMAL)
                         break
+            
+            # 下拉框没有选中匹配的定义时，直接显示解析结果
+            if self.current_protocol is not protocol:
+                self._show_decoded(protocol, parsed_data)
                 
             self.status_var.set(f"已匹配到{'命令' if protocol_type == 'command' else '协议'}: {protocol_name}")
         else:
@@ -496,15 +685,6 @@ class HexParserTool:
             # 更新协议下拉框，但不自动选择
             self._update_protocol_dropdown()
         
-        # 格式化显示 - 使用已格式化的文本更新显示
-        if len(hex_only) % 2 != 0:
-            if messagebox.askyesno("警告", "16进制数据长度为奇数，是否在末尾添加'0'?"):
-                hex_only += '0'
-            else:
-                return
-                
-        self._format_by_columns(hex_only)
-        
         # 启用归入按钮和识别协议按钮
         self.archive_btn.config(state=tk.NORMAL)
         self.identify_btn.config(state=tk.NORMAL)
@@ -568,7 +748,8 @@ class HexParserTool:
                     self.root,
                     hex_data,
                     self._save_protocol_callback,
-                    parent_protocol=parent_protocol
+                    parent_protocol=parent_protocol,
+                    protocol_manager=self.protocol_manager
                 )
             else:
                 messagebox.showinfo("提示", "无法获取选中的协议信息")
@@ -577,7 +758,8 @@ class HexParserTool:
             dialog = ProtocolSelectionDialog(
                 self.root,
                 hex_data,
-                self._save_protocol_callback
+                self._save_protocol_callback,
+                protocol_manager=self.protocol_manager
             )
             
             # 如果没有可选的协议，提示用户创建
@@ -678,10 +860,12 @@ class HexParserTool:
         bytes_list = [hex_data[i:i+2] for i in range(0, len(hex_data), 2)]
         bytes_per_line = self.bytes_per_line.get()
         formatted_lines = []
+        # 偏移量宽度由数据总长度决定，与高亮使用的布局一致
+        layout = HexLayout(len(bytes_list), bytes_per_line)
         
         for i in range(0, len(bytes_list), bytes_per_line):
             display_offset = i  # 直接使用字节索引作为偏移量
-            offset_str = f"{display_offset:04x}" 
+            offset_str = f"{display_offset:0{layout.offset_width}x}" 
             
             line_bytes = bytes_list[i:i+bytes_per_line]
             hex_part = ' '.join(line_bytes)
@@ -714,6 +898,88 @@ class HexParserTool:
         self.output_text.delete("1.0", tk.END)
         self.output_text.insert(tk.END, formatted_text)
         self.output_text.config(state=tk.DISABLED)
+        
+        # 记录显示布局，高亮时直接换算文本位置
+        self.hex_layout = layout
+        # 输出已重新生成，之前的搜索命中不再有效
+        self.search_cursor = None
+        self.search_result_var.set("")
+    
+    def _create_search_bar(self):
+        """创建16进制数据搜索栏"""
+        search_frame = ttk.Frame(self.output_left)
+        search_frame.pack(side=tk.BOTTOM, fill=tk.X, pady=(2, 0))
+        
+        ttk.Label(search_frame, text="搜索:").pack(side=tk.LEFT)
+        self.search_var = tk.StringVar()
+        search_entry = ttk.Entry(search_frame, textvariable=self.search_var, width=24)
+        search_entry.pack(side=tk.LEFT, padx=(5, 5))
+        search_entry.bind("<Return>", lambda e: self._search_hex())
+        search_entry.bind("<Shift-Return>", lambda e: self._search_step(-1))
+        self.root.bind("<Control-f>", lambda e: search_entry.focus_set())
+        
+        # 字节模式支持 ?? 通配符，数值按所选类型和字节序编码后查找
+        self.search_type_var = tk.StringVar(value=hex_search.BYTES_TYPE)
+        ttk.Combobox(search_frame, textvariable=self.search_type_var, state="readonly", width=7,
+                     values=[hex_search.BYTES_TYPE] + list(hex_search.VALUE_FORMATS)).pack(side=tk.LEFT)
+        self.search_endian_var = tk.StringVar(value="big")
+        ttk.Combobox(search_frame, textvariable=self.search_endian_var, state="readonly", width=6,
+                     values=["big", "little"]).pack(side=tk.LEFT, padx=(5, 5))
+        
+        ttk.Button(search_frame, text="查找", command=self._search_hex).pack(side=tk.LEFT)
+        ttk.Button(search_frame, text="上一个", command=lambda: self._search_step(-1)).pack(side=tk.LEFT)
+        ttk.Button(search_frame, text="下一个", command=lambda: self._search_step(1)).pack(side=tk.LEFT)
+        self.search_result_var = tk.StringVar(value="")
+        ttk.Label(search_frame, textvariable=self.search_result_var).pack(side=tk.LEFT, padx=(5, 0))
+        
+        self.search_cursor = None
+    
+    def _search_hex(self):
+        """在当前报文的原始字节中查找，高亮全部命中并跳到第一个"""
+        query = self.search_var.get().strip()
+        if not query or not self.raw_hex_data:
+            return
+        try:
+            hits, length = hex_search.search(bytes.fromhex(self.raw_hex_data), query,
+                                             self.search_type_var.get(), self.search_endian_var.get())
+        except ValueError as e:
+            self.search_result_var.set("")
+            messagebox.showerror("搜索", str(e))
+            return
+        
+        self.search_cursor = hex_search.SearchCursor(hits, length)
+        self.output_text.tag_remove("search_hit", "1.0", tk.END)
+        self.output_text.tag_remove("search_current", "1.0", tk.END)
+        if not hits:
+            self.search_result_var.set("未找到")
+            return
+        
+        # 所有命中合并为一次tag_add
+        layout = self._get_hex_layout()
+        ranges = []
+        for start in hits[:self.SEARCH_MAX_PAINTED]:
+            for span in layout.byte_spans(start, start + length - 1):
+                ranges.extend(span)
+        self.output_text.tag_config("search_hit", background="#CCE5FF")
+        self.output_text.tag_config("search_current", background="#3399FF", foreground="white")
+        self.output_text.tag_add("search_hit", *ranges)
+        self._search_step(1)
+    
+    def _search_step(self, direction):
+        """跳到下一个/上一个命中"""
+        if not self.search_cursor or not len(self.search_cursor):
+            return
+        hit = self.search_cursor.next() if direction > 0 else self.search_cursor.previous()
+        start_pos, end_pos = hit
+        
+        self.output_text.tag_remove("search_current", "1.0", tk.END)
+        spans = self._get_hex_layout().byte_spans(start_pos, end_pos)
+        for span in spans:
+            self.output_text.tag_add("search_current", *span)
+        if spans:
+            self.output_text.see(spans[0][0])
+        self.search_result_var.set(f"{self.search_cursor.index + 1}/{len(self.search_cursor)}")
+        self.status_var.set(f"命中位置: {start_pos}-{end_pos}")
     
     def _on_mouse_down(self, event):
         """处理鼠标按下事件"""
@@ -726,22 +992,23 @@ class HexParserTool:
         
         # 检查是否点击在有效区域
         line_text = self.output_text.get(f"{line}.0", f"{line}.end")
-        if ":" not in line_text or col <= 5:
+        hex_start = self._get_hex_layout().hex_start_col
+        if ":" not in line_text or col < hex_start:
             self.output_text.config(state=tk.DISABLED)
             return
             
         # 检查点击位置是否在十六进制部分
         bytes_per_line = self.bytes_per_line.get()
-        hex_part_end = 6 + bytes_per_line * 3  # 偏移量(5) + :(1) + 每个字节3个字符
+        hex_part_end = hex_start + bytes_per_line * 3  # 偏移量 + ": " + 每个字节3个字符
         
-        if col >= 6 and col < hex_part_end:
+        if col >= hex_start and col < hex_part_end:
             # 计算字节偏移量（每个字节占用3个字符：两个16进制数字+1个空格）
-            # 减去行首偏移量（通常是6，如 "0000: "）
-            col_offset = col - 6
+            # 减去行首偏移量（如 "0000: "，数据超过64KB时偏移量更宽）
+            col_offset = col - hex_start
             
             # 确保光标在字节范围内（而不是在字节之间的空格上）
             byte_index = col_offset // 3  # 计算是第几个字节
-            byte_pos = byte_index * 3 + 6  # 计算字节的开始位置
+            byte_pos = byte_index * 3 + hex_start  # 计算字节的开始位置
             
             # 只有当点击在字节上而不是空格上才处理
             if col - byte_pos <= 2:  # 只选择当实际点击在字节的两个字符上
@@ -780,7 +1047,7 @@ class HexParserTool:
             byte_index = col - ascii_start_index
             if byte_index < bytes_per_line:
                 # 计算对应的十六进制部分位置
-                byte_pos = byte_index * 3 + 6
+                byte_pos = byte_index * 3 + hex_start
                 
                 self.selection_start = (line, byte_pos)
                 self.selection_end = (line, byte_pos + 2)
@@ -821,18 +1088,19 @@ class HexParserTool:
         
         # 检查是否在有效区域
         line_text = self.output_text.get(f"{line}.0", f"{line}.end")
-        if ":" not in line_text or col <= 5:
+        hex_start = self._get_hex_layout().hex_start_col
+        if ":" not in line_text or col < hex_start:
             return
             
         bytes_per_line = self.bytes_per_line.get()
-        hex_part_end = 6 + bytes_per_line * 3
+        hex_part_end = hex_start + bytes_per_line * 3
         
         # 检查是否在十六进制部分拖动
-        if col >= 6 and col < hex_part_end:
+        if col >= hex_start and col < hex_part_end:
             # 计算字节位置
-            col_offset = col - 6
+            col_offset = col - hex_start
             byte_index = col_offset // 3
-            byte_pos = byte_index * 3 + 6
+            byte_pos = byte_index * 3 + hex_start
             
             # 确保点击在字节上而不是空格上
             if col - byte_pos <= 2:
@@ -851,7 +1119,7 @@ class HexParserTool:
             byte_index = col - ascii_start_index
             if byte_index < bytes_per_line:
                 # 计算对应的十六进制部分位置
-                byte_pos = byte_index * 3 + 6
+                byte_pos = byte_index * 3 + hex_start
                 
                 # 更新结束位置
                 self.selection_end = (line, byte_pos + 2)
@@ -900,6 +1168,7 @@ class HexParserTool:
         self.output_text.tag_remove("selection", "1.0", tk.END)
         
         bytes_per_line = self.bytes_per_line.get()
+        hex_start = self._get_hex_layout().hex_start_col
         
         # 处理跨行选择
         if start_line == end_line:
@@ -913,9 +1182,9 @@ class HexParserTool:
             
             if ascii_start_index > 0:
                 # 计算所选字节对应的ASCII起始和结束索引
-                start_byte_index = (start_col - 6) // 3
-                end_byte_index = (end_col - 6) // 3
-                if (end_col - 6) % 3 == 0:
+                start_byte_index = (start_col - hex_start) // 3
+                end_byte_index = (end_col - hex_start) // 3
+                if (end_col - hex_start) % 3 == 0:
                     end_byte_index -= 1
                 
                 # 高亮ASCII部分
@@ -933,15 +1202,15 @@ class HexParserTool:
                 if line == start_line:
                     # 第一行从起始位置到行尾
                     first_byte_col = start_col
-                    last_byte_col = 6 + (bytes_per_line - 1) * 3 + 2  # 行中最后一个字节的结束位置
+                    last_byte_col = hex_start + (bytes_per_line - 1) * 3 + 2  # 行中最后一个字节的结束位置
                 elif line == end_line:
                     # 最后一行从行首到结束位置
-                    first_byte_col = 6
+                    first_byte_col = hex_start
                     last_byte_col = end_col
                 else:
                     # 中间行完全选择
-                    first_byte_col = 6
-                    last_byte_col = 6 + (bytes_per_line - 1) * 3 + 2
+                    first_byte_col = hex_start
+                    last_byte_col = hex_start + (bytes_per_line - 1) * 3 + 2
                     
                 # 高亮十六进制部分
                 self.output_text.tag_add("selection", f"{line}.{first_byte_col}", f"{line}.{last_byte_col}")
@@ -951,9 +1220,9 @@ class HexParserTool:
                 
                 if ascii_start_index > 0:
                     # 计算当前行十六进制部分对应的字节范围
-                    start_byte_index = (first_byte_col - 6) // 3
-                    end_byte_index = (last_byte_col - 6) // 3
-                    if (last_byte_col - 6) % 3 == 0:
+                    start_byte_index = (first_byte_col - hex_start) // 3
+                    end_byte_index = (last_byte_col - hex_start) // 3
+                    if (last_byte_col - hex_start) % 3 == 0:
                         end_byte_index -= 1
                     
                     # 限制字节索引不超过每行显示的字节数
@@ -1024,8 +1293,8 @@ class HexParserTool:
             
             # 计算起始位置和结束位置对应的实际字节偏移
             if start_line <= len(line_offsets):
-                # 计算当前行内的偏移量，考虑十六进制部分的开始位置（通常在第6列）
-                hex_start_col = 6  # 默认十六进制部分从第6列开始
+                # 计算当前行内的偏移量，考虑十六进制部分的开始位置
+                hex_start_col = self._get_hex_layout().hex_start_col
                 # 检查当前行，确定实际的十六进制起始列
                 if start_line <= len(all_lines):
                     line_text = all_lines[start_line - 1]
@@ -1047,7 +1316,7 @@ class HexParserTool:
             
             if end_line <= len(line_offsets):
                 # 对结束位置也做同样处理
-                hex_start_col = 6
+                hex_start_col = self._get_hex_layout().hex_start_col
                 if end_line <= len(all_lines):
                     line_text = all_lines[end_line - 1]
                     if ":" in line_text:
@@ -1083,6 +1352,9 @@ class HexParserTool:
         """字节数选择改变时重新格式化"""
         if self.raw_hex_data:
             self._format_by_columns(self.raw_hex_data)
+            # 布局变化后重新显示当前定义的字段区域
+            if self.current_protocol:
+                self._highlight_defined_fields(self.current_protocol, self.raw_hex_data)
             self.status_var.set(f"已重新格式化为每行{self.bytes_per_line.get()}字节")
     
     def _copy_result(self):
@@ -1121,12 +1393,12 @@ class HexParserTool:
         
         self.raw_hex_data = ""
         self.offset = 0
+        self.decode_session = None
+        self.hex_layout = None
         
         # 清除当前选择的协议
-        if hasattr(self, 'current_protocol'):
-            delattr(self, 'current_protocol')
-        if hasattr(self, 'current_protocol_key'):
-            delattr(self, 'current_protocol_key')
+        self.current_protocol = None
+        self.current_protocol_key = None
             
         # 重置下拉框选择
         if hasattr(self, 'protocol_dropdown') and self.protocol_dropdown['state'] != tk.DISABLED:
@@ -1222,10 +1494,10 @@ class HexParserTool:
         self.command_var.set('')
         
         if commands:
-            # 从原始数据中提取当前报文的命令ID
-            current_command_id = ""
-            if self.raw_hex_data and len(self.raw_hex_data) >= 8:
-                current_command_id = self.raw_hex_data[6:8].upper()  # 第4个字节(索引6-7)是ID
+            # 从解码会话中获取当前报文的命令ID
+            session = self._get_decode_session()
+            current_command_id = session.command_id if session else ""
+            if current_command_id:
                 print(f"当前报文的命令ID: {current_command_id}")
             
             # 将命令按名称排序，只保留与当前报文ID匹配的命令
@@ -1254,9 +1526,9 @@ class HexParserTool:
             
             print(f"找到匹配当前报文ID的命令数量: {len(command_values)}")
             
-            # 如果有命令，自动选择第一个
+            # 如果有命令，优先选择会话匹配到的命令，否则选择第一个
             if command_values:
-                self.command_var.set(command_values[0])
+                self.command_var.set(self._preferred_command_value(command_values, session))
                 self._on_command_selected(None)  # 触发命令选择事件
     
     def _on_command_selected(self, event):
@@ -1365,10 +1637,6 @@ class HexParserTool:
         # 启用定义字段按钮
         self.define_field_btn.config(state=tk.NORMAL)
         
-        # 更新参数表格
-        if 'fields' in command_data:
-            self._update_parameter_table(command_data.get('fields', []))
-        
         # 为新选择的命令添加灰色高光 (defined_field)
         if self.raw_hex_data and 'fields' in command_data and command_data['fields']:
             print("为新选择的命令添加灰色高光")
@@ -1376,8 +1644,8 @@ class HexParserTool:
         
         # 应用命令模板解析当前数据
         if self.raw_hex_data and 'fields' in command_data:
-            # 使用命令模板解析当前数据
-            parsed_data = self.protocol_manager.parse_protocol_data(self.raw_hex_data, command_data)
+            # 从解码会话获取解析结果，匹配时已解析过的命令不会再次解析
+            parsed_data = self._get_decode_session().parse_with(command_data)
             if parsed_data and 'fields' in parsed_data:
                 # 更新参数表格显示解析结果
                 self._update_parameter_table(parsed_data.get('fields', []))
@@ -1387,6 +1655,9 @@ class HexParserTool:
                 self._update_parameter_table(command_data.get('fields', []))
                 self.status_var.set(f"无法解析当前数据，显示字段定义")
         else:
+            # 没有数据可解析时显示命令的字段定义
+            if 'fields' in command_data:
+                self._update_parameter_table(command_data.get('fields', []))
             if not self.raw_hex_data:
                 self.status_var.set("请先格式化数据再应用命令模板")
             elif 'fields' not in command_data or not command_data['fields']:
@@ -1400,7 +1671,8 @@ class HexParserTool:
             if messagebox.askyesno("提示", f"协议/命令 '{protocol_name}' 没有定义字段，是否打开编辑器定义字段？"):
                 # 打开协议编辑器
                 protocol_key = f"{protocol.get('group', '')}/{protocol.get('protocol_id_hex', '')}"
-                dialog = ProtocolEditor(self.root, self.protocol_manager, protocol_key)
+                dialog = ProtocolEditor(self.root, self.protocol_manager, protocol_key,
+                                        action_profiler=self.action_profiler)
                 # 等待编辑器关闭后重新尝试解析
                 self.root.wait_window(dialog)
                 # 重新获取协议数据
@@ -1413,7 +1685,8 @@ class HexParserTool:
             return
             
         # 解析协议数据
-        result = self.protocol_manager.parse_protocol_data(hex_data, protocol)
+        session = self._get_decode_session(hex_data)
+        result = session.parse_with(protocol) if session else None
         if not result:
             messagebox.showinfo("提示", "解析协议数据失败，请检查协议定义。")
             print(f"解析协议数据失败: {protocol.get('name', '')}")
@@ -1455,6 +1728,10 @@ class HexParserTool:
 
     def _identify_protocol(self):
         """识别协议按钮事件处理"""
+        self.action_profiler.run("identify_protocol", self._run_identify_protocol)
+    
+    def _run_identify_protocol(self):
+        """执行协议识别"""
         if not self.raw_hex_data:
             messagebox.showinfo("提示", "请先格式化数据")
             return
@@ -1466,15 +1743,14 @@ class HexParserTool:
         # 备份原始数据，避免后续操作修改它
         self.original_hex_data = self.raw_hex_data
         
-        # 尝试提取命令ID
-        command_id = ""
-        if len(self.raw_hex_data) >= 8:
-            command_id = self.raw_hex_data[6:8].upper()
-            print(f"提取的命令ID: {command_id}")
+        # 使用当前数据的解码会话，自动格式化时已匹配过的数据不会重新匹配
+        session = self._get_decode_session()
+        print(f"提取的命令ID: {session.command_id}")
             
         # 尝试自动匹配协议或命令
+        parsed_data = None
         try:
-            matched = self.protocol_manager.find_matching_protocol(self.raw_hex_data)
+            matched, parsed_data = session.decode()
             if matched:
                 print(f"匹配成功: {matched.get('name', '')}, 类型: {matched.get('type', '')}")
             else:
@@ -1518,22 +1794,13 @@ class HexParserTool:
                         break
             
             # 解析并显示命令数据 - 不弹出定义字段提示
-            try:
-                # 如果命令没有字段定义，直接更新参数表格，不提示
-                if not matched.get('fields'):
-                    self._update_parameter_table([])
-                    self._highlight_defined_fields(matched, self.raw_hex_data)
-                else:
-                    # 解析数据并更新UI
-                    parsed_data = self.protocol_manager.parse_protocol_data(self.raw_hex_data, matched)
-                    if parsed_data and 'fields' in parsed_data:
-                        self._update_parameter_table(parsed_data.get('fields', []))
-                    else:
-                        self._update_parameter_table(matched.get('fields', []))
-                    self._highlight_defined_fields(matched, self.raw_hex_data)
-            except Exception as e:
-                print(f"解析命令数据出错: {e}")
-                messagebox.showerror("错误", f"解析命令数据出错: {str(e)}")
+            # 选择命令时已经显示过同一解析结果的，不再重复显示
+            if self.current_protocol is not matched:
+                try:
+                    self._show_decoded(matched, parsed_data)
+                except Exception as e:
+                    print(f"解析命令数据出错: {e}")
+                    messagebox.showerror("错误", f"解析命令数据出错: {str(e)}")
                 
             self.status_var.set(f"已识别命令: {protocol_name} (ID: 0x{command_id_hex})")
         else:
@@ -1551,18 +1818,7 @@ class HexParserTool:
                 
             # 解析并显示协议数据 - 不弹出定义字段提示
             try:
-                # 如果协议没有字段定义，直接更新参数表格，不提示
-                if not matched.get('fields'):
-                    self._update_parameter_table([])
-                    self._highlight_defined_fields(matched, self.raw_hex_data)
-                else:
-                    # 解析数据并更新UI
-                    parsed_data = self.protocol_manager.parse_protocol_data(self.raw_hex_data, matched)
-                    if parsed_data and 'fields' in parsed_data:
-                        self._update_parameter_table(parsed_data.get('fields', []))
-                    else:
-                        self._update_parameter_table(matched.get('fields', []))
-                    self._highlight_defined_fields(matched, self.raw_hex_data)
+                self._show_decoded(matched, parsed_data)
             except Exception as e:
                 print(f"解析协议数据出错: {e}")
                 messagebox.showerror("错误", f"解析协议数据出错: {str(e)}")
@@ -1572,6 +1828,45 @@ class HexParserTool:
         # 启用查看模板按钮
         self.view_template_btn.config(state=tk.NORMAL)
 
+    def _get_decode_session(self, hex_data=None):
+        """获取数据对应的解码会话，数据变化时新建会话"""
+        if hex_data is None:
+            hex_data = self.raw_hex_data
+        if not hex_data:
+            return None
+        if self.decode_session is None or not self.decode_session.matches(hex_data):
+            self.decode_session = DecodeSession(hex_data, self.protocol_manager)
+        return self.decode_session
+    
+    def _get_hex_layout(self):
+        """获取当前输出区域的显示布局（例如恢复会话后尚未重新格式化时按当前设置计算）"""
+        byte_count = len(self.raw_hex_data) // 2
+        bytes_per_line = self.bytes_per_line.get()
+        if (self.hex_layout is None or self.hex_layout.byte_count != byte_count or
+                self.hex_layout.bytes_per_line != bytes_per_line):
+            self.hex_layout = HexLayout(byte_count, bytes_per_line)
+        return self.hex_layout
+    
+    def _preferred_command_value(self, command_values, session):
+        """在命令下拉框的选项中找到会话匹配到的命令，没有时返回第一项"""
+        matched = session.protocol if session else None
+        if matched:
+            display_name = f"{matched.get('name', '')} (0x{matched.get('protocol_id_hex', '').upper()})"
+            if display_name in command_values:
+                return display_name
+        return command_values[0]
+    
+    def _show_decoded(self, protocol, parsed_data):
+        """显示解码结果：更新参数表格并高亮已定义的字段"""
+        if not protocol.get('fields'):
+            # 没有字段定义，直接清空参数表格，不提示
+            self._update_parameter_table([])
+        elif parsed_data and 'fields' in parsed_data:
+            self._update_parameter_table(parsed_data.get('fields', []))
+        else:
+            self._update_parameter_table(protocol.get('fields', []))
+        self._highlight_defined_fields(protocol, self.raw_hex_data)
+    
     def _highlight_defined_fields(self, protocol, hex_data):
         """高亮显示已定义的字段区域"""
         if not protocol or 'fields' not in protocol or not protocol.get('fields'):
@@ -1580,79 +1875,43 @@ class HexParserTool:
         # 清除之前的高亮
         self.output_text.config(state=tk.NORMAL)
         self.output_text.tag_remove("defined_field", "1.0", tk.END)
-        
-        # 遍历协议中的所有字段
-        for field in protocol.get('fields', []):
-            start_pos = field.get('start_pos', 0)
-            end_pos = field.get('end_pos', 0)
-            
-            if start_pos is None or end_pos is None or start_pos > end_pos:
-                continue
-                
-            # 获取所有可见行的文本内容，提取每行的偏移量
-            bytes_per_line = self.bytes_per_line.get()
-            all_lines = self.output_text.get("1.0", tk.END).split('\n')
-            line_offsets = []
-            
-            for i, line_text in enumerate(all_lines):
-                if i >= len(all_lines) - 1:  # 忽略最后一个可能为空的行
-                    break
-                    
-                if ":" in line_text:
-                    offset_part = line_text.split(':', 1)[0].strip()
-                    try:
-                        offset = int(offset_part, 16)
-                        line_offsets.append((i+1, offset))  # 存储行号和偏移量
-                    except ValueError:
-                        continue
-            
-            # 找出字段对应的文本位置并高亮
-            for line_num, offset in line_offsets:
-                line_text = all_lines[line_num-1]
-                
-                # 检查这一行是否包含字段的部分
-                line_start = offset
-                line_end = offset + bytes_per_line - 1
-                
-                # 判断字段与当前行是否有交集
-                if not (end_pos < line_start or start_pos > line_end):
-                    # 计算这一行中需要高亮的字节范围
-                    highlight_start = max(start_pos, line_start)
-                    highlight_end = min(end_pos, line_end)
-                    
-                    # 转换为行内偏移量
-                    line_byte_start = highlight_start - line_start
-                    line_byte_end = highlight_end - line_start
-                    
-                    # 计算文本位置 - 包括字节之间的空格
-                    # 对于开始位置，确保从字节的起始位置开始
-                    text_start_col = 6 + line_byte_start * 3  # 每个字节占3列（2个字符+1个空格）
-                    
-                    # 对于结束位置，确保包含最后一个字节后的空格(如果有的话)
-                    # 如果是行尾最后一个字节，就不加额外空格
-                    is_last_byte_in_line = (line_byte_end == bytes_per_line - 1)
-                    text_end_col = 6 + line_byte_end * 3 + (2 if is_last_byte_in_line else 3)
-                    
-                    # 添加高亮标签
-                    text_start = f"{line_num}.{text_start_col}"
-                    text_end = f"{line_num}.{text_end_col}"
-                    
-                    # 高亮十六进制部分
-                    self.output_text.tag_add("defined_field", text_start, text_end)
-                    
-                    # 高亮ASCII部分
-                    ascii_start_index = line_text.find('|') + 1
-                    if ascii_start_index > 0:
-                        ascii_start = f"{line_num}.{ascii_start_index + line_byte_start}"
-                        ascii_end = f"{line_num}.{ascii_start_index + line_byte_end + 1}"
-                        self.output_text.tag_add("defined_field", ascii_start, ascii_end)
-            
-        # 配置高亮样式 - 使用淡灰色背景
+        self.output_text.tag_remove("undefined_field", "1.0", tk.END)
+        
+        # 分支布局、含变长字段/记录组的定义按本帧解析出的实际位置高亮
+        parsed_fields = None
+        if hex_data and self.protocol_manager.has_dynamic_layout(protocol):
+            # 通过解码会话取解析结果，本次操作中已经解析过时不再重复解析
+            parsed_data = self._get_decode_session(hex_data).parse_with(protocol)
+            if parsed_data:
+                parsed_fields = [item for field in parsed_data['fields'] for item in expand_records(field)]
+        
+        # 按字节覆盖图高亮：重叠的字段合并为一个区间，每种标签只调用一次tag_add；
+        # 第一个字段之后没有字段解释的字节单独标出
+        length = len(hex_data) // 2 if hex_data else 0
+        runs = self.protocol_manager.get_field_coverage(protocol, length, parsed_fields)
+        layout = self._get_hex_layout()
+        ranges = {"defined_field": [], "undefined_field": []}
+        for start_pos, end_pos, defined in runs:
+            tag_ranges = ranges["defined_field" if defined else "undefined_field"]
+            for spans in layout.byte_spans(start_pos, end_pos):
+                tag_ranges.extend(spans)
+        for tag, tag_ranges in ranges.items():
+            if tag_ranges:
+                self.output_text.tag_add(tag, *tag_ranges)
+        
+        undefined_runs = [(start_pos, end_pos) for start_pos, end_pos, defined in runs if not defined]
+        if undefined_runs:
+            undefined_count = sum(end_pos - start_pos + 1 for start_pos, end_pos in undefined_runs)
+            self.status_var.set(f"未定义字节: {undefined_count} 个，共 {len(undefined_runs)} 段")
+            
+        # 配置高亮样式 - 已定义使用淡灰色背景，未定义使用淡黄色背景
         self.output_text.tag_config("defined_field", background="#E5E5E5")
+        self.output_text.tag_config("undefined_field", background="#FFF4CC")
         
         # 安全地尝试提升selection标签的优先级
         try:
             self.output_text.tag_raise("selection", "defined_field")
+            self.output_text.tag_raise("selection", "undefined_field")
         except Exception:
             pass
         
@@ -1753,6 +2012,11 @@ class HexParserTool:
                         'endian': field_data.get('endian', 'little')
                     }
                     
+                    # 位字段的位偏移和位宽
+                    for key in ('bit_offset', 'bit_width'):
+                        if key in field_data:
+                            complete_field_data[key] = field_data[key]
+                    
                     # 使用update_protocol_field方法添加字段
                     success, message = self.protocol_manager.update_protocol_field(
                         command_key, 
@@ -1851,7 +2115,8 @@ class HexParserTool:
             return
         
         # 打开协议编辑器，显示选中的协议
-        ProtocolEditor(self.root, self.protocol_manager, self.current_protocol_key)
+        ProtocolEditor(self.root, self.protocol_manager, self.current_protocol_key,
+                       action_profiler=self.action_profiler)
 
     def _generate_protocol_doc(self):
         """生成协议文档"""
@@ -1862,7 +2127,7 @@ class HexParserTool:
         # 创建协议选择对话框
         dialog = tk.Toplevel(self.root)
         dialog.title("生成协议文档")
-        dialog.geometry("400x300")
+        dialog.geometry("400x360")
         dialog.transient(self.root)
         dialog.grab_set()
         
@@ -1922,29 +2187,52 @@ class HexParserTool:
                             protocol_key = key
                             break
                 
-                # 生成文档
-                success, message = self.protocol_manager.generate_protocol_doc(protocol_key, output_format)
-                
-                dialog.destroy()
-                
-                if success:
-                    messagebox.showinfo("成功", message)
-                else:
-                    messagebox.showerror("错误", message)
+                # 在后台生成文档，对话框显示进度
+                job = self.protocol_manager.start_protocol_doc_job(protocol_key, output_format)
+                generate_button.config(state=tk.DISABLED)
+                progress_bar.pack(fill=tk.X, pady=(0, 5))
+                progress_label.pack(anchor=tk.W)
+                poll_job(job)
             except Exception as e:
                 dialog.destroy()
                 messagebox.showerror("错误", f"生成文档时出错: {str(e)}")
+
+        def poll_job(job):
+            """定时读取后台任务的进度，完成后显示结果"""
+            if not dialog.winfo_exists():
+                return
+            done, total, text = job.progress
+            progress_bar.config(maximum=max(total, 1), value=done)
+            progress_label.config(text=text)
+
+            if not job.is_done():
+                dialog.after(100, poll_job, job)
+                return
+
+            dialog.destroy()
+            success, message = job.result
+            if success:
+                messagebox.showinfo("成功", message)
+            else:
+                messagebox.showerror("错误", message)
+
+        # 进度区域，开始生成后显示
+        progress_frame = ttk.Frame(dialog, padding=10)
+        progress_frame.pack(fill=tk.X, expand=False)
+        progress_bar = ttk.Progressbar(progress_frame, mode="determinate")
+        progress_label = ttk.Label(progress_frame, text="")
         
         # 按钮区域
         button_frame = ttk.Frame(dialog, padding=10)
         button_frame.pack(side=tk.BOTTOM, fill=tk.X)
         
-        ttk.Button(
-            button_frame, 
-            text="生成文档", 
+        generate_button = ttk.Button(
+            button_frame,
+            text="生成文档",
             command=on_generate,
             width=15
-        ).pack(side=tk.RIGHT, padx=5)
+        )
+        generate_button.pack(side=tk.RIGHT, padx=5)
         
         ttk.Button(
             button_frame, 
@@ -1996,9 +2284,38 @@ class HexParserTool:
         except Exception as e:
             print(f"恢复数据失败: {e}")
             
+    def _poll_protocol_changes(self):
+        """检查协议目录的变化，增量重新加载后刷新协议和命令下拉框"""
+        try:
+            reloaded = self.protocol_watcher.poll()
+            if reloaded:
+                # 刷新下拉框，并尽量保留当前选择
+                selected_protocol = self.protocol_var.get()
+                selected_command = self.command_var.get()
+                
+                self._update_protocol_dropdown()
+                if selected_protocol in self.protocol_dropdown['values']:
+                    self.protocol_var.set(selected_protocol)
+                    self._update_command_combo()
+                    if selected_command in self.command_dropdown['values']:
+                        self.command_var.set(selected_command)
+                
+                names = ", ".join(os.path.basename(path) for path in reloaded)
+                self.status_var.set(f"协议文件已更新: {names}")
+        except Exception as e:
+            print(f"检查协议文件变化失败: {e}")
+        
+        self.root.after(self.PROTOCOL_POLL_INTERVAL, self._poll_protocol_changes)
+    
     def _on_closing(self):
         """窗口关闭事件处理"""
         self._save_data()
+        if self.protocol_watcher is not None:
+            self.protocol_watcher.close()
+        if self.protocol_store is not None:
+            self.protocol_store.close()
+        self.column_store.close()
+        self.frame_log.close()
         self.root.destroy()
 
     def _update_parameter_table(self, fields):
@@ -2012,7 +2329,8 @@ class HexParserTool:
             ttk.Label(self.parameter_frame, text="暂无字段定义").grid(row=0, column=0, sticky="nsew")
             return
         
-        # 按照起始位置从小到大排序字段
+        # 记录组展开为逐条记录的字段，按照起始位置从小到大排序字段
+        fields = [item for field in fields for item in expand_records(field)]
         sorted_fields = sorted(fields, key=lambda f: f.get('start_pos', 0))
             
         # 创建表格标题
@@ -2067,6 +2385,8 @@ class HexParserTool:
             # 为每个单元格添加点击事件
             for label in row_labels:
                 label.bind("<Button-1>", lambda e, f=field_info: self._on_parameter_click(f))
+                # 双击查看该字段在历史报文中的变化曲线
+                label.bind("<Double-1>", lambda e, f=field_info: self._open_field_plot(f))
             
         # 配置网格权重
         for i in range(len(headers)):
@@ -2089,6 +2409,29 @@ class HexParserTool:
         # 更新状态栏
         self.status_var.set(f"已选择字段: {field_name} (位置: {start_pos}-{end_pos})")
     
+    def _open_field_plot(self, field_info):
+        """打开字段时序曲线，显示该字段在记录的报文中的取值变化"""
+        if not self.current_protocol:
+            messagebox.showinfo("提示", "请先解析一条匹配协议的报文")
+            return
+        field_name = field_info.get('name', '')
+        field = next((f for f in self.current_protocol.get('fields', []) if f.get('name') == field_name), None)
+        if field is None:
+            return
+        
+        self.status_var.set(f"正在读取字段 {field_name} 的历史数据...")
+        self.root.update_idletasks()
+        values, timestamps = load_field_series(self.protocol_manager, self.current_protocol, field,
+                                               frame_log=self.frame_log, column_store=self.column_store)
+        if not values:
+            self.status_var.set(f"字段 {field_name} 没有可绘制的数值")
+            messagebox.showinfo("提示", f"报文记录中没有字段 {field_name} 的数值数据")
+            return
+        
+        protocol_name = self.current_protocol.get('name', '')
+        FieldPlotWindow(self.root, f"{protocol_name} - {field_name}", values, timestamps)
+        self.status_var.set(f"字段 {field_name}: 共 {len(values)} 帧")
+    
     def _highlight_field_in_output(self, start_pos, end_pos, field_name=""):
         """在输出文本中高亮显示指定位置的字段"""
         if not self.raw_hex_data:
@@ -2108,80 +2451,14 @@ class HexParserTool:
             self.output_text.config(state=tk.DISABLED)
             return
             
-        # 获取所有可见行的文本内容，提取每行的偏移量
-        bytes_per_line = self.bytes_per_line.get()
-        all_lines = self.output_text.get("1.0", tk.END).split('\n')
-        line_offsets = []
-        
-        for i, line_text in enumerate(all_lines):
-            if i >= len(all_lines) - 1:  # 忽略最后一个可能为空的行
-                break
-                
-            if ":" in line_text:
-                offset_part = line_text.split(':', 1)[0].strip()
-                try:
-                    # 16进制偏移量转换为十进制
-                    offset = int(offset_part, 16)
-                    line_offsets.append((i+1, offset))  # 存储行号和偏移量
-                except ValueError:
-                    continue
-        
-        # 找出字段对应的文本位置并高亮
+        # 按显示布局换算字段对应的文本位置并高亮
         highlighted = False
         
-        for line_num, offset in line_offsets:
-            line_text = all_lines[line_num-1]
-            
-            # 检查这一行是否包含字段的部分
-            line_start = offset
-            line_end = offset + bytes_per_line - 1
-            
-            # 判断字段与当前行是否有交集
-            if not (end_pos < line_start or start_pos > line_end):
-                # 计算这一行中需要高亮的字节范围
-                highlight_start = max(start_pos, line_start)
-                highlight_end = min(end_pos, line_end)
-                
-                # 转换为行内偏移量
-                line_byte_start = highlight_start - line_start
-                line_byte_end = highlight_end - line_start
-                
-                # 计算文本位置
-                # 考虑到每行的格式是: "0000: 00 11 22 33 | ...."
-                # 其中6是偏移量后面的": "和一个空格的长度
-                offset_and_space_len = len(f"{offset:04X}: ")  # 计算实际的偏移量字符串长度
-                
-                # 考虑每个字节占3列（2个16进制字符 + 1个空格）
-                text_start_col = offset_and_space_len + line_byte_start * 3
-                
-                # 对于最后一个字节，不要包含后面的空格
-                if line_byte_end == bytes_per_line - 1:
-                    text_end_col = offset_and_space_len + line_byte_end * 3 + 2
-                else:
-                    text_end_col = offset_and_space_len + line_byte_end * 3 + 3
-                
-                # 高亮显示十六进制部分
-                text_start = f"{line_num}.{text_start_col}"
-                text_end = f"{line_num}.{text_end_col}"
-                
-                print(f"添加高亮: 行 {line_num}, 列 {text_start_col}-{text_end_col}")
-                self.output_text.tag_add("field_highlight", text_start, text_end)
-                
-                # 查找ASCII部分的起始位置
-                pipe_index = line_text.find('|')
-                if pipe_index > 0:
-                    # 计算ASCII部分起始位置
-                    ascii_start_col = pipe_index + 2  # | 后面有一个空格
-                    
-                    # 计算ASCII部分中需要高亮的字符位置
-                    # 修复：ASCII部分高亮偏移问题，将起始位置向前移一位
-                    ascii_start = f"{line_num}.{ascii_start_col + line_byte_start - 1}"  # 减1修复偏移
-                    ascii_end = f"{line_num}.{ascii_start_col + line_byte_end}"  # 去掉+1修复结束偏移
-                    
-                    print(f"添加ASCII高亮: 行 {line_num}, 列 {ascii_start_col + line_byte_start - 1}-{ascii_start_col + line_byte_end}")
-                    self.output_text.tag_add("field_highlight", ascii_start, ascii_end)
-                
-                highlighted = True
+        for hex_start, hex_end, ascii_start, ascii_end in self._get_hex_layout().byte_spans(start_pos, end_pos):
+            # 高亮显示十六进制部分和ASCII部分
+            self.output_text.tag_add("field_highlight", hex_start, hex_end)
+            self.output_text.tag_add("field_highlight", ascii_start, ascii_end)
+            highlighted = True
         
         # 配置高亮样式 - 使用醒目的背景色和文本颜色
         self.output_text.tag_config("field_highlight", background="#FFFF00", foreground="#000000")
@@ -2227,10 +2504,10 @@ class HexParserTool:
         self.command_var.set('')
             
         if commands:
-            # 从原始数据中提取当前报文的命令ID
-            current_command_id = ""
-            if self.raw_hex_data and len(self.raw_hex_data) >= 8:
-                current_command_id = self.raw_hex_data[6:8].upper()  # 第4个字节(索引6-7)是ID
+            # 从解码会话中获取当前报文的命令ID
+            session = self._get_decode_session()
+            current_command_id = session.command_id if session else ""
+            if current_command_id:
                 print(f"当前报文的命令ID: {current_command_id}")
             
             # 将命令按名称排序，只保留与当前报文ID匹配的命令
@@ -2259,9 +2536,9 @@ class HexParserTool:
             
             print(f"找到匹配当前报文ID的命令数量: {len(command_values)}")
             
-            # 如果有命令，自动选择第一个
+            # 如果有命令，优先选择会话匹配到的命令，否则选择第一个
             if command_values:
-                self.command_var.set(command_values[0])
+                self.command_var.set(self._preferred_command_value(command_values, session))
                 self._on_command_selected(None)  # 触发命令选择事件
 
     def _import_json_dialog(self):
@@ -2327,6 +2604,8 @@ class HexParserTool:
         pass
 
 if __name__ == "__main__":
+    # 打包后生成文档的工作进程需要
+    multiprocessing.freeze_support()
     root = tk.Tk()
     app = HexParserTool(root)
     root.iconbitmap('2.ico')
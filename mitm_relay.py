@@ -0,0 +1,356 @@
+# mitm_relay.py - 透明转发与往返时延统计模块
+import asyncio
+import queue
+import threading
+import time
+from collections import deque, namedtuple
+
+from framing import FrameAssembler
+
+DIRECTION_TO_SERVER = 'client->server'
+DIRECTION_TO_CLIENT = 'server->client'
+
+BUFFER_SIZE = 65536
+LATENCY_SAMPLES = 10000       # 每个命令保留的最近时延样本数
+PERCENTILES = (50, 90, 99)
+
+Exchange = namedtuple('Exchange', 'connection command_id reply_id pair_value latency_ms')
+
+
+class _RelayProtocol(asyncio.BufferedProtocol):
+    """一个方向的转发：数据收进预分配的缓冲区，复制一次后写给对端，不做解析"""
+
+    def __init__(self, relay, connection_id, direction):
+        self.relay = relay
+        self.connection_id = connection_id
+        self.direction = direction
+        self.buffer = bytearray(BUFFER_SIZE)
+        self.view = memoryview(self.buffer)
+        self.transport = None
+        self.peer = None
+        self._pending = bytearray()  # 对端连接建立前收到的数据
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def get_buffer(self, sizehint):
+        return self.view
+
+    def buffer_updated(self, nbytes):
+        # transport写不完时会直接引用传入的数据排队（Python 3.12起不复制），
+        # 接收缓冲区下次读取就会被覆盖，所以转发前复制一份；这份副本同时交给解码线程
+        data = bytes(self.view[:nbytes])
+        if self.peer is not None and self.peer.transport is not None:
+            self.peer.transport.write(data)
+        else:
+            self._pending += data
+        self.relay._tap(self.connection_id, self.direction, data)
+
+    def attach(self, peer):
+        """对端连接建立后开始转发"""
+        self.peer = peer
+        if self._pending:
+            peer.transport.write(self._pending)
+            self._pending = bytearray()
+
+    # 对端写缓冲区过高时暂停读取，把背压传递给发送方
+    def pause_writing(self):
+        if self.peer is not None and self.peer.transport is not None:
+            self.peer.transport.pause_reading()
+
+    def resume_writing(self):
+        if self.peer is not None and self.peer.transport is not None:
+            self.peer.transport.resume_reading()
+
+    def eof_received(self):
+        if self.peer is not None and self.peer.transport is not None and self.peer.transport.can_write_eof():
+            self.peer.transport.write_eof()
+            return True
+        return False
+
+    def connection_lost(self, exc):
+        self.transport = None
+        if self.peer is not None and self.peer.transport is not None:
+            self.peer.transport.close()
+        self.relay._connection_closed(self.connection_id, self.direction)
+
+
+class LatencyStats:
+    """按命令ID统计往返时延，只保留最近的样本"""
+
+    def __init__(self, max_samples=LATENCY_SAMPLES):
+        self.max_samples = max_samples
+        self._samples = {}   # 命令ID -> deque(时延毫秒)
+        self.counts = {}     # 命令ID -> 配对成功的次数
+        self.unmatched = {}  # 命令ID -> 连接关闭时仍未收到应答的请求数
+        self.mismatched = {}  # 应答命令ID -> 配对值没有对应请求的应答数
+
+    def add(self, command_id, latency_ms):
+        samples = self._samples.get(command_id)
+        if samples is None:
+            samples = self._samples[command_id] = deque(maxlen=self.max_samples)
+        samples.append(latency_ms)
+        self.counts[command_id] = self.counts.get(command_id, 0) + 1
+
+    def add_unmatched(self, command_id, count=1):
+        self.unmatched[command_id] = self.unmatched.get(command_id, 0) + count
+
+    def add_mismatched(self, command_id):
+        self.mismatched[command_id] = self.mismatched.get(command_id, 0) + 1
+
+    def report(self):
+        """返回 命令ID -> {'count', 'unmatched', 'mismatched', 'p50', 'p90', 'p99', 'max'}，时延单位毫秒"""
+        report = {}
+        for command_id in sorted(set(self._samples) | set(self.unmatched) | set(self.mismatched)):
+            values = sorted(self._samples.get(command_id, ()))
+            entry = {'count': self.counts.get(command_id, 0), 'unmatched': self.unmatched.get(command_id, 0),
+                     'mismatched': self.mismatched.get(command_id, 0)}
+            for percentile in PERCENTILES:
+                entry[f'p{percentile}'] = (values[min(len(values) - 1, len(values) * percentile // 100)]
+                                           if values else None)
+            entry['max'] = values[-1] if values else None
+            report[command_id] = entry
+        return report
+
+
+class MitmRelay:
+    """透明中继：在本地监听，把每个连接原样转发到目标地址
+
+    转发路径上不做分帧和解码，收到的数据复制一份交给解码线程；
+    解码线程按方向分帧、解码，并把应答与请求配对计算往返时延。
+    应答中有pair_fields中的字段（如sessionId）时只与该字段值相同的请求配对，
+    没有相同值的请求时计为错配；应答中没有这些字段时与同一连接上最早未应答的请求配对
+    """
+
+    def __init__(self, protocol_manager, target_host, target_port, listen_host="127.0.0.1",
+                 listen_port=9001, request_direction=DIRECTION_TO_SERVER, pair_fields=('sessionId',),
+                 tap_queue_size=10000, record=False, on_exchange=None):
+        """
+        参数:
+            protocol_manager: ProtocolManager
+            target_host, target_port: 转发目标
+            listen_host, listen_port: 本地监听地址
+            request_direction (str): 请求所在的方向，另一方向为应答
+            pair_fields (tuple): 用于配对请求和应答的字段名
+            tap_queue_size (int): 等待解码的数据块上限，满时丢弃并在该方向重新同步分帧
+            record (bool): 解码的帧是否写入报文记录
+            on_exchange (callable): 每配对成功一次在解码线程中调用，参数为Exchange
+        """
+        self.protocol_manager = protocol_manager
+        self.target_host = target_host
+        self.target_port = target_port
+        self.listen_host = listen_host
+        self.listen_port = listen_port
+        self.request_direction = request_direction
+        self.pair_fields = tuple(pair_fields)
+        self.record = record
+        self.on_exchange = on_exchange
+
+        self.stats = LatencyStats()
+        self.byte_counts = {DIRECTION_TO_SERVER: 0, DIRECTION_TO_CLIENT: 0}
+        self.frame_counts = {DIRECTION_TO_SERVER: 0, DIRECTION_TO_CLIENT: 0}
+        self.dropped_chunks = 0
+        self.connection_count = 0
+
+        self._tap_queue = queue.Queue(maxsize=tap_queue_size)
+        self._gaps = set()         # (连接, 方向)：有数据块被丢弃，只在事件循环中使用
+        self._assemblers = {}      # (连接, 方向) -> FrameAssembler，只在解码线程中使用
+        self._pending = {}         # 连接 -> deque[(命令ID, 配对值, 时间戳)]
+        self._server = None
+        self._worker = None
+        self._next_connection_id = 0
+
+    # ---- 事件循环中调用 ----
+
+    async def start(self):
+        """开始监听并启动解码线程"""
+        loop = asyncio.get_running_loop()
+        self._worker = threading.Thread(target=self._decode_worker, name="relay-decode", daemon=True)
+        self._worker.start()
+        self._server = await loop.create_server(self._accept, self.listen_host, self.listen_port)
+        return self._server
+
+    async def stop(self):
+        """停止监听，等待解码线程处理完已收到的数据"""
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+        if self._worker is not None:
+            self._tap_queue.put(None)
+            await asyncio.get_running_loop().run_in_executor(None, self._worker.join)
+            self._worker = None
+
+    def _accept(self):
+        """为新连接创建客户端一侧的协议对象，并异步连接目标"""
+        connection_id = self._next_connection_id
+        self._next_connection_id += 1
+        self.connection_count += 1
+        client_side = _RelayProtocol(self, connection_id, DIRECTION_TO_SERVER)
+        asyncio.get_running_loop().create_task(self._connect_target(client_side))
+        return client_side
+
+    async def _connect_target(self, client_side):
+        loop = asyncio.get_running_loop()
+        try:
+            _, server_side = await loop.create_connection(
+                lambda: _RelayProtocol(self, client_side.connection_id, DIRECTION_TO_CLIENT),
+                self.target_host, self.target_port)
+        except OSError as e:
+            print(f"无法连接转发目标 {self.target_host}:{self.target_port}: {e}")
+            if client_side.transport is not None:
+                client_side.transport.close()
+            return
+        if client_side.transport is None:
+            server_side.transport.close()
+            return
+        server_side.attach(client_side)
+        client_side.attach(server_side)
+
+    def _tap(self, connection_id, direction, data):
+        """把转发的数据（已复制的bytes）交给解码线程，队列满时丢弃，不阻塞转发
+
+        丢弃之后成功入队的第一块带上gap标记，解码线程处理到这一块时才重置分帧，
+        丢弃前已入队的数据仍按原来的缓冲分帧
+        """
+        self.byte_counts[direction] += len(data)
+        key = (connection_id, direction)
+        gap = key in self._gaps
+        try:
+            self._tap_queue.put_nowait((time.perf_counter_ns(), connection_id, direction, data, gap))
+        except queue.Full:
+            self.dropped_chunks += 1
+            self._gaps.add(key)
+        else:
+            if gap:
+                self._gaps.discard(key)
+
+    def _connection_closed(self, connection_id, direction):
+        self._gaps.discard((connection_id, direction))
+        try:
+            self._tap_queue.put_nowait((time.perf_counter_ns(), connection_id, direction, None, False))
+        except queue.Full:
+            self.dropped_chunks += 1
+
+    # ---- 解码线程 ----
+
+    def _decode_worker(self):
+        while True:
+            item = self._tap_queue.get()
+            if item is None:
+                break
+            timestamp, connection_id, direction, data, gap = item
+            key = (connection_id, direction)
+            if data is None:
+                self._close_connection(connection_id)
+                continue
+            assembler = self._assemblers.get(key)
+            if assembler is None:
+                assembler = self._assemblers[key] = FrameAssembler()
+            elif gap:
+                # 这一块之前丢过数据，缓冲区里的半帧已经无效
+                assembler.reset()
+            for frame in assembler.feed(data):
+                self.frame_counts[direction] += 1
+                self._handle_frame(timestamp, connection_id, direction, frame)
+
+    def _handle_frame(self, timestamp, connection_id, direction, frame):
+        hex_data = frame.hex().upper()
+        command_id = hex_data[6:8]
+        try:
+            protocol, parsed_data = self.protocol_manager.decode_frame(hex_data, record=self.record)
+        except Exception as e:
+            print(f"中继解码失败: {e}")
+            protocol, parsed_data = None, None
+        if protocol and protocol.get('protocol_id_hex'):
+            command_id = protocol['protocol_id_hex'].upper()
+        pair_value = self._pair_value(parsed_data)
+
+        pending = self._pending.setdefault(connection_id, deque())
+        if direction == self.request_direction:
+            pending.append((command_id, pair_value, timestamp))
+            return
+        if pair_value is not None:
+            index = next((i for i, entry in enumerate(pending) if entry[1] == pair_value), None)
+            if index is None:
+                # 配对值没有对应的请求，不拿最早的请求凑数，避免产生错误的时延
+                self.stats.add_mismatched(command_id)
+                return
+        elif pending:
+            index = 0
+        else:
+            return
+        request_id, request_value, request_time = pending[index]
+        del pending[index]
+        latency_ms = (timestamp - request_time) / 1e6
+        self.stats.add(request_id, latency_ms)
+        if self.on_exchange is not None:
+            self.on_exchange(Exchange(connection_id, request_id, command_id, request_value, latency_ms))
+
+    def _pair_value(self, parsed_data):
+        if not parsed_data or not self.pair_fields:
+            return None
+        for field in parsed_data.get('fields', []):
+            if field.name in self.pair_fields:
+                return field.value
+        return None
+
+    def _close_connection(self, connection_id):
+        """连接关闭：统计未应答的请求并释放分帧缓冲"""
+        for command_id, _, _ in self._pending.pop(connection_id, ()):
+            self.stats.add_unmatched(command_id)
+        for direction in (DIRECTION_TO_SERVER, DIRECTION_TO_CLIENT):
+            self._assemblers.pop((connection_id, direction), None)
+
+
+def format_latency_report(report):
+    """把LatencyStats.report()格式化为表格文本"""
+    lines = [f"{'命令':<6} {'配对':>8} {'未应答':>6} {'错配':>6} {'p50(ms)':>9} {'p90(ms)':>9} {'p99(ms)':>9} {'max(ms)':>9}"]
+    for command_id, entry in report.items():
+        cells = [f"{entry[name]:>9.3f}" if entry[name] is not None else f"{'-':>9}"
+                 for name in ('p50', 'p90', 'p99', 'max')]
+        lines.append(f"{command_id:<6} {entry['count']:>8} {entry['unmatched']:>6} {entry['mismatched']:>6} {' '.join(cells)}")
+    return '\n'.join(lines)
+
+
+if __name__ == "__main__":
+    import argparse
+    from protocol_manager import ProtocolManager
+
+    parser = argparse.ArgumentParser(description="透明转发livewire报文并统计请求/应答往返时延")
+    parser.add_argument("target", help="转发目标 host:port")
+    parser.add_argument("--listen", default="127.0.0.1:9001", help="本地监听地址 host:port")
+    parser.add_argument("--data-dir", default="protocols", help="协议目录")
+    parser.add_argument("--request-direction", choices=[DIRECTION_TO_SERVER, DIRECTION_TO_CLIENT],
+                        default=DIRECTION_TO_SERVER, help="请求所在的方向")
+    parser.add_argument("--pair-field", action="append", default=None, help="用于配对的字段名，可重复")
+    parser.add_argument("--interval", type=float, default=5, help="打印统计的间隔(秒)")
+    parser.add_argument("--record", action="store_true", help="写入报文记录")
+    args = parser.parse_args()
+
+    target_host, target_port = args.target.rsplit(":", 1)
+    listen_host, listen_port = args.listen.rsplit(":", 1)
+    manager = ProtocolManager(args.data_dir)
+    if args.record:
+        from frame_log import FrameLog
+        manager.frame_log = FrameLog("frame_log")
+    relay = MitmRelay(manager, target_host, int(target_port), listen_host, int(listen_port),
+                      request_direction=args.request_direction,
+                      pair_fields=args.pair_field or ('sessionId',), record=args.record)
+
+    async def run_relay():
+        await relay.start()
+        print(f"监听 {args.listen}，转发到 {args.target}")
+        try:
+            while True:
+                await asyncio.sleep(args.interval)
+                print(f"\n连接 {relay.connection_count}，字节 {relay.byte_counts}，"
+                      f"帧 {relay.frame_counts}，丢弃数据块 {relay.dropped_chunks}")
+                print(format_latency_report(relay.stats.report()))
+        finally:
+            await relay.stop()
+
+    try:
+        asyncio.run(run_relay())
+    except KeyboardInterrupt:
+        print(format_latency_report(relay.stats.report()))
@@ -0,0 +1,275 @@
+# protocol_doc.py - 协议文档生成模块
+import os
+import threading
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor
+
+# 协议组数量达到该值时使用多进程渲染，较少时进程启动开销大于收益
+PARALLEL_MIN_GROUPS = 4
+
+
+def collect_doc_groups(protocol_manager, protocol_key=None):
+    """从协议管理器中收集生成文档所需的数据
+
+    只复制为普通的字典/元组，可以安全地交给后台线程和工作进程，
+    收集完成后协议库的修改不会影响正在生成的文档
+
+    参数:
+        protocol_manager: 协议管理器
+        protocol_key: 协议键，为None时收集所有协议
+
+    返回:
+        list: 每个协议组一项 {'name', 'description', 'header_fields', 'commands'}
+    """
+    protocols = []
+    seen = set()
+    if protocol_key:
+        protocol = protocol_manager.get_protocol_by_key(protocol_key)
+        if protocol:
+            protocols.append(protocol)
+    else:
+        for protocol in protocol_manager.protocols.values():
+            if isinstance(protocol, dict) and protocol.get('type') == 'protocol' and id(protocol) not in seen:
+                seen.add(id(protocol))
+                protocols.append(protocol)
+
+    groups = []
+    used_command_keys = set()
+    for protocol in protocols:
+        name = protocol.get('name', '')
+        group = protocol.get('group', '') or name.lower()
+        command_keys = [key for key in (name, group) if key in protocol_manager.protocol_commands]
+        used_command_keys.update(command_keys)
+        groups.append(_collect_group(protocol_manager, name, protocol.get('description', ''),
+                                     protocol.get('fields', []), command_keys))
+
+    if not protocol_key:
+        # 没有protocol.json的命令目录也写入文档
+        for key in protocol_manager.protocol_commands:
+            if key not in used_command_keys:
+                groups.append(_collect_group(protocol_manager, key, '', [], [key]))
+    return groups
+
+
+def _collect_group(protocol_manager, name, description, header_fields, command_keys):
+    commands = []
+    seen = set()
+    for key in command_keys:
+        for command_id, command_list in protocol_manager.protocol_commands[key].items():
+            for command in (command_list if isinstance(command_list, list) else [command_list]):
+                if not isinstance(command, dict) or id(command) in seen:
+                    continue
+                seen.add(id(command))
+                commands.append({
+                    'id_hex': command.get('protocol_id_hex', command_id),
+                    'name': command.get('name', ''),
+                    'description': command.get('description', ''),
+                    'fields': _field_tuples(command.get('fields', []))
+                })
+    return {
+        'name': name,
+        'description': description,
+        'header_fields': _field_tuples(header_fields),
+        'commands': commands
+    }
+
+
+def _field_tuples(fields):
+    return [(field.get('name', ''), field.get('type', ''), field.get('start_pos', 0),
+             field.get('end_pos', 0), field.get('description', ''))
+            for field in fields]
+
+
+def _id_value(id_hex):
+    try:
+        return int(id_hex, 16)
+    except (TypeError, ValueError):
+        return -1
+
+
+def render_group(group):
+    """渲染一个协议组的文档内容（在工作进程中执行）
+
+    返回:
+        dict: 'header_rows' 协议头字段行, 'id_rows' 协议号列表行,
+              'sections' 字段详情 [(标题, 说明, 字段行)]
+    """
+    def field_rows(fields):
+        rows = []
+        for name, field_type, start_pos, end_pos, description in sorted(fields, key=lambda f: f[2]):
+            rows.append((name, f"{field_type}({end_pos - start_pos + 1})", description))
+        return rows
+
+    id_rows = []
+    sections = []
+    # 按照协议号从小到大排序
+    for command in sorted(group['commands'], key=lambda c: (_id_value(c['id_hex']), c['name'])):
+        id_value = _id_value(command['id_hex'])
+        id_text = f"0x{command['id_hex'].lower()} ({id_value})" if id_value >= 0 else command['id_hex']
+        description = command['description']
+        id_rows.append((id_text, f"{command['name']} - {description}" if description else command['name']))
+        title = f"{id_value if id_value >= 0 else command['id_hex']} {command['name']} (0x{command['id_hex'].lower()})"
+        sections.append((title, description, field_rows(command['fields'])))
+
+    return {
+        'name': group['name'],
+        'description': group['description'],
+        'header_rows': field_rows(group['header_fields']),
+        'id_rows': id_rows,
+        'sections': sections
+    }
+
+
+def iter_rendered_groups(groups, workers=None):
+    """按原顺序逐个产出渲染结果，协议组较多时在多个进程中并行渲染"""
+    if len(groups) < PARALLEL_MIN_GROUPS:
+        for group in groups:
+            yield render_group(group)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        # map按提交顺序返回，写文档时各组顺序不变
+        for rendered in executor.map(render_group, groups, chunksize=max(1, len(groups) // 32)):
+            yield rendered
+
+
+def write_xlsx(groups, output_path, progress=None):
+    """以只写模式逐行写出Excel文档，内存占用不随命令数量增长"""
+    try:
+        from openpyxl import Workbook
+    except ImportError:
+        return False, "需要安装openpyxl库才能生成Excel文档: pip install openpyxl"
+
+    workbook = Workbook(write_only=True)
+    header_sheet = workbook.create_sheet("协议头定义")
+    header_sheet.append(["协议", "字段名称", "字节类型", "字段说明"])
+    id_sheet = workbook.create_sheet("协议号列表")
+    id_sheet.append(["协议", "协议号", "协议说明"])
+    detail_sheet = workbook.create_sheet("协议字段详情")
+    detail_sheet.append(["协议", "命令", "命令说明", "字段名称", "字节类型", "字段说明"])
+
+    for index, rendered in enumerate(iter_rendered_groups(groups), start=1):
+        name = rendered['name']
+        for row in rendered['header_rows']:
+            header_sheet.append([name, *row])
+        for row in rendered['id_rows']:
+            id_sheet.append([name, *row])
+        for title, description, rows in rendered['sections']:
+            if not rows:
+                detail_sheet.append([name, title, description, "", "", ""])
+            for row in rows:
+                detail_sheet.append([name, title, description, *row])
+        if progress:
+            progress(index, len(groups), f"已写入协议: {name}")
+
+    workbook.save(output_path)
+    return True, f"Excel文档已生成: {output_path}"
+
+
+def write_docx(groups, output_path, progress=None):
+    """逐个协议组追加Word文档章节，渲染结果写入后即释放"""
+    try:
+        from docx import Document
+    except ImportError:
+        return False, "需要安装python-docx库才能生成Word文档: pip install python-docx"
+
+    document = Document()
+    document.add_heading("协议文档", level=0)
+
+    def add_table(headers, rows):
+        table = document.add_table(rows=1, cols=len(headers))
+        table.style = 'Table Grid'
+        for cell, text in zip(table.rows[0].cells, headers):
+            cell.text = text
+        for row in rows:
+            for cell, text in zip(table.add_row().cells, row):
+                cell.text = str(text)
+
+    # 协议号列表和字段详情需要在协议头定义之后，先把后两章的内容逐组暂存为渲染结果的引用
+    rendered_groups = []
+    document.add_heading("1. 协议头定义", level=1)
+    document.add_paragraph("协议头定义了所有协议共用的起始字段结构")
+    for index, rendered in enumerate(iter_rendered_groups(groups), start=1):
+        if rendered['header_rows']:
+            if len(groups) > 1:
+                document.add_paragraph(rendered['name'])
+            add_table(["字段名称", "字节类型", "字段说明"], rendered['header_rows'])
+        # 协议头字段写入后不再需要
+        rendered['header_rows'] = None
+        rendered_groups.append(rendered)
+        if progress:
+            progress(index, len(groups), f"已渲染协议: {rendered['name']}")
+
+    document.add_heading("2. 协议号列表", level=1)
+    document.add_paragraph("按照协议号从小到大排序")
+    id_rows = [row for rendered in rendered_groups for row in rendered['id_rows']]
+    add_table(["协议号", "协议说明"], id_rows)
+    del id_rows
+
+    document.add_heading("3. 协议字段详情", level=1)
+    while rendered_groups:
+        rendered = rendered_groups.pop(0)
+        for title, description, rows in rendered['sections']:
+            document.add_heading(f"3.{title}", level=2)
+            if description:
+                document.add_paragraph(description)
+            add_table(["字段名称", "字节类型", "字段说明"], rows)
+
+    document.save(output_path)
+    return True, f"Word文档已生成: {output_path}"
+
+
+def generate_protocol_doc(groups, output_format, output_path=None, progress=None):
+    """根据收集的协议数据生成文档
+
+    参数:
+        groups (list): collect_doc_groups的结果
+        output_format (str): "docx" 或 "xlsx"
+        output_path (str): 输出文件，默认为当前目录下的 协议文档_时间.格式
+        progress (callable): progress(已完成, 总数, 说明)
+
+    返回:
+        tuple: (是否成功, 消息)
+    """
+    if not groups:
+        return False, "没有可生成文档的协议"
+    if output_path is None:
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        output_path = os.path.abspath(f"协议文档_{timestamp}.{output_format}")
+
+    try:
+        if output_format == "xlsx":
+            return write_xlsx(groups, output_path, progress)
+        if output_format == "docx":
+            return write_docx(groups, output_path, progress)
+        return False, f"不支持的文档格式: {output_format}"
+    except Exception as e:
+        print(f"生成协议文档失败: {e}")
+        return False, f"生成协议文档失败: {e}"
+
+
+class ProtocolDocJob:
+    """后台生成协议文档的任务，界面通过轮询progress/result获取进度和结果"""
+
+    def __init__(self, groups, output_format, output_path=None):
+        self.groups = groups
+        self.output_format = output_format
+        self.output_path = output_path
+        self.progress = (0, len(groups), "准备生成文档")
+        self.result = None  # 完成后为 (是否成功, 消息)
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def is_done(self):
+        return self.result is not None
+
+    def _update_progress(self, done, total, text):
+        # 元组整体替换，界面线程读取时不会看到不一致的进度
+        self.progress = (done, total, text)
+
+    def _run(self):
+        self.result = generate_protocol_doc(self.groups, self.output_format,
+                                            self.output_path, self._update_progress)
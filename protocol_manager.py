@@ -1,175 +1,423 @@
 # protocol_manager.py - 协议管理和存储模块
 import os
+import re
 import json
 from pathlib import Path
 import struct
 import copy
+import hashlib
+import threading
+from collections import OrderedDict
+from array import array
+from field_model import FieldDef, DecodedField, DecodedBatch, normalize_fields, json_default, BIT_FIELD_TYPE
+import protocol_doc
+from sample_store import SampleStore
+import frame_log
+from frame_encoder import FrameEncoder
+import text_codec
+from field_index import FieldIntervalIndex
+from decode_plan import DecodePlan, VariantTable, GROUP_TYPE, LENGTH_KEY, COUNT_KEY, VARIANTS_KEY
+
+
+def _load_numpy():
+    """numpy可选，没有安装时使用纯Python实现"""
+    try:
+        import numpy
+        return numpy
+    except ImportError:
+        return None
+
 
 class ProtocolManager:
     """协议管理类：处理协议的加载、保存和查询功能"""
     
-    def __init__(self, data_dir="protocols"):
+    def __init__(self, data_dir="protocols", decode_cache_size=1024, store=None, frame_log=None,
+                 column_store=None):
+        """
+        参数:
+            data_dir: 协议文件目录
+            decode_cache_size (int): 解码结果缓存的条目数
+            store: 可选的SQLiteProtocolStore，指定时从数据库加载和保存协议，不再读写json文件
+            frame_log: 可选的FrameLog，指定时解码的每一帧都写入报文记录
+            column_store: 可选的ColumnStore，与frame_log一起使用，完整解析的帧按字段写入列存储
+        """
         # 确保协议存储目录存在
         self.data_dir = Path(data_dir)
         self.data_dir.mkdir(exist_ok=True)
         self.protocols = {}  # 存储所有协议
         self.commands = {}   # 存储所有命令
         self.protocol_commands = {}  # 存储协议指令
+        
+        # 协议定义版本号，任何修改协议/命令定义的操作都会递增
+        self.definition_version = 0
+        self._definition_versions = {}  # 定义键(group/id/name) -> 版本号
+        self._group_versions = {}       # 协议组 -> 版本号
+        # 影响匹配结果的修改（新增、删除、重新加载）单独计数
+        self._structure_version = 0
+        self._definition_listeners = []  # 定义变更订阅者
+        
+        # 解码结果LRU缓存: (帧内容哈希, 结构版本) -> [匹配的协议, 解析结果, 定义键, 定义版本]
+        self._decode_cache = OrderedDict()
+        # 实时抓包在后台线程解码，与界面线程共用缓存和报文记录时需要加锁
+        self._decode_lock = threading.RLock()
+        self.decode_cache_refreshes = 0
+        self.decode_cache_size = decode_cache_size
+        self.decode_cache_hits = 0
+        self.decode_cache_misses = 0
+        
+        # 编译好的报文编码器: 定义键 -> (定义版本, FrameEncoder)
+        self._encoders = {}
+        # 含变长字段/记录组的解析计划: (定义键, 分支名) -> (定义版本, 字段列表, DecodePlan或None)
+        self._decode_plans = {}
+        # 分支布局的分派表: 定义键 -> (定义版本, variants, 字段列表, VariantTable或None)
+        self._variant_tables = {}
+        # 字段区间索引: 定义键 -> (定义版本, 字段列表, FieldIntervalIndex)
+        self._field_indexes = {}
+        
+        # 文件索引: 文件路径 -> 从该文件加载的定义，用于单文件增量重新加载
+        self._file_definitions = {}
+        self._own_writes = {}  # 本程序写入的文件 -> (mtime_ns, size)，删除时为None
+        
+        # 报文样本单独保存，定义中只记录样本摘要
+        self.sample_store = SampleStore(self.data_dir / ".samples")
+        
+        self.frame_log = frame_log
+        self.column_store = column_store
+        
+        self.store = store
+        if self.store is not None and self.store.is_empty():
+            # 首次使用数据库时从现有协议目录导入
+            self.store.import_directory(self.data_dir)
+        
         self.load_all_protocols()
     
     def load_all_protocols(self):
         """加载所有协议和命令"""
         try:
-            # 加载协议
-            for file_path in self.data_dir.glob("**/protocol.json"):
-                with open(file_path, 'r', encoding='utf-8') as f:
-                    protocol = json.load(f)
-                    if protocol.get("type") == "protocol":
-                        group = file_path.parent.name
-                        self.protocols[f"{group}/{protocol['name']}"] = protocol
-                        # 添加到协议字典中
-                        self.protocols[protocol['name']] = protocol
-            
-            # 加载commands.json统一命令文件
-            for file_path in self.data_dir.glob("**/commands.json"):
+            if self.store is not None:
+                self._load_from_store()
+            else:
+                # 加载协议
+                for file_path in self.data_dir.glob("**/protocol.json"):
+                    self._load_protocol_file(file_path)
+                
+                # 加载commands.json统一命令文件
+                for file_path in self.data_dir.glob("**/commands.json"):
+                    self._load_protocol_file(file_path)
+                
+                # 继续加载标准命令文件 (ID.json) - 为了向后兼容
+                for file_path in self.data_dir.glob("**/*.json"):
+                    if file_path.name == "protocol.json" or file_path.name == "commands.json":
+                        continue
+                    self._load_protocol_file(file_path)
+                    
+            print(f"加载完成，协议数量: {len(self.protocols)}")
+            print(f"command_numbers: {len(self.protocol_commands)}")
+            self._normalize_all_fields()
+            self._notify_definition_changed(None, action='reload')
+            return True, "协议和命令加载成功"
+        except Exception as e:
+            return False, f"加载协议和命令失败: {str(e)}"
+    
+    def _load_from_store(self):
+        """从数据库加载所有协议和命令，建立与json文件加载相同的内存索引"""
+        for group, protocol in self.store.load_protocols():
+            if protocol.get("type") == "protocol":
+                self.protocols[f"{group}/{protocol['name']}"] = protocol
+                self.protocols[protocol['name']] = protocol
+        
+        for group, protocol_name, command_id, cmd in self.store.load_commands():
+            if cmd.get("type") == "command" and "follow" not in cmd:
+                cmd["follow"] = ""
+            self.protocol_commands.setdefault(protocol_name, {}).setdefault(command_id, []).append(cmd)
+            self.protocols[f"{group}/{cmd.get('protocol_id_hex', command_id)}"] = cmd
+            if 'name' in cmd:
+                self.commands[cmd['name']] = cmd
+        print(f"从数据库加载协议: {self.store.db_path}")
+    
+    def _load_protocol_file(self, file_path):
+        """加载单个协议/命令文件，并记录该文件提供的定义
+        
+        返回:
+            list: 从该文件加载的协议/命令定义
+        """
+        if file_path.name == "protocol.json":
+            definitions = self._load_protocol_json(file_path)
+        elif file_path.name == "commands.json":
+            definitions = self._load_commands_json(file_path)
+        else:
+            definitions = self._load_command_file(file_path)
+        self._file_definitions[self._file_key(file_path)] = definitions
+        return definitions
+    
+    def _load_protocol_json(self, file_path):
+        """加载protocol.json协议文件"""
+        with open(file_path, 'r', encoding='utf-8') as f:
+            protocol = json.load(f)
+            if protocol.get("type") == "protocol":
                 group = file_path.parent.name
-                print(f"发现命令集合文件: {file_path}, 组={group}")
+                self.protocols[f"{group}/{protocol['name']}"] = protocol
+                # 添加到协议字典中
+                self.protocols[protocol['name']] = protocol
+                return [protocol]
+        return []
+    
+    def _load_commands_json(self, file_path):
+        """加载commands.json统一命令文件"""
+        group = file_path.parent.name
+        print(f"发现命令集合文件: {file_path}, 组={group}")
+        
+        try:
+            with open(file_path, 'r', encoding='utf-8') as f:
+                all_commands = json.load(f)
                 
-                try:
-                    with open(file_path, 'r', encoding='utf-8') as f:
-                        all_commands = json.load(f)
+            # 处理统一命令文件格式
+            for protocol_name, protocol_commands in all_commands.items():
+                if protocol_name not in self.protocol_commands:
+                    self.protocol_commands[protocol_name] = {}
+                    
+                for command_id, command_list in protocol_commands.items():
+                    if command_id not in self.protocol_commands[protocol_name]:
+                        self.protocol_commands[protocol_name][command_id] = []
                         
-                    # 处理统一命令文件格式
-                    for protocol_name, protocol_commands in all_commands.items():
-                        if protocol_name not in self.protocol_commands:
-                            self.protocol_commands[protocol_name] = {}
-                            
-                        for command_id, command_list in protocol_commands.items():
-                            if command_id not in self.protocol_commands[protocol_name]:
-                                self.protocol_commands[protocol_name][command_id] = []
-                                
-                            # 确保命令列表是列表格式
-                            if isinstance(command_list, list):
-                                # 确保每个命令都有follow字段
-                                for cmd in command_list:
-                                    if isinstance(cmd, dict) and cmd.get("type") == "command" and "follow" not in cmd:
-                                        cmd["follow"] = ""
-                                
-                                # 添加到命令字典
-                                self.protocol_commands[protocol_name][command_id].extend(command_list)
-                                
-                                # 添加到协议字典和命令字典
-                                for cmd in command_list:
-                                    if isinstance(cmd, dict):
-                                        # 确保命令有follow字段
-                                        if cmd.get("type") == "command" and "follow" not in cmd:
-                                            cmd["follow"] = ""
-                                            
-                                        cmd_id = cmd.get("protocol_id_hex", command_id)
-                                        full_key = f"{group}/{cmd_id}"
-                                        self.protocols[full_key] = cmd
-                                        if 'name' in cmd:
-                                            self.commands[cmd['name']] = cmd
-                            else:
-                                # 如果不是列表，转换为列表并添加
-                                # 先确保命令有follow字段
-                                if isinstance(command_list, dict) and command_list.get("type") == "command" and "follow" not in command_list:
-                                    command_list["follow"] = ""
-                                    
-                                self.protocol_commands[protocol_name][command_id].append(command_list)
-                                full_key = f"{group}/{command_id}"
-                                self.protocols[full_key] = command_list
-                                if 'name' in command_list:
-                                    self.commands[command_list['name']] = command_list
-                                
-                    print(f"从 {file_path} 加载命令集合完成")
-                except Exception as e:
-                    print(f"加载命令集合文件 {file_path} 失败: {e}")
-            
-            # 继续加载标准命令文件 (ID.json) - 为了向后兼容
-            for file_path in self.data_dir.glob("**/*.json"):
-                if file_path.name == "protocol.json" or file_path.name == "commands.json":
-                    continue
-                
-                # 检查是否是命令格式的文件名 (command_ID_name.json)
-                if file_path.name.startswith("command_"):
-                    parts = file_path.stem.split('_', 2)
-                    if len(parts) >= 2:
-                        command_id = parts[1]  # 提取ID部分
-                        group = file_path.parent.name
-                        print(f"发现命令格式文件: {file_path.name}, ID={command_id}, 组={group}")
+                    # 确保命令列表是列表格式
+                    if isinstance(command_list, list):
+                        # 确保每个命令都有follow字段
+                        for cmd in command_list:
+                            if isinstance(cmd, dict) and cmd.get("type") == "command" and "follow" not in cmd:
+                                cmd["follow"] = ""
                         
-                        try:
-                            with open(file_path, 'r', encoding='utf-8') as f:
-                                command = json.load(f)
-                                
-                                # 确保命令有正确的ID
-                                if not command.get("protocol_id_hex"):
-                                    command["protocol_id_hex"] = command_id
-                                
+                        # 添加到命令字典
+                        self.protocol_commands[protocol_name][command_id].extend(command_list)
+                        
+                        # 添加到协议字典和命令字典
+                        for cmd in command_list:
+                            if isinstance(cmd, dict):
                                 # 确保命令有follow字段
-                                if isinstance(command, dict) and command.get("type") == "command" and "follow" not in command:
-                                    command["follow"] = ""
-                                elif isinstance(command, list):
-                                    for cmd in command:
-                                        if isinstance(cmd, dict) and cmd.get("type") == "command" and "follow" not in cmd:
-                                            cmd["follow"] = ""
-                                
-                                # 转换旧格式到新格式
-                                if group not in self.protocol_commands:
-                                    self.protocol_commands[group] = {}
+                                if cmd.get("type") == "command" and "follow" not in cmd:
+                                    cmd["follow"] = ""
                                     
-                                if command_id not in self.protocol_commands[group]:
-                                    self.protocol_commands[group][command_id] = []
-                                
-                                # 添加到命令字典
-                                if isinstance(command, list):
-                                    self.protocol_commands[group][command_id].extend(command)
-                                else:
-                                    self.protocol_commands[group][command_id].append(command)
-                                
-                                # 添加到协议字典
-                                self.protocols[f"{group}/{command_id}"] = command
-                        except Exception as e:
-                            print(f"加载命令文件 {file_path} 失败: {e}")
-                    continue
-                
+                                cmd_id = cmd.get("protocol_id_hex", command_id)
+                                full_key = f"{group}/{cmd_id}"
+                                self.protocols[full_key] = cmd
+                                if 'name' in cmd:
+                                    self.commands[cmd['name']] = cmd
+                    else:
+                        # 如果不是列表，转换为列表并添加
+                        # 先确保命令有follow字段
+                        if isinstance(command_list, dict) and command_list.get("type") == "command" and "follow" not in command_list:
+                            command_list["follow"] = ""
+                            
+                        self.protocol_commands[protocol_name][command_id].append(command_list)
+                        full_key = f"{group}/{command_id}"
+                        self.protocols[full_key] = command_list
+                        if 'name' in command_list:
+                            self.commands[command_list['name']] = command_list
+                        
+            print(f"从 {file_path} 加载命令集合完成")
+            return self._flatten_commands(all_commands)
+        except Exception as e:
+            print(f"加载命令集合文件 {file_path} 失败: {e}")
+        return []
+    
+    def _load_command_file(self, file_path):
+        """加载标准命令文件 (ID.json) 或 command_ID_name.json 格式的命令文件"""
+        # 检查是否是命令格式的文件名 (command_ID_name.json)
+        if file_path.name.startswith("command_"):
+            parts = file_path.stem.split('_', 2)
+            if len(parts) >= 2:
+                command_id = parts[1]  # 提取ID部分
                 group = file_path.parent.name
-                command_id = file_path.stem
+                print(f"发现命令格式文件: {file_path.name}, ID={command_id}, 组={group}")
                 
-                with open(file_path, 'r', encoding='utf-8') as f:
-                    commands = json.load(f)
-                
-                # 确保命令有follow字段
-                if isinstance(commands, dict) and commands.get("type") == "command" and "follow" not in commands:
-                    commands["follow"] = ""
-                elif isinstance(commands, list):
-                    for cmd in commands:
-                        if isinstance(cmd, dict) and cmd.get("type") == "command" and "follow" not in cmd:
-                            cmd["follow"] = ""
-                    
-                # 转换旧格式到新格式
-                if group not in self.protocol_commands:
-                    self.protocol_commands[group] = {}
-                    
-                if command_id not in self.protocol_commands[group]:
-                    self.protocol_commands[group][command_id] = []
-                    
-                if isinstance(commands, list):
-                    self.protocol_commands[group][command_id].extend(commands)
-                else:
-                    self.protocol_commands[group][command_id].append(commands)
-                    
-            print(f"加载完成，协议数量: {len(self.protocols)}")
-            print(f"command_numbers: {len(self.protocol_commands)}")
-            return True, "协议和命令加载成功"
+                try:
+                    with open(file_path, 'r', encoding='utf-8') as f:
+                        command = json.load(f)
+                        
+                        # 确保命令有正确的ID
+                        if not command.get("protocol_id_hex"):
+                            command["protocol_id_hex"] = command_id
+                        
+                        # 确保命令有follow字段
+                        if isinstance(command, dict) and command.get("type") == "command" and "follow" not in command:
+                            command["follow"] = ""
+                        elif isinstance(command, list):
+                            for cmd in command:
+                                if isinstance(cmd, dict) and cmd.get("type") == "command" and "follow" not in cmd:
+                                    cmd["follow"] = ""
+                        
+                        # 转换旧格式到新格式
+                        if group not in self.protocol_commands:
+                            self.protocol_commands[group] = {}
+                            
+                        if command_id not in self.protocol_commands[group]:
+                            self.protocol_commands[group][command_id] = []
+                        
+                        # 添加到命令字典
+                        if isinstance(command, list):
+                            self.protocol_commands[group][command_id].extend(command)
+                        else:
+                            self.protocol_commands[group][command_id].append(command)
+                        
+                        # 添加到协议字典
+                        self.protocols[f"{group}/{command_id}"] = command
+                        return self._flatten_commands({group: {command_id: command}})
+                except Exception as e:
+                    print(f"加载命令文件 {file_path} 失败: {e}")
+            return []
+        
+        group = file_path.parent.name
+        command_id = file_path.stem
+        
+        with open(file_path, 'r', encoding='utf-8') as f:
+            commands = json.load(f)
+        
+        # 确保命令有follow字段
+        if isinstance(commands, dict) and commands.get("type") == "command" and "follow" not in commands:
+            commands["follow"] = ""
+        elif isinstance(commands, list):
+            for cmd in commands:
+                if isinstance(cmd, dict) and cmd.get("type") == "command" and "follow" not in cmd:
+                    cmd["follow"] = ""
+            
+        # 转换旧格式到新格式
+        if group not in self.protocol_commands:
+            self.protocol_commands[group] = {}
+            
+        if command_id not in self.protocol_commands[group]:
+            self.protocol_commands[group][command_id] = []
+            
+        if isinstance(commands, list):
+            self.protocol_commands[group][command_id].extend(commands)
+        else:
+            self.protocol_commands[group][command_id].append(commands)
+        
+        return self._flatten_commands({group: {command_id: commands}})
+    
+    def _flatten_commands(self, commands_data):
+        """将 {协议名: {命令ID: [命令]}} 结构展开为命令定义列表"""
+        definitions = []
+        if not isinstance(commands_data, dict):
+            return definitions
+        for protocol_commands in commands_data.values():
+            if not isinstance(protocol_commands, dict):
+                continue
+            for command_list in protocol_commands.values():
+                commands = command_list if isinstance(command_list, list) else [command_list]
+                definitions.extend(cmd for cmd in commands if isinstance(cmd, dict))
+        return definitions
+    
+    def _file_key(self, file_path):
+        """文件路径的统一表示，用于文件索引"""
+        return os.path.normcase(os.path.abspath(str(file_path)))
+    
+    def _forget_definitions(self, definitions):
+        """从内存索引中移除指定的定义（按对象标识匹配）"""
+        ids = {id(definition) for definition in definitions}
+        if not ids:
+            return
+        
+        def is_forgotten(value):
+            if isinstance(value, list):
+                return any(id(item) in ids for item in value)
+            return id(value) in ids
+        
+        for index in (self.protocols, self.commands):
+            for key in [key for key, value in index.items() if is_forgotten(value)]:
+                del index[key]
+        
+        for protocol_name in list(self.protocol_commands):
+            group_commands = self.protocol_commands[protocol_name]
+            for command_id in list(group_commands):
+                command_list = group_commands[command_id]
+                if isinstance(command_list, list):
+                    command_list[:] = [cmd for cmd in command_list if id(cmd) not in ids]
+                    if not command_list:
+                        del group_commands[command_id]
+                elif id(command_list) in ids:
+                    del group_commands[command_id]
+            if not group_commands:
+                del self.protocol_commands[protocol_name]
+    
+    def reload_protocol_file(self, file_path):
+        """重新加载单个协议/命令文件，增量合并到内存索引
+        
+        先移除该文件上次加载的定义，再重新解析该文件（文件已删除时只移除）
+        
+        参数:
+            file_path: 发生变化的文件路径
+            
+        返回:
+            tuple: (是否成功, 消息)
+        """
+        file_path = Path(file_path)
+        key = self._file_key(file_path)
+        old_definitions = self._file_definitions.pop(key, [])
+        old_keys = {self.get_definition_key(definition) for definition in old_definitions}
+        self._forget_definitions(old_definitions)
+        
+        new_definitions = []
+        try:
+            if file_path.exists():
+                new_definitions = self._load_protocol_file(file_path)
         except Exception as e:
-            return False, f"加载协议和命令失败: {str(e)}"
+            print(f"重新加载文件 {file_path} 失败: {e}")
+            return False, f"重新加载文件失败: {e}"
+        finally:
+            new_keys = set()
+            for definition in new_definitions:
+                normalize_fields(definition)
+                self._store_samples(definition)
+                new_keys.add(self.get_definition_key(definition))
+                self._notify_definition_changed(definition, action='reload')
+            for definition_key in old_keys - new_keys:
+                self._notify_definition_changed(definition_key, action='delete')
+        
+        print(f"已重新加载文件: {file_path}，移除 {len(old_definitions)} 个定义，加载 {len(new_definitions)} 个定义")
+        return True, f"已重新加载 {file_path.name}"
+    
+    def _record_own_write(self, file_path, definitions=None):
+        """记录本程序对协议文件的写入/删除，文件监视器据此忽略自身的修改
+        
+        参数:
+            file_path: 写入或删除的文件
+            definitions (list): 写入文件的定义，用于更新文件索引
+        """
+        key = self._file_key(file_path)
+        try:
+            stat = os.stat(file_path)
+            self._own_writes[key] = (stat.st_mtime_ns, stat.st_size)
+            if definitions is not None:
+                self._file_definitions[key] = definitions
+        except OSError:
+            # 文件已被删除
+            self._own_writes[key] = None
+            self._file_definitions.pop(key, None)
+    
+    def is_own_change(self, file_path):
+        """判断文件的当前状态是否由本程序写入"""
+        key = self._file_key(file_path)
+        if key not in self._own_writes:
+            return False
+        try:
+            stat = os.stat(file_path)
+            current = (stat.st_mtime_ns, stat.st_size)
+        except OSError:
+            current = None
+        return self._own_writes[key] == current
     
-    def save_protocol(self, protocol_data):
-        """保存协议数据到文件"""
+    def save_protocol(self, protocol_data, notify=True):
+        """保存协议数据到文件
+        
+        参数:
+            protocol_data (dict): 协议/命令定义
+            notify (bool): 是否通知定义变化；修改字段的调用方已经通知过时为False，
+                此时只在保存为新定义时通知，每次修改只递增一次版本
+        """
         # 使用深度复制，避免引用相同对象导致的问题
-        protocol_data = copy.deepcopy(protocol_data)
+        protocol_data = normalize_fields(copy.deepcopy(protocol_data))
+        # 样本移入样本库，文件中只保存摘要
+        self._store_samples(protocol_data)
         
         # 确保协议数据包含十进制和十六进制形式
         if "protocol_id_hex" not in protocol_data and "protocol_id" in protocol_data:
@@ -200,6 +448,8 @@ class ProtocolManager:
             # 协议直接存储在protocols目录下的协议名子目录中
             group = protocol_name
             protocol_data["group"] = group
+            # 保留已有协议的样本
+            self._store_samples(protocol_data, self.protocols.get(protocol_data.get("name", "")))
             # 创建协议目录
             protocol_dir = self.data_dir / group
             protocol_dir.mkdir(exist_ok=True, parents=True)
@@ -207,13 +457,20 @@ class ProtocolManager:
             file_path = protocol_dir / "protocol.json"
             
             try:
-                print(f"保存到文件: {file_path}")
-                with open(file_path, 'w', encoding='utf-8') as f:
-                    json.dump(protocol_data, f, ensure_ascii=False, indent=2)
+                if self.store is not None:
+                    self.store.save_protocol(group, protocol_data)
+                else:
+                    print(f"保存到文件: {file_path}")
+                    with open(file_path, 'w', encoding='utf-8') as f:
+                        json.dump(protocol_data, f, ensure_ascii=False, indent=2, default=json_default)
+                    self._record_own_write(file_path, [protocol_data])
                 
                 # 更新内存中的协议数据
                 full_key = f"{group}/{protocol_id}" if group else protocol_id
+                is_new = full_key not in self.protocols
                 self.protocols[full_key] = protocol_data
+                if notify or is_new:
+                    self._notify_definition_changed(protocol_data, structural=is_new, action='save')
                 
                 print(f"保存成功, 协议键: {full_key}")
                 return True, f"协议已保存: {protocol_id} (十进制: {protocol_data.get('protocol_id_dec', '未知')}) 到 {group}"
@@ -267,9 +524,9 @@ class ProtocolManager:
                     if (isinstance(cmd, dict) and 
                         cmd.get("name") == command_name and 
                         cmd.get("follow", "") == command_follow):
-                        # 仅更新完全匹配的命令
+                        # 仅更新完全匹配的命令，保留已有的样本
                         print(f"更新已存在的命令: {command_name}，follow: {command_follow}")
-                        commands_list[i] = protocol_data
+                        commands_list[i] = self._store_samples(protocol_data, cmd)
                         command_exists = True
                         break
                 
@@ -280,9 +537,16 @@ class ProtocolManager:
                 
                 # 在protocols字典中也保存一份
                 self.protocols[full_key] = protocol_data
+                # 只修改已有命令的内容时不影响匹配结果
+                if notify or not command_exists:
+                    self._notify_definition_changed(protocol_data, structural=not command_exists, action='save')
                 
-                # 保存命令到commands.json文件
-                self._save_protocol_commands()
+                if self.store is not None:
+                    # 数据库中只更新这一条命令
+                    self.store.save_command(group, parent_protocol_name, protocol_id, protocol_data)
+                else:
+                    # 保存命令到commands.json文件
+                    self._save_protocol_commands()
                 
                 print(f"保存成功, 协议键: {full_key}")
                 return True, f"命令已保存: {protocol_id} (十进制: {protocol_data.get('protocol_id_dec', '未知')}) 到 {group}"
@@ -334,8 +598,12 @@ class ProtocolManager:
                         found = True
                 
                 if found:
-                    # 保存更新后的命令文件
-                    self._save_protocol_commands()
+                    if self.store is not None:
+                        self.store.delete_command(protocol_name, command_id, command_name)
+                    else:
+                        # 保存更新后的命令文件
+                        self._save_protocol_commands([protocol_name])
+                    self._notify_definition_changed(protocol_key, group=group, action='delete')
                     return True, f"命令 '{command_name}' 已删除"
             
             # 未找到匹配的命令
@@ -345,7 +613,7 @@ class ProtocolManager:
         if protocol_key not in self.protocols:
             print(f"检查是否是旧格式命令文件: {protocol_key}")
             # 检查是否是旧格式的命令文件名导致的问题
-            if '/' in protocol_key:
+            if '/' in protocol_key and self.store is None:
                 group, protocol_id = protocol_key.split('/', 1)
                 print(f"分解键值: 组={group}, ID={protocol_id}")
                 
@@ -366,6 +634,7 @@ class ProtocolManager:
                                 # 保存更新后的commands.json
                                 with open(commands_file, 'w', encoding='utf-8') as f:
                                     json.dump(commands_data, f, ensure_ascii=False, indent=2)
+                                self._record_own_write(commands_file)
                                 
                                 print(f"已从commands.json删除命令: {protocol_id}")
                                 
@@ -374,6 +643,7 @@ class ProtocolManager:
                                     del self.protocol_commands[group][protocol_id]
                                     print(f"从protocol_commands中删除了命令: {group}/{protocol_id}")
                                 
+                                self._notify_definition_changed(protocol_key, group=group, action='delete')
                                 return True, f"命令 {protocol_id} 已从commands.json删除"
                         except Exception as e:
                             print(f"处理commands.json失败: {e}")
@@ -384,6 +654,7 @@ class ProtocolManager:
                         try:
                             # 删除文件
                             cmd_file.unlink()
+                            self._record_own_write(cmd_file)
                             print(f"已删除命令文件: {cmd_file}")
                             
                             # 更新内存中的数据
@@ -391,6 +662,7 @@ class ProtocolManager:
                                 del self.protocol_commands[group][protocol_id]
                                 print(f"从protocol_commands中删除了命令: {group}/{protocol_id}")
                             
+                            self._notify_definition_changed(protocol_key, group=group, action='delete')
                             return True, f"命令文件 {cmd_file.name} 已删除"
                         except Exception as e:
                             return False, f"删除命令文件失败: {e}"
@@ -406,12 +678,22 @@ class ProtocolManager:
         
         try:
             # 确定文件路径
-            if protocol_type == "protocol":
+            if protocol_type == "protocol" and self.store is not None:
+                # 数据库中删除协议及其命令
+                self.store.delete_protocol(group, protocol_name)
+                if protocol_name in self.protocol_commands:
+                    for cmd_id, cmd in self.protocol_commands[protocol_name].items():
+                        cmd_group = cmd.get("group", "") if isinstance(cmd, dict) else group
+                        cmd_key = f"{cmd_group}/{cmd_id}" if cmd_group else cmd_id
+                        self.protocols.pop(cmd_key, None)
+                    del self.protocol_commands[protocol_name]
+            elif protocol_type == "protocol":
                 # 如果是协议，删除protocol.json文件
                 file_path = self.data_dir / group / "protocol.json"
                 
                 if file_path.exists():
                     file_path.unlink()
+                    self._record_own_write(file_path)
                     
                 # 检查是否需要删除协议目录（如果目录为空）
                 protocol_dir = self.data_dir / group
@@ -444,6 +726,7 @@ class ProtocolManager:
                     commands_file = self.data_dir / group / "commands.json"
                     if commands_file.exists():
                         commands_file.unlink()
+                        self._record_own_write(commands_file)
                         print(f"已删除命令文件: {commands_file}")
             else:
                 # 如果是命令，更新commands.json文件
@@ -452,19 +735,21 @@ class ProtocolManager:
                     # 从命令字典中删除该命令
                     del self.protocol_commands[protocol_name][protocol_id]
                     # 保存更新后的命令文件
-                    self._save_protocol_commands()
+                    self._save_protocol_commands([protocol_name])
                     print(f"从commands.json删除命令: {protocol_id}")
                 
                 # 检查是否存在单独的命令文件
                 standard_file_path = self.data_dir / group / f"{protocol_id}.json"
-                if standard_file_path.exists():
+                if self.store is None and standard_file_path.exists():
                     standard_file_path.unlink()
+                    self._record_own_write(standard_file_path)
                     print(f"已删除命令文件: {standard_file_path}")
             
             # 从协议字典中删除
             if protocol_key in self.protocols:
                 del self.protocols[protocol_key]
                 
+            self._notify_definition_changed(protocol_data, action='delete')
             return True, f"{'协议' if protocol_type == 'protocol' else '命令'} {protocol_id} 已删除"
         except Exception as e:
             return False, f"删除{'协议' if protocol_type == 'protocol' else '命令'}失败: {e}"
@@ -549,7 +834,7 @@ class ProtocolManager:
     def update_protocol(self, protocol_data):
         """更新已存在的协议"""
         # 使用深度复制，避免引用相同对象导致的问题
-        protocol_data = copy.deepcopy(protocol_data)
+        protocol_data = normalize_fields(copy.deepcopy(protocol_data))
         
         protocol_id = protocol_data.get("protocol_id_hex", "")
         protocol_name = protocol_data.get("name", "")
@@ -573,8 +858,9 @@ class ProtocolManager:
                 protocol.get("protocol_id_hex") == protocol_id and 
                 protocol.get("name") == original_name):
                 
-                # 更新协议
-                self.protocols[key] = protocol_data
+                # 更新协议，保留已有的样本
+                self.protocols[key] = self._store_samples(protocol_data, protocol)
+                self._notify_definition_changed(protocol_data, action='update')
                 found = True
                 print(f"在protocols中找到并更新: {key}")
                 break
@@ -590,14 +876,18 @@ class ProtocolManager:
                     # 在列表中查找匹配原始名称的命令
                     for i, cmd in enumerate(commands_list):
                         if isinstance(cmd, dict) and cmd.get("name") == original_name:
-                            # 更新命令
-                            commands_list[i] = protocol_data
+                            # 更新命令，保留已有的样本
+                            commands_list[i] = self._store_samples(protocol_data, cmd)
                             found = True
+                            if self.store is not None and original_name != protocol_name:
+                                # 改名后按新名称保存，数据库中删除旧名称的行
+                                self.store.delete_command(parent_protocol_name, protocol_id, original_name)
                             print(f"在protocol_commands中找到并更新: {parent_protocol_name}/{protocol_id}/{original_name}")
                             break
                 elif isinstance(commands_list, dict) and commands_list.get("name") == original_name:
                     # 直接更新字典
-                    self.protocol_commands[parent_protocol_name][protocol_id] = protocol_data
+                    self.protocol_commands[parent_protocol_name][protocol_id] = self._store_samples(
+                        protocol_data, commands_list)
                     found = True
                     print(f"在protocol_commands中找到并更新字典: {parent_protocol_name}/{protocol_id}")
         
@@ -828,10 +1118,26 @@ class ProtocolManager:
             print(f"保存数据到文件失败: {e}")
             return False, f"保存数据到文件失败: {e}"
     
-    def _save_protocol_commands(self):
-        """保存协议命令数据到文件"""
+    def _save_protocol_commands(self, protocol_names=None):
+        """保存协议命令数据到文件
+        
+        参数:
+            protocol_names: 只保存这些协议的命令文件，为None时保存全部
+        """
         try:
+            if self.store is not None:
+                for protocol_name, commands in self.protocol_commands.items():
+                    if protocol_names is None or protocol_name in protocol_names:
+                        self.store.replace_catalog(protocol_name.lower(), protocol_name, commands)
+                # 命令已全部删除的协议
+                for protocol_name in protocol_names or ():
+                    if protocol_name not in self.protocol_commands:
+                        self.store.replace_catalog(protocol_name.lower(), protocol_name, {})
+                return True, "命令数据已成功保存到数据库"
+            
             for protocol_name, commands in self.protocol_commands.items():
+                if protocol_names is not None and protocol_name not in protocol_names:
+                    continue
                 group = protocol_name.lower()
                 
                 # 创建协议命令目录
@@ -846,6 +1152,7 @@ class ProtocolManager:
                     if cmd_file.name != "commands.json" and cmd_file.name != "protocol.json":
                         try:
                             cmd_file.unlink()
+                            self._record_own_write(cmd_file)
                             print(f"删除旧的命令文件: {cmd_file}")
                         except Exception as e:
                             print(f"删除旧的命令文件失败: {e}")
@@ -868,7 +1175,8 @@ class ProtocolManager:
                 
                 # 保存到文件
                 with open(file_path, 'w', encoding='utf-8') as f:
-                    json.dump(commands_data, f, ensure_ascii=False, indent=2)
+                    json.dump(commands_data, f, ensure_ascii=False, indent=2, default=json_default)
+                self._record_own_write(file_path, self._flatten_commands(commands_data))
                 
                 print(f"保存命令到文件: {file_path}")
                     
@@ -877,6 +1185,503 @@ class ProtocolManager:
             print(f"保存命令数据到文件失败: {e}")
             return False, f"保存命令数据到文件失败: {e}"
     
+    def import_commands_from_text(self, json_text):
+        """批量导入命令目录JSON文本
+        
+        文本格式与commands.json相同: {协议名: {命令ID: [命令, ...]}}。
+        按命令列表逐个增量解析，不构建整棵JSON树；每个命令的字段在一次遍历中校验
+        （重叠、结束位置超出报文长度、未知类型），校验失败的命令不导入；
+        其余命令批量合并到内存索引，最后每个受影响的协议组只写一次commands.json
+        
+        参数:
+            json_text (str): JSON文本
+            
+        返回:
+            tuple: (是否成功, 消息)
+        """
+        supported_types = set(self.get_supported_field_types())
+        pending = []
+        errors = []
+        rejected = 0
+        
+        # 第一步：增量解析并校验，JSON有错误时不修改任何数据
+        try:
+            for protocol_name, command_id, command_list in self._iter_command_catalog(json_text):
+                for command in command_list:
+                    if not isinstance(command, dict):
+                        errors.append(f"{protocol_name}/{command_id}: 命令不是对象")
+                        rejected += 1
+                        continue
+                    
+                    command_errors = self._validate_command_fields(command, supported_types)
+                    if command_errors:
+                        name = command.get('name', '未命名')
+                        errors.extend(f"{protocol_name}/{command_id}/{name}: {error}" for error in command_errors)
+                        rejected += 1
+                        continue
+                    pending.append((protocol_name, command_id, command))
+        except ValueError as e:
+            print(f"导入JSON文本失败: {e}")
+            return False, f"JSON格式错误: {e}"
+        
+        if not pending:
+            message = "没有导入任何命令"
+            if errors:
+                message += "，校验失败:\n" + "\n".join(errors[:20])
+            return False, message
+        
+        # 第二步：批量合并到内存索引
+        imported = []
+        affected = set()
+        for protocol_name, command_id, command in pending:
+            is_new = self._merge_imported_command(protocol_name, command_id, command)
+            imported.append((command, is_new))
+            affected.add(protocol_name)
+        
+        # 第三步：每个受影响的协议组只写一次文件
+        success, save_message = self._save_protocol_commands(affected)
+        if not success:
+            return False, save_message
+        
+        for command, is_new in imported:
+            self._notify_definition_changed(command, structural=is_new, action='import')
+        
+        message = f"已导入 {len(imported)} 个命令到 {len(affected)} 个协议: {', '.join(sorted(affected))}"
+        if errors:
+            message += f"\n{rejected} 个命令校验失败未导入:\n" + "\n".join(errors[:20])
+            if len(errors) > 20:
+                message += f"\n... 另有 {len(errors) - 20} 条"
+        print(message)
+        return True, message
+    
+    def _iter_command_catalog(self, json_text):
+        """逐个命令列表解析 {协议名: {命令ID: [命令]}} 格式的JSON文本
+        
+        只解析到命令列表一级，每次产出 (协议名, 命令ID, 命令列表)
+        """
+        decoder = json.JSONDecoder()
+        whitespace = re.compile(r'\s*')
+        length = len(json_text)
+        
+        def skip(pos):
+            return whitespace.match(json_text, pos).end()
+        
+        def expect(pos, char):
+            pos = skip(pos)
+            if pos >= length or json_text[pos] != char:
+                found = json_text[pos] if pos < length else '文本结尾'
+                raise ValueError(f"位置 {pos} 处应为 '{char}'，实际为 '{found}'")
+            return pos + 1
+        
+        def iter_members(pos):
+            """遍历对象成员，产出 (键, 值起始位置)，由调用方解析值并返回结束位置"""
+            pos = expect(pos, '{')
+            pos = skip(pos)
+            if pos < length and json_text[pos] == '}':
+                return pos + 1
+            while True:
+                key, pos = decoder.raw_decode(json_text, skip(pos))
+                if not isinstance(key, str):
+                    raise ValueError(f"位置 {pos} 处的键不是字符串")
+                pos = expect(pos, ':')
+                pos = yield key, skip(pos)
+                pos = skip(pos)
+                if pos < length and json_text[pos] == ',':
+                    pos += 1
+                    continue
+                return expect(pos, '}')
+        
+        try:
+            protocols = iter_members(0)
+            protocol_name, pos = next(protocols)
+            while True:
+                commands = iter_members(pos)
+                try:
+                    command_id, pos = next(commands)
+                    while True:
+                        command_list, pos = decoder.raw_decode(json_text, pos)
+                        if isinstance(command_list, dict):
+                            command_list = [command_list]
+                        if not isinstance(command_list, list):
+                            raise ValueError(f"命令 {protocol_name}/{command_id} 不是列表或对象")
+                        yield protocol_name, command_id, command_list
+                        command_id, pos = commands.send(pos)
+                except StopIteration as stop:
+                    pos = stop.value
+                protocol_name, pos = protocols.send(pos)
+        except StopIteration as stop:
+            end = stop.value
+            if end is not None and skip(end) != length:
+                raise ValueError(f"位置 {skip(end)} 处有多余内容")
+        except json.JSONDecodeError as e:
+            raise ValueError(str(e))
+    
+    def _validate_command_fields(self, command, supported_types):
+        """一次遍历校验命令字段：类型、位置、重叠、是否超出报文长度
+        
+        返回:
+            list: 错误信息，没有错误时为空列表
+        """
+        errors = []
+        fields = command.get('fields', [])
+        if not isinstance(fields, list):
+            return ["fields 不是列表"]
+        
+        # 有样本数据时按样本长度检查结束位置
+        frame_length = None
+        hex_data = command.get('hex_data', '') or self.get_command_sample(command)
+        if hex_data:
+            frame_length = len(hex_data) // 2
+        
+        # 重叠（包括同一容器字节中的位范围）和报文长度用区间索引检查，与添加/编辑字段时一致
+        placed = FieldIntervalIndex()
+        previous_names = set()  # 已检查的字段名，长度/条数字段必须在引用它的字段之前
+        for field in sorted(fields, key=lambda f: f.get('start_pos', 0) if isinstance(f, (dict, FieldDef)) else 0):
+            if not isinstance(field, (dict, FieldDef)):
+                errors.append("字段不是对象")
+                continue
+            name = field.get('name', '未命名')
+            start_pos = field.get('start_pos', 0)
+            end_pos = field.get('end_pos', 0)
+            field_type = field.get('type', 'u8')
+            
+            errors.extend(placed.check(field, frame_length))
+            if not isinstance(start_pos, int) or not isinstance(end_pos, int) or start_pos < 0 or end_pos < start_pos:
+                continue
+            
+            # 去掉字节数后缀 (如 char.ascii.4 / string.8)
+            parts = str(field_type).split('.')
+            base_type = parts[0] if len(parts) == 1 or parts[1].isdigit() else f"{parts[0]}.{parts[1]}"
+            if base_type not in supported_types:
+                errors.append(f"字段 {name} 类型未知: {field_type}")
+            if parts[0] == GROUP_TYPE and not field.get('fields'):
+                errors.append(f"记录组 {name} 没有定义子字段")
+            if parts[0] == GROUP_TYPE and field.get(COUNT_KEY) is None:
+                errors.append(f"记录组 {name} 没有指定条数字段 {COUNT_KEY}")
+            for ref_key in (LENGTH_KEY, COUNT_KEY):
+                ref = field.get(ref_key)
+                if ref is not None and ref not in previous_names:
+                    errors.append(f"字段 {name} 的 {ref_key} 引用的字段 {ref} 不存在或不在它之前")
+            
+            if parts[0] == BIT_FIELD_TYPE:
+                try:
+                    FieldDef.from_dict(field).get_bit_layout()
+                except ValueError as e:
+                    errors.append(str(e))
+            
+            placed.add(field)
+            previous_names.add(name)
+        
+        # 分支布局：每个分支的合并定义（公共字段 + 分支字段）单独检查，只报告分支带来的错误
+        if command.get(VARIANTS_KEY):
+            try:
+                variant_table = VariantTable(command)
+            except ValueError as e:
+                errors.append(f"分支定义无效: {e}")
+            else:
+                for definition in variant_table.definitions():
+                    for error in self._validate_command_fields(definition, supported_types):
+                        if error not in errors:
+                            errors.append(f"分支 {definition.get('variant')}: {error}")
+        return errors
+    
+    def _merge_imported_command(self, protocol_name, command_id, command):
+        """把导入的命令合并到内存索引，同名且follow相同的命令被替换
+        
+        返回:
+            bool: 是否为新命令
+        """
+        command.setdefault('type', 'command')
+        command.setdefault('protocol_name', protocol_name)
+        command.setdefault('group', protocol_name.lower())
+        command.setdefault('follow', '')
+        if not command.get('protocol_id_hex'):
+            command['protocol_id_hex'] = command_id
+        normalize_fields(command)
+        
+        commands_list = self.protocol_commands.setdefault(protocol_name, {}).setdefault(command_id, [])
+        if isinstance(commands_list, dict):
+            commands_list = [commands_list]
+            self.protocol_commands[protocol_name][command_id] = commands_list
+        
+        is_new = True
+        for i, cmd in enumerate(commands_list):
+            if (isinstance(cmd, dict) and cmd.get('name') == command.get('name') and
+                    cmd.get('follow', '') == command['follow']):
+                commands_list[i] = self._store_samples(command, cmd)
+                is_new = False
+                break
+        if is_new:
+            commands_list.append(self._store_samples(command))
+        
+        self.protocols[f"{command['group']}/{command_id}"] = command
+        if 'name' in command:
+            self.commands[command['name']] = command
+        return is_new
+
+    def generate_protocol_doc(self, protocol_key, output_format, progress_callback=None):
+        """生成协议文档
+
+        参数:
+            protocol_key: 协议键，为None时生成所有协议的文档
+            output_format (str): "docx" 或 "xlsx"
+            progress_callback (callable): progress_callback(已完成, 总数, 说明)
+
+        返回:
+            tuple: (是否成功, 消息)
+        """
+        groups = protocol_doc.collect_doc_groups(self, protocol_key)
+        return protocol_doc.generate_protocol_doc(groups, output_format, progress=progress_callback)
+
+    def start_protocol_doc_job(self, protocol_key, output_format):
+        """在后台线程中生成协议文档
+
+        协议数据在调用线程中复制一份，之后的编辑不影响正在生成的文档
+
+        返回:
+            ProtocolDocJob: 通过progress和is_done()/result查询进度和结果
+        """
+        groups = protocol_doc.collect_doc_groups(self, protocol_key)
+        return protocol_doc.ProtocolDocJob(groups, output_format).start()
+
+    def get_definition_key(self, definition):
+        """获取协议/命令定义的唯一键
+        
+        命令使用 group/id/name 三段式键，与get_protocol_by_key支持的格式一致；
+        协议使用 group/name
+        """
+        if isinstance(definition, str):
+            return definition
+        if not isinstance(definition, dict):
+            return None
+        
+        name = definition.get('name', '')
+        group = self._get_definition_group(definition)
+        if definition.get('type', 'command') != 'protocol':
+            return f"{group}/{definition.get('protocol_id_hex', '')}/{name}"
+        return f"{group}/{name}"
+    
+    def _get_definition_group(self, definition):
+        """获取定义所属的协议组"""
+        if not isinstance(definition, dict):
+            return ""
+        group = definition.get('group', '')
+        if group:
+            return group
+        if definition.get('type', 'command') == 'protocol':
+            return definition.get('name', '').lower()
+        
+        # 从ID.json加载的命令没有group字段，按所在目录查找
+        command_id = definition.get('protocol_id_hex', '')
+        for group_name, group_commands in self.protocol_commands.items():
+            command_list = group_commands.get(command_id)
+            commands = command_list if isinstance(command_list, list) else [command_list]
+            if any(cmd is definition for cmd in commands):
+                return group_name
+        return definition.get('protocol_name', '').lower()
+    
+    def get_definition_version(self, definition):
+        """获取协议/命令定义的版本号
+        
+        参数:
+            definition: 定义字典或定义键(group/id/name)
+            
+        返回:
+            int: 版本号，从未加载或修改过的定义返回0
+        """
+        return self._definition_versions.get(self.get_definition_key(definition), 0)
+    
+    def get_group_version(self, group):
+        """获取协议组的版本号，组内任意定义变化都会递增"""
+        return self._group_versions.get(group, 0)
+    
+    def subscribe_definition_changes(self, callback):
+        """订阅协议定义变更
+        
+        callback(event) 在每次定义变化后调用，event字典包含:
+            key: 定义键，整体重新加载时为None
+            group: 协议组，整体重新加载时为None
+            version: 定义的新版本号
+            group_version: 协议组的新版本号
+            structural: 是否可能影响协议匹配结果（新增、删除、重新加载）
+            action: 'reload' / 'save' / 'update' / 'delete' / 'field'
+        """
+        if callback not in self._definition_listeners:
+            self._definition_listeners.append(callback)
+        return callback
+    
+    def unsubscribe_definition_changes(self, callback):
+        """取消订阅协议定义变更"""
+        if callback in self._definition_listeners:
+            self._definition_listeners.remove(callback)
+    
+    def _notify_definition_changed(self, definition, structural=True, action='save', group=None):
+        """递增定义版本号并通知订阅者
+        
+        参数:
+            definition: 变化的定义字典或定义键，None表示全部重新加载
+            structural (bool): 是否可能影响协议匹配结果
+            action (str): 变化类型
+            group (str): 协议组，不指定时从定义中获取
+        """
+        self.definition_version += 1
+        version = self.definition_version
+        
+        if definition is None:
+            # 整体重新加载：所有已加载定义和组都使用新版本号
+            key = None
+            group = None
+            self._definition_versions.clear()
+            for group_name, group_commands in self.protocol_commands.items():
+                self._group_versions[group_name] = version
+                for command_list in group_commands.values():
+                    commands = command_list if isinstance(command_list, list) else [command_list]
+                    for command in commands:
+                        if isinstance(command, dict):
+                            self._definition_versions[self.get_definition_key(command)] = version
+            for protocol in self.protocols.values():
+                if isinstance(protocol, dict):
+                    self._definition_versions[self.get_definition_key(protocol)] = version
+                    self._group_versions[self._get_definition_group(protocol)] = version
+        else:
+            key = self.get_definition_key(definition)
+            if group is None:
+                group = self._get_definition_group(definition) if isinstance(definition, dict) else key.split('/')[0]
+            self._definition_versions[key] = version
+            self._group_versions[group] = version
+        
+        if structural:
+            # 匹配结果可能变化，缓存的匹配全部作废
+            with self._decode_lock:
+                self._structure_version += 1
+                self._decode_cache.clear()
+        
+        event = {
+            'key': key,
+            'group': group,
+            'version': version,
+            'group_version': version if group is None else self._group_versions[group],
+            'structural': structural,
+            'action': action
+        }
+        for listener in list(self._definition_listeners):
+            try:
+                listener(event)
+            except Exception as e:
+                print(f"定义变更通知失败: {e}")
+    
+    def _decode_cache_key(self, hex_data):
+        """根据帧内容和结构版本生成缓存键"""
+        try:
+            # 使用字节内容计算哈希，忽略16进制字符串的大小写差异
+            frame_bytes = bytes.fromhex(hex_data)
+        except ValueError:
+            frame_bytes = hex_data.upper().encode('ascii', errors='replace')
+        digest = hashlib.blake2b(frame_bytes, digest_size=16).digest()
+        return (digest, self._structure_version)
+    
+    def decode_frame(self, hex_data, record=True):
+        """匹配并解析一帧数据，相同内容的帧直接返回缓存结果
+        
+        参数:
+            hex_data (str): 16进制数据
+            record (bool): 设置了报文记录时是否写入这一帧
+            
+        返回:
+            tuple: (匹配的协议或命令, 解析结果)，未匹配时均为None
+            注意缓存结果会被多次返回，调用方不应修改
+        """
+        if not hex_data:
+            return None, None
+        
+        with self._decode_lock:
+            protocol, parsed_data = self._decode_frame(hex_data)
+            if record and self.frame_log is not None:
+                self._record_frame(hex_data, protocol, parsed_data)
+        return protocol, parsed_data
+    
+    def _record_frame(self, hex_data, protocol, parsed_data):
+        """把解码的一帧写入报文记录，按组/命令ID建立索引"""
+        try:
+            data = bytes.fromhex(hex_data)
+        except ValueError:
+            return
+        
+        if protocol:
+            command_key = self.get_frame_log_key(protocol, hex_data[6:8])
+            field_count = len(protocol.get('fields', []))
+            if parsed_data and len(parsed_data.get('fields', [])) == parsed_data.get('field_count', field_count):
+                status = frame_log.STATUS_DECODED
+            else:
+                status = frame_log.STATUS_PARTIAL
+        else:
+            command_key = frame_log.FrameLog.make_command_key(frame_log.UNMATCHED_GROUP, hex_data[6:8] or "--")
+            status = frame_log.STATUS_UNMATCHED
+        
+        try:
+            offset = self.frame_log.append(data, command_key, status)
+            if self.column_store is not None and status == frame_log.STATUS_DECODED:
+                definition_key = self.get_definition_key(protocol)
+                self.column_store.append(command_key, protocol, data, offset,
+                                         version=(definition_key, self.get_definition_version(protocol)),
+                                         definition_key=definition_key)
+        except OSError as e:
+            print(f"写入报文记录失败: {e}")
+    
+    def get_frame_log_key(self, definition, default_id=""):
+        """协议/命令在报文记录和列存储中使用的命令键（组/命令ID）"""
+        command_id = definition.get('protocol_id_hex', '') or default_id
+        return frame_log.FrameLog.make_command_key(self._get_definition_group(definition), command_id)
+    
+    def _decode_frame(self, hex_data):
+        """decode_frame的匹配和缓存部分"""
+        key = self._decode_cache_key(hex_data)
+        entry = self._decode_cache.get(key)
+        if entry is not None:
+            self._decode_cache.move_to_end(key)
+            self.decode_cache_hits += 1
+            protocol, parsed_data, definition_key, version = entry
+            if definition_key and self._definition_versions.get(definition_key, 0) != version:
+                # 匹配到的定义只修改了字段：沿用匹配结果，仅重新解析
+                protocol = self.get_protocol_by_key(definition_key) or protocol
+                parsed_data = self.parse_protocol_data(hex_data, protocol)
+                entry[0:2] = [protocol, parsed_data]
+                entry[3] = self._definition_versions.get(definition_key, 0)
+                self.decode_cache_refreshes += 1
+            return protocol, parsed_data
+        
+        self.decode_cache_misses += 1
+        protocol = self.find_matching_protocol(hex_data)
+        parsed_data = self.parse_protocol_data(hex_data, protocol) if protocol else None
+        definition_key = self.get_definition_key(protocol) if protocol else None
+        
+        self._decode_cache[key] = [protocol, parsed_data, definition_key,
+                                   self._definition_versions.get(definition_key, 0)]
+        if len(self._decode_cache) > self.decode_cache_size:
+            # 淘汰最久未使用的条目
+            self._decode_cache.popitem(last=False)
+        return protocol, parsed_data
+    
+    def get_decode_cache_stats(self):
+        """获取解码缓存的命中统计"""
+        total = self.decode_cache_hits + self.decode_cache_misses
+        return {
+            'hits': self.decode_cache_hits,
+            'misses': self.decode_cache_misses,
+            'refreshes': self.decode_cache_refreshes,
+            'size': len(self._decode_cache),
+            'capacity': self.decode_cache_size,
+            'hit_rate': self.decode_cache_hits / total if total else 0.0
+        }
+    
+    def clear_decode_cache(self):
+        """清空解码缓存并重置统计"""
+        with self._decode_lock:
+            self._decode_cache.clear()
+        self.decode_cache_hits = 0
+        self.decode_cache_misses = 0
+        self.decode_cache_refreshes = 0
+    
     def parse_protocol_data(self, hex_data, protocol):
         """解析协议数据，返回字段值"""
         if not protocol or 'fields' not in protocol:
@@ -888,6 +1693,19 @@ class ProtocolManager:
             'fields': []
         }
         
+        variant_table = self.get_variant_table(protocol)
+        if variant_table is not None:
+            return self._parse_variant_data(hex_data, protocol, variant_table)
+        
+        plan = self.get_decode_plan(protocol)
+        if plan is not None:
+            # 含变长字段或记录组：按预编译的计划一次向前解析
+            try:
+                result['fields'] = plan.decode(bytes.fromhex(hex_data))
+            except ValueError as e:
+                print(f"解析数据失败: {e}")
+            return result
+        
         for field in protocol['fields']:
             field_result = self._parse_field(field, hex_data)
             if field_result:
@@ -895,6 +1713,424 @@ class ProtocolManager:
         
         return result
     
+    def _parse_variant_data(self, hex_data, protocol, variant_table):
+        """分支布局：先解析选择字段，再按分派表直接取到分支定义解析
+        
+        返回:
+            dict: 与parse_protocol_data相同，另有variant（分支名，没有匹配时为None）
+            和field_count（该分支的字段数）
+        """
+        selector = self._parse_field(variant_table.selector, hex_data)
+        variant = variant_table.select(selector.value) if selector else None
+        result = self.parse_protocol_data(hex_data, variant or variant_table.base)
+        result['protocol_name'] = protocol.get('name', '')
+        result['variant'] = variant.get('variant') if variant else None
+        result['field_count'] = len((variant or variant_table.base)['fields'])
+        return result
+    
+    def get_variant_table(self, definition):
+        """获取定义的分支分派表，加载时生成，定义未修改时复用
+        
+        返回:
+            VariantTable: 分派表；定义没有variants或分支定义无效时返回None
+        """
+        if not isinstance(definition, dict) or not definition.get(VARIANTS_KEY):
+            return None
+        definition_key = self.get_definition_key(definition)
+        version = self.get_definition_version(definition)
+        variants = definition.get(VARIANTS_KEY)
+        fields = definition.get('fields')
+        cached = self._variant_tables.get(definition_key)
+        if cached is not None and cached[0] == version and cached[1] is variants and cached[2] is fields:
+            return cached[3]
+        
+        try:
+            table = VariantTable(definition)
+        except ValueError as e:
+            print(f"生成分支分派表失败: {definition.get('name', '')}: {e}")
+            table = None
+        self._variant_tables[definition_key] = (version, variants, fields, table)
+        return table
+    
+    def has_dynamic_layout(self, definition):
+        """定义中字段的位置是否随报文内容变化（分支布局、变长字段或记录组）"""
+        return self.get_variant_table(definition) is not None or self.get_decode_plan(definition) is not None
+    
+    def get_decode_plan(self, definition):
+        """获取含变长字段/记录组的定义的解析计划，定义未修改时复用已编译的计划
+        
+        返回:
+            DecodePlan: 解析计划；所有字段都是定长字段或定义无效时返回None
+        """
+        # 分支的合并定义与原定义同名，用分支名区分
+        definition_key = (self.get_definition_key(definition), definition.get('variant'))
+        version = self.get_definition_version(definition)
+        fields = definition.get('fields')
+        cached = self._decode_plans.get(definition_key)
+        if cached is not None and cached[0] == version and cached[1] is fields:
+            return cached[2]
+        
+        try:
+            plan = DecodePlan(definition, self._convert_field_value)
+            if not plan.dynamic:
+                plan = None
+        except ValueError as e:
+            print(f"编译解析计划失败: {e}")
+            plan = None
+        self._decode_plans[definition_key] = (version, fields, plan)
+        return plan
+    
+    def decode_batch(self, frames, protocol):
+        """按同一协议批量解析多帧数据，结果按字段列存储
+        
+        参数:
+            frames (list): 16进制字符串或bytes组成的帧列表
+            protocol (dict): 协议或命令定义
+            
+        返回:
+            DecodedBatch: 数值字段保存在array.array中，其他字段保存在列表中；
+            长度不足的帧在valid中记为0，数值列填0，其他列填None
+        """
+        if not protocol or 'fields' not in protocol:
+            return None
+        
+        fields = [FieldDef.from_dict(field) for field in protocol['fields']]
+        batch = DecodedBatch(protocol, fields, len(frames))
+        frame_bytes = [bytes.fromhex(frame) if isinstance(frame, str) else frame for frame in frames]
+        
+        variant_table = self.get_variant_table(protocol)
+        if variant_table is not None:
+            return self._decode_batch_variants(protocol, variant_table, frame_bytes)
+        
+        plan = self.get_decode_plan(protocol)
+        if plan is not None:
+            return self._decode_batch_with_plan(batch, plan, frame_bytes)
+        
+        # 帧是否足够长，只判断一次
+        max_end = max((field.get_layout()[1] for field in fields), default=0)
+        batch.valid = array('B', (1 if len(data) >= max_end else 0 for data in frame_bytes))
+        
+        containers = {}  # 位字段容器列，同一容器上的多个位字段只解包一次
+        for field in fields:
+            start, end, fmt = field.get_layout()
+            if field.is_bit_field():
+                try:
+                    values = self._decode_bit_column(field, frame_bytes, containers)
+                except ValueError as e:
+                    print(f"位字段解析失败: {e}")
+                    values = [None] * len(frame_bytes)
+            elif fmt:
+                # 数值字段：struct直接解包到类型化数组
+                type_code, unpacker = fmt
+                is_float = type_code == 'd'
+                values = array(type_code)
+                for data in frame_bytes:
+                    if len(data) < end:
+                        values.append(0)
+                        continue
+                    value = unpacker.unpack_from(data, start)[0]
+                    values.append(round(value, 6) if is_float else value)
+            else:
+                # 其他类型沿用单帧解析的转换逻辑，字符串字段按同一编码整列解码
+                field_type = field.get('type', 'u8')
+                endian = field.get('endian', 'big')
+                encoding = field.get('encoding')
+                text_encoding = text_codec.column_encoding(field)
+                if text_encoding:
+                    values = text_codec.decode_column(
+                        [data[start:end] if len(data) >= end else None for data in frame_bytes], text_encoding,
+                        lambda chunk: self._convert_field_value(chunk.hex(), field_type, endian, encoding))
+                else:
+                    values = [self._convert_field_value(data[start:end].hex(), field_type, endian, encoding)
+                              if len(data) >= end else None
+                              for data in frame_bytes]
+            batch.columns[field.get('name', '')] = values
+        
+        return batch
+    
+    def _decode_batch_variants(self, protocol, variant_table, frame_bytes):
+        """分支布局的批量解析：按选择字段的值把帧分到各分支，每个分支整批解析后再按原顺序合并
+        
+        返回:
+            DecodedBatch: 列为公共字段和所有分支字段，帧所在分支没有的字段填None
+        """
+        selector_name = variant_table.selector_name
+        selectors = self.decode_batch(frame_bytes, {'name': protocol.get('name', ''),
+                                                    'fields': [variant_table.selector]})
+        buckets = {}  # id(分支定义) -> (分支定义, 帧序号列表)
+        for index, value in enumerate(selectors.columns[selector_name]):
+            variant = (variant_table.select(value) if selectors.valid[index] else None) or variant_table.base
+            buckets.setdefault(id(variant), (variant, []))[1].append(index)
+        
+        fields = []
+        for definition in [variant_table.base] + variant_table.definitions():
+            names = {field.get('name', '') for field in fields}
+            fields.extend(field for field in definition['fields'] if field.get('name', '') not in names)
+        batch = DecodedBatch(protocol, fields, len(frame_bytes))
+        batch.columns = {field.get('name', ''): [None] * len(frame_bytes) for field in fields}
+        batch.valid = array('B', bytes(len(frame_bytes)))
+        for variant, indexes in buckets.values():
+            part = self.decode_batch([frame_bytes[index] for index in indexes], variant)
+            for name, values in part.columns.items():
+                column = batch.columns[name]
+                for index, value in zip(indexes, values):
+                    column[index] = value
+            for index, valid in zip(indexes, part.valid):
+                batch.valid[index] = valid
+        return batch
+    
+    def _decode_batch_with_plan(self, batch, plan, frame_bytes):
+        """含变长字段的定义逐帧按解析计划解析，各列均为列表，没有解析到的字段填None"""
+        names = [field.get('name', '') for field in batch.fields]
+        columns = {name: [] for name in names}
+        valid = array('B')
+        for data in frame_bytes:
+            decoded = {item.name: item.value for item in plan.decode(data)}
+            valid.append(1 if len(decoded) == len(names) else 0)
+            for name in names:
+                columns[name].append(decoded.get(name))
+        batch.columns = columns
+        batch.valid = valid
+        return batch
+    
+    def _decode_bit_column(self, field, frame_bytes, containers):
+        """批量解析位字段：容器字节解包成一列整数后，整列做移位和掩码
+        
+        参数:
+            field (FieldDef): 位字段定义
+            frame_bytes (list): bytes帧列表
+            containers (dict): (起始, 结束, 字节序) -> 容器列，同一批次内共用
+            
+        返回:
+            array|list: 不超过8字节的容器返回array('Q')，否则返回整数列表；长度不足的帧为0
+        """
+        start, end, shift, mask, container, byteorder = field.get_bit_layout()
+        key = (start, end, byteorder)
+        column = containers.get(key)
+        if column is None:
+            if container:
+                column = array('Q', (container.unpack_from(data, start)[0] if len(data) >= end else 0
+                                     for data in frame_bytes))
+            else:
+                column = [int.from_bytes(data[start:end], byteorder) if len(data) >= end else 0
+                          for data in frame_bytes]
+            containers[key] = column
+        
+        if not isinstance(column, array):
+            return [(value >> shift) & mask for value in column]
+        numpy = _load_numpy()
+        if numpy is not None:
+            values = (numpy.frombuffer(column, dtype=numpy.uint64) >> numpy.uint64(shift)) & numpy.uint64(mask)
+            return array('Q', values.tobytes())
+        return array('Q', [(value >> shift) & mask for value in column])
+    
+    def _normalize_all_fields(self):
+        """加载完成后将所有定义中的字段转换为FieldDef，hex_data样本移入样本库"""
+        for protocol in self.protocols.values():
+            normalize_fields(protocol)
+            self._store_samples(protocol)
+            self.get_variant_table(protocol)
+        for group_commands in self.protocol_commands.values():
+            for command_list in group_commands.values():
+                commands = command_list if isinstance(command_list, list) else [command_list]
+                for command in commands:
+                    normalize_fields(command)
+                    self._store_samples(command)
+                    self.get_variant_table(command)
+    
+    def _store_samples(self, definition, previous=None):
+        """把定义中的hex_data样本移入样本库，定义中只保留样本摘要列表(samples)
+        
+        参数:
+            definition (dict): 协议/命令定义
+            previous (dict): 被该定义替换的旧定义，保留旧定义的样本
+        """
+        if not isinstance(definition, dict):
+            return definition
+        samples = list(previous.get('samples', [])) if isinstance(previous, dict) else []
+        for digest in definition.get('samples', []):
+            if digest not in samples:
+                samples.append(digest)
+        
+        hex_data = definition.get('hex_data')
+        if hex_data:
+            digest = self.sample_store.put(hex_data)
+            if digest is None:
+                # 不是有效的16进制数据，保留在定义中
+                print(f"样本不是有效的16进制数据，未移入样本库: {definition.get('name', '')}")
+                return definition
+            if digest not in samples:
+                samples.append(digest)
+        definition.pop('hex_data', None)
+        if samples:
+            definition['samples'] = samples
+        return definition
+    
+    def get_command_samples(self, definition):
+        """获取协议/命令的所有报文样本，从样本库按需读取
+        
+        返回:
+            list: 16进制字符串列表
+        """
+        if not isinstance(definition, dict):
+            return []
+        samples = [self.sample_store.get(digest) for digest in definition.get('samples', [])]
+        if definition.get('hex_data'):
+            samples.insert(0, definition['hex_data'])
+        return [hex_data for hex_data in samples if hex_data]
+    
+    def get_command_sample(self, definition, index=0):
+        """获取协议/命令的一个报文样本，没有时返回空字符串"""
+        if not isinstance(definition, dict):
+            return ""
+        if definition.get('hex_data'):
+            return definition['hex_data']
+        samples = definition.get('samples', [])
+        if index < len(samples):
+            return self.sample_store.get(samples[index])
+        return ""
+    
+    def learn_text_encodings(self, definition, frames=None, max_frames=5000):
+        """在报文样本和报文记录上识别字符串字段（char/char.ascii）的编码，写入字段定义的encoding
+        
+        之后解析这些字段只按该编码解码一次，不再逐帧逐个尝试编码
+        
+        参数:
+            definition: 协议/命令定义或定义键
+            frames (list): 用于识别的报文（16进制字符串或bytes），为None时使用样本和报文记录
+            max_frames (int): 最多使用报文记录中最近的帧数
+            
+        返回:
+            tuple: (是否成功, 消息)
+        """
+        if isinstance(definition, str):
+            definition = self.get_protocol_by_key(definition)
+        if not definition:
+            return False, "协议不存在"
+        
+        if frames is None:
+            frames = self.get_command_samples(definition)
+            if self.frame_log is not None:
+                records = self.frame_log.query(self.get_frame_log_key(definition))[-max_frames:]
+                frames.extend(record.data for record in records)
+        
+        # 只学习定义中直接保存的字段（公共字段和分支字段），记录组的子字段不写回
+        fields = list(definition.get('fields', []))
+        for variant in (definition.get(VARIANTS_KEY) or {}).values():
+            if isinstance(variant, dict):
+                fields.extend(variant.get('fields', []))
+        samples = {id(field): (field, []) for field in fields if text_codec.text_kind(field)}
+        if not samples:
+            return False, f"{definition.get('name', '')} 没有可识别编码的字符串字段"
+        
+        for frame in frames:
+            hex_data = frame if isinstance(frame, str) else bytes(frame).hex()
+            parsed_data = self.parse_protocol_data(hex_data, definition)
+            for item in parsed_data.get('fields', []) if parsed_data else []:
+                entry = samples.get(id(item.definition))
+                if entry is not None and item.hex:
+                    entry[1].append(bytes.fromhex(item.hex))
+        
+        changes = []
+        for field, data in samples.values():
+            encoding, ratio = text_codec.detect_encoding(data)
+            if encoding and field.get('encoding') != encoding:
+                field['encoding'] = encoding
+                changes.append(f"{field.get('name', '')}: {encoding} ({ratio:.0%})")
+        if not changes:
+            return True, f"{definition.get('name', '')} 的字符串字段编码没有变化（{len(frames)} 帧）"
+        
+        self._notify_definition_changed(definition, structural=False, action='field')
+        success, message = self.save_protocol(definition, notify=False)
+        if not success:
+            return False, message
+        return True, f"根据 {len(frames)} 帧识别编码: " + "，".join(changes)
+    
+    def get_frame_encoder(self, definition):
+        """获取协议/命令的报文编码器，定义未修改时复用已编译的编码器
+        
+        返回:
+            FrameEncoder: 编码器；没有报文样本作为模板时返回None
+        """
+        definition_key = self.get_definition_key(definition)
+        version = self.get_definition_version(definition)
+        cached = self._encoders.get(definition_key)
+        if cached is not None and cached[0] == version:
+            return cached[1]
+        
+        template = self.get_command_sample(definition)
+        if not template:
+            return None
+        variant_table = self.get_variant_table(definition)
+        if variant_table is not None:
+            # 编码时按与解析相同的规则取选择字段的值来选用分支
+            def decode_selector(data):
+                selector = self._parse_field(variant_table.selector, data.hex())
+                return selector.value if selector else None
+            encoder = FrameEncoder(definition, template, variant_table, decode_selector)
+        else:
+            encoder = FrameEncoder(definition, template)
+        self._encoders[definition_key] = (version, encoder)
+        return encoder
+    
+    def encode_frame(self, protocol_key, values):
+        """按字段值生成一帧报文，以报文样本为模板
+        
+        参数:
+            protocol_key (str): 协议/命令键
+            values (dict): 字段名 -> 值
+            
+        返回:
+            tuple: (是否成功, 大写16进制字符串或错误消息)
+        """
+        definition = self.get_protocol_by_key(protocol_key)
+        if not definition:
+            return False, f"协议 {protocol_key} 不存在"
+        try:
+            encoder = self.get_frame_encoder(definition)
+            if encoder is None:
+                return False, f"{definition.get('name', protocol_key)} 没有报文样本，无法作为模板"
+            return True, encoder.encode(values).hex().upper()
+        except ValueError as e:
+            return False, str(e)
+    
+    def add_command_sample(self, protocol_key, hex_data):
+        """为协议/命令添加一个报文样本，相同内容只记录一次
+        
+        返回:
+            tuple: (是否成功, 消息)
+        """
+        protocol = self.get_protocol_by_key(protocol_key)
+        if not protocol:
+            return False, f"样本添加失败: 协议 {protocol_key} 不存在"
+        
+        digest = self.sample_store.put(hex_data)
+        if digest is None:
+            return False, "样本添加失败: 不是有效的16进制数据"
+        samples = protocol.setdefault('samples', [])
+        if digest in samples:
+            return True, "样本已存在"
+        samples.append(digest)
+        
+        success, message = self.save_protocol(protocol)
+        if not success:
+            return False, f"样本添加失败: {message}"
+        return True, f"样本已添加，共 {len(samples)} 个样本"
+    
+    def prune_samples(self):
+        """删除样本库中不再被任何定义引用的样本
+        
+        返回:
+            int: 删除的样本数量
+        """
+        referenced = set()
+        for protocol in self.protocols.values():
+            if isinstance(protocol, dict):
+                referenced.update(protocol.get('samples', []))
+        for definition in self._flatten_commands(self.protocol_commands):
+            referenced.update(definition.get('samples', []))
+        return self.sample_store.prune(referenced)
+    
     def _parse_field(self, field, hex_data):
         """解析单个字段"""
         try:
@@ -917,24 +2153,25 @@ class ProtocolManager:
             if not field_hex:
                 return None
             
-            # 根据字段类型解析值
-            value = self._convert_field_value(field_hex, field_type, endian)
+            # 根据字段类型解析值，位字段使用预编译的移位和掩码
+            if field_type.split('.')[0] == BIT_FIELD_TYPE:
+                value = FieldDef.from_dict(field).decode_bits(bytes.fromhex(field_hex))
+            else:
+                value = self._convert_field_value(field_hex, field_type, endian, field.get('encoding'))
             
-            return {
-                'name': field.get('name', ''),
-                'type': field_type,
-                'value': value,
-                'hex': field_hex,
-                'description': field.get('description', ''),
-                'start_pos': start_pos,
-                'end_pos': end_pos
-            }
+            # 解析结果只保存值和原始数据，其余属性引用字段定义
+            return DecodedField(field, value, field_hex)
         except Exception as e:
             print(f"解析字段失败: {e}, 字段: {field.get('name', '')}, 位置: {field.get('start_pos', 0)}-{field.get('end_pos', 0)}")
             return None
     
-    def _convert_field_value(self, hex_data, field_type, endian='big'):
-        """转换字段值为对应类型"""
+    def _convert_field_value(self, hex_data, field_type, endian='big', encoding=None):
+        """转换字段值为对应类型
+        
+        参数:
+            encoding (str): 字符串字段学习到的编码（见learn_text_encodings），
+                指定时char/char.ascii直接按该编码解码，出错时才使用原有规则
+        """
         try:
             # 处理带字节数的类型格式 (如 char.ascii.4)
             base_type = field_type
@@ -1056,19 +2293,15 @@ class ProtocolManager:
                     return hex_data
                     
             elif base_type == 'char.ascii':
-                # 将16进制转换为ASCII字符串，专门用于ASCII字符解析
+                # 可打印ASCII字符原样显示，其他字节用点表示；学习到其他编码时先按该编码解码
                 try:
-                    # 尝试将每个字节解析为ASCII字符
-                    result = []
-                    for i in range(0, len(hex_data), 2):
-                        if i+1 < len(hex_data):
-                            byte_val = int(hex_data[i:i+2], 16)
-                            # 只处理可打印的ASCII字符
-                            if 32 <= byte_val <= 126:  # ASCII可打印字符范围
-                                result.append(chr(byte_val))
-                            else:
-                                result.append('.')  # 用点表示不可打印字符
-                    return ''.join(result)
+                    data = bytes.fromhex(hex_data)
+                    if encoding and encoding != 'ascii':
+                        try:
+                            return data.decode(encoding)
+                        except (UnicodeDecodeError, LookupError):
+                            pass
+                    return text_codec.decode_printable(data)
                 except Exception as e:
                     print(f"ASCII字符串解析失败: {e}")
                     return hex_data
@@ -1090,6 +2323,13 @@ class ProtocolManager:
                         # 可能是纯数字，尝试显示数值
                         value = int(hex_data, 16)
                         return str(value)
+                    
+                    # 学习到的编码：只解码一次，出错时再逐个尝试
+                    if encoding:
+                        try:
+                            return bytes.fromhex(hex_data).decode(encoding)
+                        except (UnicodeDecodeError, LookupError):
+                            pass
                         
                     # 对于ASCII范围内的字符，直接用ASCII解码可能更好
                     is_ascii_range = True
@@ -1206,7 +2446,7 @@ class ProtocolManager:
             "char", "char.ascii", "ascii", "utf8", "string",
             "hex", "bytes",
             "timestamp", "date",
-            "bool"
+            "bool", BIT_FIELD_TYPE, GROUP_TYPE
         ]
     
     def add_protocol_field(self, protocol_key, field_name, field_type, start_pos, field_length, description=""):
@@ -1238,20 +2478,26 @@ class ProtocolManager:
                 field_type = f"{field_type}.{field_length}"
         
         # 添加新字段
-        new_field = {
-            'name': field_name,
-            'type': field_type,
-            'start_pos': start_pos,
-            'end_pos': end_pos,
-            'endian': 'little',  # 默认使用小端序
-            'description': description  # 添加描述字段
-        }
+        new_field = FieldDef(
+            name=field_name,
+            type=field_type,
+            start_pos=start_pos,
+            end_pos=end_pos,
+            endian='little',  # 默认使用小端序
+            description=description  # 添加描述字段
+        )
+        errors = self.check_field_placement(protocol, new_field)
+        if errors:
+            return False, f"字段添加失败: {'；'.join(errors)}"
+        version = self.get_definition_version(protocol)
         protocol['fields'].append(new_field)
         
         # 保存更新后的协议
-        success, message = self.save_protocol(protocol)
+        self._notify_definition_changed(protocol, structural=False, action='field')
+        success, message = self.save_protocol(protocol, notify=False)
         if not success:
             return False, f"字段添加失败: {message}"
+        self._update_field_index(protocol, version, None, new_field, self.get_protocol_by_key(protocol_key))
         
         return True, "字段添加成功"
     
@@ -1293,9 +2539,17 @@ class ProtocolManager:
                     field_type = f"{field_type}.{field_length}"
         
         # 更新字段数据
+        field_data = FieldDef.from_dict(field_data)
         field_data['type'] = field_type
         
+        # 检查位置：编辑已有字段时不与原字段比较
+        old_field = protocol['fields'][field_index] if field_index < len(protocol['fields']) else None
+        errors = self.check_field_placement(protocol, field_data, old_field)
+        if errors:
+            return False, f"字段更新失败: {'；'.join(errors)}"
+        
         # 如果字段索引等于字段列表长度，表示添加新字段到末尾
+        version = self.get_definition_version(protocol)
         if field_index == len(protocol['fields']):
             protocol['fields'].append(field_data)
         else:
@@ -1303,12 +2557,77 @@ class ProtocolManager:
             protocol['fields'][field_index] = field_data
         
         # 保存更新后的协议
-        success, message = self.save_protocol(protocol)
+        self._notify_definition_changed(protocol, structural=False, action='field')
+        success, message = self.save_protocol(protocol, notify=False)
         if not success:
             return False, f"字段更新失败: {message}"
+        self._update_field_index(protocol, version, old_field, field_data, self.get_protocol_by_key(protocol_key))
         
         return True, "字段更新成功"
     
+    def get_field_index(self, definition):
+        """获取定义的字段区间索引，定义未修改时复用"""
+        definition_key = (self.get_definition_key(definition), definition.get('variant'))
+        version = self.get_definition_version(definition)
+        fields = definition.get('fields', [])
+        cached = self._field_indexes.get(definition_key)
+        if cached is not None and cached[0] == version and cached[1] is fields:
+            return cached[2]
+        index = FieldIntervalIndex(fields)
+        self._field_indexes[definition_key] = (version, fields, index)
+        return index
+    
+    def _update_field_index(self, definition, version, old_field, new_field, saved=None):
+        """字段增删改并保存后，增量更新已缓存的区间索引，并记录为保存后的定义的索引
+        
+        参数:
+            definition (dict): 修改的定义（其字段列表即缓存索引对应的列表）
+            version (int): 修改前的定义版本，缓存的索引不是该版本时不更新，下次使用时重新建立
+            saved (dict): 保存后内存中的定义（save_protocol保存的是副本），为None时即definition
+        """
+        definition_key = (self.get_definition_key(definition), definition.get('variant'))
+        cached = self._field_indexes.get(definition_key)
+        if cached is None or cached[0] != version or cached[1] is not definition.get('fields'):
+            return
+        index = cached[2]
+        if old_field is not None:
+            index.remove(old_field.get('name', ''))
+        if new_field is not None:
+            index.add(new_field)
+        saved = saved or definition
+        self._field_indexes[definition_key] = (self.get_definition_version(saved), saved.get('fields', []), index)
+    
+    def check_field_placement(self, definition, field, replaced=None):
+        """检查字段加入定义后是否与其他字段重叠、是否超出报文样本长度
+        
+        参数:
+            definition (dict): 协议/命令定义
+            field (dict): 要加入的字段
+            replaced (dict): 被替换的原字段（编辑字段时），不参与重叠检查
+            
+        返回:
+            list: 错误信息，没有错误时为空列表
+        """
+        sample = self.get_command_sample(definition)
+        frame_length = len(sample) // 2 if sample else None
+        exclude = replaced.get('name', '') if replaced is not None else None
+        return self.get_field_index(definition).check(field, frame_length, exclude)
+    
+    def get_field_coverage(self, definition, length, fields=None):
+        """字节覆盖图：从第一个字段开始到报文末尾，已定义和未定义的连续字节区间
+        
+        参数:
+            definition (dict): 协议/命令定义
+            length (int): 报文长度
+            fields (list): 按实际位置解析出的字段（变长/分支布局时），为None时使用定义中的字段
+            
+        返回:
+            list: (起始, 结束, 是否已定义)
+        """
+        index = self.get_field_index(definition) if fields is None else FieldIntervalIndex(fields)
+        first = index.first_start()
+        return index.coverage(length, first) if first is not None else []
+    
     def remove_protocol_field(self, protocol_key, field_index):
         """删除协议字段"""
         protocol = self.get_protocol_by_key(protocol_key)
@@ -1321,12 +2640,15 @@ class ProtocolManager:
         
         # 删除指定索引的字段
         field_name = protocol['fields'][field_index].get('name', '未命名字段')
-        del protocol['fields'][field_index]
+        version = self.get_definition_version(protocol)
+        old_field = protocol['fields'].pop(field_index)
         
         # 保存更新后的协议
-        success, message = self.save_protocol(protocol)
+        self._notify_definition_changed(protocol, structural=False, action='field')
+        success, message = self.save_protocol(protocol, notify=False)
         if not success:
             return False, f"字段删除失败: {message}"
+        self._update_field_index(protocol, version, old_field, None, self.get_protocol_by_key(protocol_key))
         
         return True, f"字段 {field_name} 删除成功"
     
@@ -1350,6 +2672,7 @@ class ProtocolManager:
             self.protocols = {}  # 清空协议字典
             self.commands = {}   # 清空命令字典
             self.protocol_commands = {}  # 清空协议指令字典
+            self._file_definitions = {}  # 清空文件索引
             
             # 重新加载所有协议
             result = self.load_all_protocols()
@@ -0,0 +1,347 @@
+# protocol_store.py - SQLite协议库存储模块
+import json
+import sqlite3
+from pathlib import Path
+from field_model import FieldDef, json_default
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS protocols (
+    id INTEGER PRIMARY KEY,
+    grp TEXT NOT NULL,
+    name TEXT NOT NULL,
+    protocol_id_hex TEXT,
+    data TEXT NOT NULL
+);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_protocols_group ON protocols(grp);
+CREATE INDEX IF NOT EXISTS idx_protocols_name ON protocols(name);
+
+CREATE TABLE IF NOT EXISTS commands (
+    id INTEGER PRIMARY KEY,
+    grp TEXT NOT NULL,
+    catalog TEXT NOT NULL,
+    command_key TEXT NOT NULL,
+    protocol_id_hex TEXT,
+    follow TEXT,
+    name TEXT,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_commands_match ON commands(grp, protocol_id_hex, follow);
+CREATE INDEX IF NOT EXISTS idx_commands_name ON commands(name);
+CREATE INDEX IF NOT EXISTS idx_commands_catalog ON commands(catalog, command_key);
+
+CREATE TABLE IF NOT EXISTS fields (
+    owner_kind TEXT NOT NULL,
+    owner_id INTEGER NOT NULL,
+    position INTEGER NOT NULL,
+    name TEXT,
+    type TEXT,
+    start_pos INTEGER,
+    end_pos INTEGER,
+    endian TEXT,
+    description TEXT,
+    extra TEXT,
+    PRIMARY KEY (owner_kind, owner_id, position)
+) WITHOUT ROWID;
+"""
+
+
+class SQLiteProtocolStore:
+    """SQLite协议库存储：协议、命令、字段分表保存
+
+    每个修改在一个事务中只更新受影响的行；可以与 protocols/<组>/protocol.json、
+    commands.json 目录结构互相导入导出。
+
+    - protocols: 每个协议组一行（对应protocol.json）
+    - commands: 每个命令一行，catalog/command_key 为commands.json中的协议名和命令ID键
+    - fields: 每个字段一行，owner_kind为'protocol'或'command'
+
+    定义中除fields外的内容按原样保存在data列(JSON)中，常用的查询列另外存一份；
+    字段中FieldDef之外的键保存在extra列中，导出时原样写回
+    """
+
+    def __init__(self, db_path):
+        self.db_path = str(db_path)
+        self.conn = sqlite3.connect(self.db_path)
+        self.conn.executescript(_SCHEMA)
+
+    def close(self):
+        """关闭数据库连接"""
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+
+    def is_empty(self):
+        """数据库中是否还没有任何协议和命令"""
+        row = self.conn.execute(
+            "SELECT (SELECT COUNT(*) FROM protocols) + (SELECT COUNT(*) FROM commands)").fetchone()
+        return row[0] == 0
+
+    # ---------- 读取 ----------
+
+    def load_protocols(self):
+        """读取所有协议
+
+        返回:
+            list: [(组, 协议定义)]
+        """
+        fields = self._load_fields('protocol')
+        return [(grp, self._to_definition(data, fields.get(row_id)))
+                for row_id, grp, data in self.conn.execute(
+                    "SELECT id, grp, data FROM protocols ORDER BY id")]
+
+    def load_commands(self):
+        """读取所有命令，按写入顺序返回
+
+        返回:
+            list: [(组, 协议名, 命令ID键, 命令定义)]
+        """
+        fields = self._load_fields('command')
+        return [(grp, catalog, command_key, self._to_definition(data, fields.get(row_id)))
+                for row_id, grp, catalog, command_key, data in self.conn.execute(
+                    "SELECT id, grp, catalog, command_key, data FROM commands ORDER BY id")]
+
+    def _load_fields(self, owner_kind):
+        """一次查询读取某类定义的全部字段: 定义行ID -> [FieldDef]"""
+        fields = {}
+        rows = self.conn.execute(
+            "SELECT owner_id, name, type, start_pos, end_pos, endian, description, extra "
+            "FROM fields WHERE owner_kind = ? ORDER BY owner_id, position", (owner_kind,))
+        for row in rows:
+            fields.setdefault(row[0], []).append(self._row_to_field(row[1:]))
+        return fields
+
+    def _row_to_field(self, row):
+        values = {key: value for key, value in zip(FieldDef.KEYS, row[:-1]) if value is not None}
+        extra = json.loads(row[-1]) if row[-1] else None
+        return FieldDef(**values, extra=extra)
+
+    def _to_definition(self, data, fields):
+        definition = json.loads(data)
+        # data中的fields占位保留了键的原始位置，没有该键的定义保持没有
+        if 'fields' in definition:
+            definition['fields'] = fields or []
+        return definition
+
+    # ---------- 写入 ----------
+
+    def save_protocol(self, group, protocol):
+        """保存协议（每组一个），只更新协议行和变化的字段行"""
+        with self.conn:
+            self._write_protocol(group, protocol)
+
+    def save_command(self, group, catalog, command_key, command):
+        """保存命令
+
+        与ProtocolManager.save_protocol一致，同一协议名、命令ID下名称和follow都相同的命令视为同一个，
+        存在时更新该行，否则新增一行
+        """
+        with self.conn:
+            row = self.conn.execute(
+                "SELECT id FROM commands WHERE catalog = ? AND command_key = ? AND name IS ? AND follow IS ? "
+                "ORDER BY id LIMIT 1",
+                (catalog, command_key, command.get('name'), command.get('follow', ''))).fetchone()
+            self._write_command(group, catalog, command_key, command, row[0] if row else None)
+
+    def replace_catalog(self, group, catalog, commands):
+        """整体替换一个协议名下的所有命令（批量导入、删除命令后使用）
+
+        参数:
+            commands (dict): {命令ID键: [命令] 或 命令}
+        """
+        with self.conn:
+            self._delete_catalog(catalog)
+            for command_key, command_list in commands.items():
+                for command in (command_list if isinstance(command_list, list) else [command_list]):
+                    if isinstance(command, dict):
+                        self._write_command(group, catalog, command_key, command)
+
+    def delete_command(self, catalog, command_key, name):
+        """删除协议名、命令ID下指定名称的命令"""
+        with self.conn:
+            condition = "catalog = ? AND command_key = ? AND name IS ?"
+            params = (catalog, command_key, name)
+            self.conn.execute(
+                "DELETE FROM fields WHERE owner_kind = 'command' AND owner_id IN "
+                f"(SELECT id FROM commands WHERE {condition})", params)
+            self.conn.execute(f"DELETE FROM commands WHERE {condition}", params)
+
+    def delete_protocol(self, group, catalog=None):
+        """删除协议组的协议行；指定catalog时同时删除该协议名下的命令"""
+        with self.conn:
+            self.conn.execute(
+                "DELETE FROM fields WHERE owner_kind = 'protocol' AND owner_id IN "
+                "(SELECT id FROM protocols WHERE grp = ?)", (group,))
+            self.conn.execute("DELETE FROM protocols WHERE grp = ?", (group,))
+            if catalog is not None:
+                self._delete_catalog(catalog)
+
+    def _write_protocol(self, group, protocol):
+        row = self.conn.execute("SELECT id FROM protocols WHERE grp = ?", (group,)).fetchone()
+        values = (protocol.get('name', ''), protocol.get('protocol_id_hex'), self._definition_data(protocol))
+        if row:
+            row_id = row[0]
+            self.conn.execute("UPDATE protocols SET name = ?, protocol_id_hex = ?, data = ? WHERE id = ?",
+                              values + (row_id,))
+        else:
+            row_id = self.conn.execute(
+                "INSERT INTO protocols (grp, name, protocol_id_hex, data) VALUES (?, ?, ?, ?)",
+                (group,) + values).lastrowid
+        self._write_fields('protocol', row_id, protocol.get('fields'))
+
+    def _write_command(self, group, catalog, command_key, command, row_id=None):
+        values = (group, catalog, command_key, command.get('protocol_id_hex', command_key),
+                  command.get('follow', ''), command.get('name'), self._definition_data(command))
+        if row_id is None:
+            row_id = self.conn.execute(
+                "INSERT INTO commands (grp, catalog, command_key, protocol_id_hex, follow, name, data) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)", values).lastrowid
+        else:
+            self.conn.execute(
+                "UPDATE commands SET grp = ?, catalog = ?, command_key = ?, protocol_id_hex = ?, "
+                "follow = ?, name = ?, data = ? WHERE id = ?", values + (row_id,))
+        self._write_fields('command', row_id, command.get('fields'))
+
+    def _delete_catalog(self, catalog):
+        self.conn.execute(
+            "DELETE FROM fields WHERE owner_kind = 'command' AND owner_id IN "
+            "(SELECT id FROM commands WHERE catalog = ?)", (catalog,))
+        self.conn.execute("DELETE FROM commands WHERE catalog = ?", (catalog,))
+
+    def _write_fields(self, owner_kind, owner_id, fields):
+        """写入字段，只更新内容变化的行"""
+        fields = fields or []
+        existing = {row[0]: row[1:] for row in self.conn.execute(
+            "SELECT position, name, type, start_pos, end_pos, endian, description, extra "
+            "FROM fields WHERE owner_kind = ? AND owner_id = ?", (owner_kind, owner_id))}
+
+        for position, field in enumerate(fields):
+            row = self._field_to_row(field)
+            if existing.get(position) != row:
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO fields (owner_kind, owner_id, position, name, type, start_pos, "
+                    "end_pos, endian, description, extra) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (owner_kind, owner_id, position) + row)
+        if len(existing) > len(fields):
+            self.conn.execute("DELETE FROM fields WHERE owner_kind = ? AND owner_id = ? AND position >= ?",
+                              (owner_kind, owner_id, len(fields)))
+
+    def _field_to_row(self, field):
+        field = FieldDef.from_dict(field)
+        extra = json.dumps(field.extra, ensure_ascii=False, default=json_default) if field.extra else None
+        return tuple(field.get(key) for key in FieldDef.KEYS) + (extra,)
+
+    def _definition_data(self, definition):
+        # fields单独存表，这里只保留占位以记住键的位置
+        data = {key: (None if key == 'fields' else value) for key, value in definition.items()}
+        return json.dumps(data, ensure_ascii=False, default=json_default)
+
+    # ---------- 导入导出 ----------
+
+    def import_directory(self, data_dir):
+        """从 protocols/<组>/ 目录结构导入，替换数据库中的全部内容
+
+        读取protocol.json、commands.json以及旧格式的单个命令文件(ID.json、command_ID_name.json)
+
+        返回:
+            tuple: (是否成功, 消息)
+        """
+        data_dir = Path(data_dir)
+        try:
+            with self.conn:
+                self.conn.execute("DELETE FROM fields")
+                self.conn.execute("DELETE FROM commands")
+                self.conn.execute("DELETE FROM protocols")
+                protocol_count = command_count = 0
+
+                for file_path in sorted(data_dir.glob("**/protocol.json")):
+                    with open(file_path, 'r', encoding='utf-8') as f:
+                        protocol = json.load(f)
+                    if protocol.get("type") == "protocol":
+                        self._write_protocol(file_path.parent.name, protocol)
+                        protocol_count += 1
+
+                for file_path in sorted(data_dir.glob("**/*.json")):
+                    if file_path.name == "protocol.json":
+                        continue
+                    for catalog, command_key, command in self._iter_command_file(file_path):
+                        self._write_command(file_path.parent.name, catalog, command_key, command)
+                        command_count += 1
+
+            print(f"从 {data_dir} 导入 {protocol_count} 个协议, {command_count} 个命令")
+            return True, f"已导入 {protocol_count} 个协议, {command_count} 个命令"
+        except Exception as e:
+            print(f"导入协议目录失败: {e}")
+            return False, f"导入协议目录失败: {e}"
+
+    def _iter_command_file(self, file_path):
+        """逐个产出命令文件中的 (协议名, 命令ID键, 命令)"""
+        with open(file_path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        group = file_path.parent.name
+
+        if file_path.name == "commands.json":
+            catalogs = data.items()
+        elif file_path.name.startswith("command_"):
+            catalogs = [(group, {file_path.stem.split('_', 2)[1]: data})]
+        else:
+            catalogs = [(group, {file_path.stem: data})]
+
+        for catalog, commands in catalogs:
+            if not isinstance(commands, dict):
+                continue
+            for command_key, command_list in commands.items():
+                for command in (command_list if isinstance(command_list, list) else [command_list]):
+                    if isinstance(command, dict):
+                        yield catalog, command_key, command
+
+    def export_directory(self, data_dir):
+        """导出为 protocols/<组>/protocol.json 和 commands.json 目录结构
+
+        返回:
+            tuple: (是否成功, 消息)
+        """
+        data_dir = Path(data_dir)
+        try:
+            files = {}
+            for group, protocol in self.load_protocols():
+                files[data_dir / group / "protocol.json"] = protocol
+            for group, catalog, command_key, command in self.load_commands():
+                catalogs = files.setdefault(data_dir / group / "commands.json", {})
+                catalogs.setdefault(catalog, {}).setdefault(command_key, []).append(command)
+
+            for file_path, content in files.items():
+                file_path.parent.mkdir(exist_ok=True, parents=True)
+                with open(file_path, 'w', encoding='utf-8') as f:
+                    json.dump(content, f, ensure_ascii=False, indent=2, default=json_default)
+
+            print(f"导出 {len(files)} 个文件到 {data_dir}")
+            return True, f"已导出 {len(files)} 个文件到 {data_dir}"
+        except Exception as e:
+            print(f"导出协议目录失败: {e}")
+            return False, f"导出协议目录失败: {e}"
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="协议库SQLite存储导入导出")
+    subparsers = parser.add_subparsers(dest="action", required=True)
+    import_parser = subparsers.add_parser("import", help="从协议目录导入到数据库")
+    import_parser.add_argument("data_dir")
+    import_parser.add_argument("db_path")
+    export_parser = subparsers.add_parser("export", help="从数据库导出到协议目录")
+    export_parser.add_argument("db_path")
+    export_parser.add_argument("data_dir")
+    args = parser.parse_args()
+
+    store = SQLiteProtocolStore(args.db_path)
+    try:
+        if args.action == "import":
+            success, message = store.import_directory(args.data_dir)
+        else:
+            success, message = store.export_directory(args.data_dir)
+    finally:
+        store.close()
+    print(message)
+    raise SystemExit(0 if success else 1)
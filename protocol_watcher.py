@@ -0,0 +1,98 @@
+# protocol_watcher.py - 协议目录监视模块
+import os
+
+
+class ProtocolWatcher:
+    """协议目录监视类：检测protocols目录中变化的json文件，只重新加载这些文件
+
+    默认通过比较文件的修改时间和大小进行轮询；安装了inotify_simple时，
+    只在收到文件系统事件后才扫描目录
+    """
+
+    def __init__(self, protocol_manager):
+        self.protocol_manager = protocol_manager
+        self.data_dir = str(protocol_manager.data_dir)
+        self._snapshot = self._scan()  # 文件路径 -> (mtime_ns, size)
+        self._inotify = None
+        self._watch_dirs = {}
+        self._init_inotify()
+
+    def _init_inotify(self):
+        """inotify可用时监视协议目录及其子目录"""
+        try:
+            from inotify_simple import INotify, flags
+        except ImportError:
+            return
+
+        try:
+            self._inotify = INotify()
+            self._watch_flags = (flags.CLOSE_WRITE | flags.MOVED_TO | flags.MOVED_FROM |
+                                 flags.CREATE | flags.DELETE | flags.DELETE_SELF)
+            self._add_watches()
+            print("协议目录监视: 使用inotify")
+        except OSError as e:
+            print(f"inotify初始化失败，改为轮询: {e}")
+            self._inotify = None
+
+    def _add_watches(self):
+        """为新出现的子目录添加inotify监视"""
+        for root, dirs, files in os.walk(self.data_dir):
+            if root not in self._watch_dirs.values():
+                wd = self._inotify.add_watch(root, self._watch_flags)
+                self._watch_dirs[wd] = root
+
+    def _scan(self):
+        """扫描协议目录下所有json文件的状态"""
+        snapshot = {}
+        for root, dirs, files in os.walk(self.data_dir):
+            for name in files:
+                if not name.endswith(".json"):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                snapshot[path] = (stat.st_mtime_ns, stat.st_size)
+        return snapshot
+
+    def poll(self):
+        """检查变化并重新加载变化的文件
+
+        返回:
+            list: 重新加载的文件路径，没有变化时为空列表
+        """
+        if self._inotify is not None:
+            events = self._inotify.read(timeout=0)
+            if not events:
+                return []
+            # 目录结构可能变化，补充监视新目录
+            self._add_watches()
+
+        snapshot = self._scan()
+        changed = [path for path, state in snapshot.items() if self._snapshot.get(path) != state]
+        removed = [path for path in self._snapshot if path not in snapshot]
+        self._snapshot = snapshot
+
+        # 先处理protocol.json，再处理命令文件，与完整加载的顺序一致
+        changed.sort(key=lambda path: os.path.basename(path) != "protocol.json")
+
+        reloaded = []
+        for path in removed + changed:
+            # 跳过本程序自己保存/删除的文件
+            if self.protocol_manager.is_own_change(path):
+                continue
+            success, message = self.protocol_manager.reload_protocol_file(path)
+            if success:
+                reloaded.append(path)
+            else:
+                # 文件可能还没写完，下次轮询时重试
+                print(f"协议文件重新加载失败: {message}")
+                self._snapshot.pop(path, None)
+        return reloaded
+
+    def close(self):
+        """停止监视"""
+        if self._inotify is not None:
+            self._inotify.close()
+            self._inotify = None
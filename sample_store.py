@@ -0,0 +1,113 @@
+# sample_store.py - 报文样本存储模块
+import os
+import zlib
+import lzma
+import hashlib
+from collections import OrderedDict
+
+
+class SampleStore:
+    """按内容寻址的报文样本存储
+
+    样本以字节形式压缩后保存在 <根目录>/<摘要前两位>/<摘要> 文件中，
+    相同内容只保存一份；协议/命令定义中只记录摘要列表(samples)，
+    需要预览时再按摘要读取
+    """
+
+    CODECS = {
+        'zlib': (b'z', lambda data: zlib.compress(data, 9)),
+        'lzma': (b'x', lzma.compress),
+    }
+    DECOMPRESSORS = {b'z': zlib.decompress, b'x': lzma.decompress}
+
+    def __init__(self, root_dir, codec='zlib', cache_size=128):
+        """
+        参数:
+            root_dir: 样本存储目录
+            codec (str): 新样本使用的压缩方式，'zlib' 或 'lzma'
+            cache_size (int): 内存中缓存的已解压样本数量
+        """
+        if codec not in self.CODECS:
+            raise ValueError(f"不支持的压缩方式: {codec}")
+        self.root_dir = str(root_dir)
+        self.codec = codec
+        self.cache_size = cache_size
+        self._cache = OrderedDict()  # 摘要 -> 16进制字符串
+
+    def _path(self, digest):
+        return os.path.join(self.root_dir, digest[:2], digest)
+
+    def put(self, hex_data):
+        """保存一个样本
+
+        参数:
+            hex_data (str): 16进制字符串，可以包含空格
+
+        返回:
+            str: 样本摘要；数据不是有效的16进制时返回None
+        """
+        try:
+            data = bytes.fromhex(hex_data)
+        except (TypeError, ValueError):
+            return None
+        if not data:
+            return None
+
+        digest = hashlib.blake2b(data, digest_size=16).hexdigest()
+        path = self._path(digest)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tag, compress = self.CODECS[self.codec]
+            # 先写临时文件再替换，避免留下不完整的样本
+            temp_path = f"{path}.tmp"
+            with open(temp_path, 'wb') as f:
+                f.write(tag + compress(data))
+            os.replace(temp_path, path)
+        self._remember(digest, data.hex().upper())
+        return digest
+
+    def get(self, digest):
+        """按摘要读取样本
+
+        返回:
+            str: 大写16进制字符串；样本不存在时返回空字符串
+        """
+        if digest in self._cache:
+            self._cache.move_to_end(digest)
+            return self._cache[digest]
+        try:
+            with open(self._path(digest), 'rb') as f:
+                blob = f.read()
+            hex_data = self.DECOMPRESSORS[blob[:1]](blob[1:]).hex().upper()
+        except (OSError, KeyError, zlib.error, lzma.LZMAError) as e:
+            print(f"读取样本 {digest} 失败: {e}")
+            return ""
+        self._remember(digest, hex_data)
+        return hex_data
+
+    def __contains__(self, digest):
+        return digest in self._cache or os.path.exists(self._path(digest))
+
+    def _remember(self, digest, hex_data):
+        self._cache[digest] = hex_data
+        self._cache.move_to_end(digest)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    def prune(self, keep_digests):
+        """删除不再被任何定义引用的样本
+
+        返回:
+            int: 删除的样本数量
+        """
+        keep_digests = set(keep_digests)
+        removed = 0
+        if not os.path.isdir(self.root_dir):
+            return removed
+        for root, dirs, files in os.walk(self.root_dir):
+            for name in files:
+                if name not in keep_digests:
+                    os.remove(os.path.join(root, name))
+                    self._cache.pop(name, None)
+                    removed += 1
+        return removed
@@ -0,0 +1,153 @@
+# serial_capture.py - 串口/伪终端抓包模块
+import os
+
+from framing import FrameAssembler
+
+READ_SIZE = 65536
+
+# 波特率 -> termios常量名
+_BAUD_NAMES = {rate: f"B{rate}" for rate in (9600, 19200, 38400, 57600, 115200, 230400, 460800, 921600)}
+
+
+def open_serial(path, baudrate=115200):
+    """以非阻塞方式打开串口设备或伪终端，并设置为原始模式
+
+    参数:
+        path (str): 设备路径，如 /dev/ttyUSB0
+        baudrate (int): 波特率，伪终端忽略
+
+    返回:
+        int: 文件描述符
+
+    异常:
+        OSError: 打开失败
+        ValueError: 不支持的波特率
+    """
+    fd = os.open(path, os.O_RDWR | os.O_NOCTTY | os.O_NONBLOCK)
+    try:
+        configure_raw(fd, baudrate)
+    except Exception:
+        os.close(fd)
+        raise
+    return fd
+
+
+def configure_raw(fd, baudrate=115200):
+    """把终端设置为原始模式（8N1，无回显，无流控），非终端的描述符不做处理"""
+    if not os.isatty(fd):
+        return
+    try:
+        import termios
+        import tty
+    except ImportError:
+        print("当前平台不支持termios，串口参数保持不变")
+        return
+
+    tty.setraw(fd, termios.TCSANOW)
+    attrs = termios.tcgetattr(fd)
+    baud_name = _BAUD_NAMES.get(baudrate)
+    if baud_name is None or not hasattr(termios, baud_name):
+        raise ValueError(f"不支持的波特率: {baudrate}")
+    speed = getattr(termios, baud_name)
+    attrs[4] = attrs[5] = speed  # ispeed / ospeed
+    attrs[2] |= termios.CLOCAL | termios.CREAD
+    attrs[2] &= ~(termios.CSTOPB | termios.PARENB)
+    if hasattr(termios, 'CRTSCTS'):
+        attrs[2] &= ~termios.CRTSCTS
+    attrs[0] &= ~(termios.IXON | termios.IXOFF | termios.IXANY)
+    termios.tcsetattr(fd, termios.TCSANOW, attrs)
+
+
+class SerialFrameReader:
+    """从非阻塞描述符成块读取数据并分帧
+
+    每次可读时用os.read一次取走内核缓冲区中的全部数据，分帧由FrameAssembler
+    按帧头字节(bytes.find)和长度字段完成，不逐字节处理
+    """
+
+    def __init__(self, fd, assembler=None, read_size=READ_SIZE):
+        self.fd = fd
+        self.assembler = assembler or FrameAssembler()
+        self.read_size = read_size
+        self.byte_count = 0
+        self.closed = False
+
+    def read_frames(self):
+        """读取当前所有可读数据，返回其中的完整帧；对端关闭时closed置为True"""
+        frames = []
+        while True:
+            try:
+                data = os.read(self.fd, self.read_size)
+            except BlockingIOError:
+                break
+            except OSError as e:
+                # 伪终端另一端关闭时Linux返回EIO
+                print(f"串口读取结束: {e}")
+                self.closed = True
+                break
+            if not data:
+                self.closed = True
+                break
+            self.byte_count += len(data)
+            frames.extend(self.assembler.feed(data))
+            if len(data) < self.read_size:
+                break
+        return frames
+
+    def close(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+        self.closed = True
+
+
+if __name__ == "__main__":
+    import argparse
+    import selectors
+    import time
+
+    parser = argparse.ArgumentParser(description="从串口读取并分帧，或用伪终端回放协议样本")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    read_parser = subparsers.add_parser("read", help="读取串口并打印分出的帧")
+    read_parser.add_argument("device", help="串口设备")
+    read_parser.add_argument("--baudrate", type=int, default=115200)
+    read_parser.add_argument("--seconds", type=float, default=10)
+
+    pty_parser = subparsers.add_parser("pty", help="创建伪终端并循环写入协议样本，打印从端路径")
+    pty_parser.add_argument("--data-dir", default="protocols", help="协议目录")
+    pty_parser.add_argument("--interval", type=float, default=0.01, help="帧间隔(秒)")
+    args = parser.parse_args()
+
+    if args.command == "read":
+        reader = SerialFrameReader(open_serial(args.device, args.baudrate))
+        selector = selectors.DefaultSelector()
+        selector.register(reader.fd, selectors.EVENT_READ)
+        deadline = time.time() + args.seconds
+        count = 0
+        while time.time() < deadline and not reader.closed:
+            if selector.select(timeout=0.2):
+                for frame in reader.read_frames():
+                    count += 1
+                    print(f"{len(frame):>5} {frame.hex().upper()[:64]}")
+        reader.close()
+        print(f"共 {count} 帧，{reader.byte_count} 字节，丢弃 {reader.assembler.discarded} 字节")
+    else:
+        import pty
+        from protocol_manager import ProtocolManager
+        from live_capture import collect_sample_frames
+
+        sample_frames = collect_sample_frames(ProtocolManager(args.data_dir))
+        master_fd, slave_fd = pty.openpty()
+        configure_raw(slave_fd)
+        print(f"伪终端从端: {os.ttyname(slave_fd)}，回放 {len(sample_frames)} 个样本帧，Ctrl+C退出")
+        try:
+            while True:
+                for frame in sample_frames:
+                    os.write(master_fd, frame)
+                    time.sleep(args.interval)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            os.close(master_fd)
+            os.close(slave_fd)
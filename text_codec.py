@@ -0,0 +1,136 @@
+# text_codec.py - 字符串字段编码识别与批量解码模块
+import codecs
+
+# 按优先级排列的候选编码，与_convert_field_value逐个尝试的顺序一致
+CANDIDATE_ENCODINGS = ('ascii', 'utf-8', 'gb2312', 'latin1')
+
+# 单字节编码：整列拼接后一次解码，再按字段长度切分
+_SINGLE_BYTE = ('ascii', 'latin1')
+
+# 可打印ASCII之外的字节替换为'.'，用于char.ascii
+PRINTABLE_ASCII = bytes(b if 32 <= b <= 126 else ord('.') for b in range(256))
+
+
+def text_kind(field):
+    """字符串字段的类型，与_convert_field_value对类型名的解析一致
+
+    'char.ascii'（不带字节数）返回'char.ascii'；char、char.N 以及 char.ascii.N 都按char解析，
+    其中不超过4字节的解析为数字，不算字符串字段
+
+    返回:
+        str|None: 'char.ascii'、'char' 或 None
+    """
+    parts = str(field.get('type', '')).split('.')
+    if parts[0] != 'char':
+        return None
+    if len(parts) == 2 and not parts[1].isdigit():
+        return 'char.ascii' if parts[1] == 'ascii' else None
+    return 'char' if field.get('end_pos', 0) - field.get('start_pos', 0) + 1 > 4 else None
+
+
+def column_encoding(field):
+    """批量解码一列时使用的编码，None表示该字段不走批量字符串解码"""
+    kind = text_kind(field)
+    encoding = field.get('encoding')
+    if kind == 'char.ascii':
+        return encoding if encoding and encoding != 'ascii' else 'printable'
+    if kind == 'char':
+        return encoding
+    return None
+
+
+def detect_encoding(samples, candidates=CANDIDATE_ENCODINGS):
+    """在一批字段数据上识别字符串编码
+
+    按优先级选择第一个能无错误解码全部样本的编码；都不能全部解码时选择能解码最多样本的编码，
+    latin1总能解码，只在其他编码都不能解码任何样本时使用
+
+    参数:
+        samples (iterable): 字段的bytes数据
+        candidates (tuple): 候选编码
+
+    返回:
+        tuple: (编码名, 能解码的样本比例)，没有样本时为 (None, 0.0)
+    """
+    samples = [bytes(sample) for sample in samples if sample]
+    if not samples:
+        return None, 0.0
+
+    best, best_count = None, -1
+    for encoding in candidates:
+        decoder = codecs.getdecoder(encoding)
+        count = 0
+        for sample in samples:
+            try:
+                decoder(sample)
+                count += 1
+            except UnicodeDecodeError:
+                pass
+        if count == len(samples):
+            return encoding, 1.0
+        if count > best_count and (encoding != 'latin1' or best_count <= 0):
+            best, best_count = encoding, count
+    return best, best_count / len(samples)
+
+
+def decode_printable(data):
+    """按char.ascii的规则解码：可打印ASCII原样，其他字节显示为'.'"""
+    return data.translate(PRINTABLE_ASCII).decode('ascii')
+
+
+def decode_column(chunks, encoding, fallback):
+    """用同一编码批量解码一列字符串字段
+
+    单字节编码且各项等长时整列拼接后只解码一次；其他编码逐项解码，
+    解码出错的项交给fallback（通常是逐个尝试编码的原有逻辑）
+
+    参数:
+        chunks (list): 每帧字段的bytes，帧长度不足时为None
+        encoding (str): 编码名，'printable'表示按char.ascii规则
+        fallback (callable): fallback(bytes) -> 值
+
+    返回:
+        list: 解码结果，None项保持None
+    """
+    present = [chunk for chunk in chunks if chunk is not None]
+    if not present:
+        return list(chunks)
+
+    width = len(present[0])
+    if (encoding == 'printable' or encoding in _SINGLE_BYTE) and width and all(len(chunk) == width for chunk in present):
+        joined = b''.join(present)
+        try:
+            text = decode_printable(joined) if encoding == 'printable' else joined.decode(encoding)
+        except UnicodeDecodeError:
+            text = None
+        if text is not None:
+            pieces = iter([text[i:i + width] for i in range(0, len(text), width)])
+            return [None if chunk is None else next(pieces) for chunk in chunks]
+
+    if encoding == 'printable':
+        return [None if chunk is None else decode_printable(chunk) for chunk in chunks]
+    decoder = codecs.getdecoder(encoding)
+    values = []
+    for chunk in chunks:
+        if chunk is None:
+            values.append(None)
+            continue
+        try:
+            values.append(decoder(chunk)[0])
+        except UnicodeDecodeError:
+            values.append(fallback(chunk))
+    return values
+
+
+if __name__ == "__main__":
+    import argparse
+    from protocol_manager import ProtocolManager
+
+    parser = argparse.ArgumentParser(description="在报文样本和报文记录上识别字符串字段的编码并写入协议定义")
+    parser.add_argument("protocol_key", help="协议/命令键，如 livewire/DB")
+    parser.add_argument("--data-dir", default="protocols", help="协议目录")
+    args = parser.parse_args()
+
+    manager = ProtocolManager(args.data_dir)
+    success, message = manager.learn_text_encodings(args.protocol_key)
+    print(message)
@@ -6,11 +6,12 @@ from datetime import datetime
 import re
 import json
 import os
+from field_model import FieldDef, BIT_FIELD_TYPE
 
 class ProtocolSelectionDialog(tk.Toplevel):
     """协议选择和归档对话框"""
     
-    def __init__(self, parent, hex_data, callback, parent_protocol=None):
+    def __init__(self, parent, hex_data, callback, parent_protocol=None, protocol_manager=None):
         super().__init__(parent)
         self.title("数据归档")
         self.resizable(True, True)
@@ -24,6 +25,7 @@ class ProtocolSelectionDialog(tk.Toplevel):
         self.hex_data = hex_data
         self.callback = callback
         self.parent_protocol = parent_protocol
+        self.protocol_manager = protocol_manager
         
         # 保存原始hex_data，避免在多次归入时数据被修改
         self.original_hex_data = hex_data
@@ -137,9 +139,10 @@ class ProtocolSelectionDialog(tk.Toplevel):
         
         ttk.Label(self.parent_frame, text="归属协议:").pack(side=tk.LEFT, padx=(0, 5))
         
-        # 从protocol_manager获取协议列表
-        from protocol_manager import ProtocolManager
-        self.protocol_manager = ProtocolManager()
+        # 从protocol_manager获取协议列表，未传入时从协议目录加载
+        if self.protocol_manager is None:
+            from protocol_manager import ProtocolManager
+            self.protocol_manager = ProtocolManager()
         
         # 获取所有协议
         protocols = {}
@@ -418,12 +421,13 @@ class ProtocolSelectionDialog(tk.Toplevel):
 class ProtocolEditor(tk.Toplevel):
     """协议编辑器对话框"""
     
-    def __init__(self, parent, protocol_manager, protocol_key=None, highlight_field=None):
+    def __init__(self, parent, protocol_manager, protocol_key=None, highlight_field=None, action_profiler=None):
         super().__init__(parent)
         self.parent = parent
         self.protocol_manager = protocol_manager
         self.protocol_key = protocol_key
         self.highlight_field = highlight_field
+        self.action_profiler = action_profiler  # 可选的性能分析器，用于记录保存操作
         
         # 初始化变量
         self.protocol_name_var = tk.StringVar()
@@ -1005,8 +1009,18 @@ class ProtocolEditor(tk.Toplevel):
             print(f"已选择{'命令' if is_command else '协议'}: {protocol_key}")
             print(f"详情: {protocol}")
     
+    def _run_profiled(self, action_name, func, *args):
+        """如果设置了性能分析器，通过分析器执行操作"""
+        if self.action_profiler:
+            return self.action_profiler.run(action_name, func, *args)
+        return func(*args)
+    
     def _save_changes(self):
         """保存协议信息的更改"""
+        self._run_profiled("editor_save", self._do_save_changes)
+    
+    def _do_save_changes(self):
+        """执行协议信息保存"""
         if not self.protocol_list.curselection():
             messagebox.showerror("错误", "未选择协议")
             print("保存失败: 列表中没有选中的项")
@@ -1299,7 +1313,8 @@ class ProtocolEditor(tk.Toplevel):
             dialog = ProtocolSelectionDialog(
                 parent=self,  # 使用self作为父窗口
                 hex_data=empty_hex,  # 空的十六进制数据
-                callback=self._on_protocol_added  # 回调函数
+                callback=self._on_protocol_added,  # 回调函数
+                protocol_manager=self.protocol_manager
             )
             self.wait_window(dialog)
         except Exception as e:
@@ -1354,9 +1369,10 @@ class ProtocolEditor(tk.Toplevel):
             # 创建协议选择对话框
             dialog = ProtocolSelectionDialog(
                 parent=self,  # 使用self作为父窗口
-                hex_data=protocol_data.get('hex_data', ''),
+                hex_data=self.protocol_manager.get_command_sample(protocol_data),
                 callback=self._on_protocol_edited,
-                parent_protocol=protocol_data
+                parent_protocol=protocol_data,
+                protocol_manager=self.protocol_manager
             )
             self.wait_window(dialog)
         except Exception as e:
@@ -1364,6 +1380,10 @@ class ProtocolEditor(tk.Toplevel):
     
     def _on_protocol_edited(self, protocol_data):
         """协议编辑成功后的回调函数"""
+        self._run_profiled("editor_save", self._apply_protocol_edit, protocol_data)
+    
+    def _apply_protocol_edit(self, protocol_data):
+        """将编辑后的协议/命令保存到协议管理器"""
         if protocol_data:
             try:
                 print(f"开始处理编辑后的协议/命令数据: {protocol_data.get('name')}")
@@ -1573,7 +1593,7 @@ class ProtocolFieldDialog(tk.Toplevel):
         self.is_new = field_index is None
         
         self.title("字段定义" if self.is_new else "编辑字段")
-        self.geometry("400x450")
+        self.geometry("400x510")
         self.resizable(False, False)
         
         # 初始化UI组件
@@ -1610,7 +1630,8 @@ class ProtocolFieldDialog(tk.Toplevel):
             "i8", "i16", "i32", "i64",
             "float", "double",
             "char", "char.ascii", "char.unicode",
-            "BYTE", "WORD", "DWORD", "QWORD"
+            "BYTE", "WORD", "DWORD", "QWORD",
+            "bits"
         ]
         self.type_combo = ttk.Combobox(self, textvariable=self.type_var, values=self.type_options, width=28)
         self.type_combo.grid(row=1, column=1, sticky="ew", padx=10, pady=5)
@@ -1639,20 +1660,32 @@ class ProtocolFieldDialog(tk.Toplevel):
         tk.Radiobutton(endian_frame, text="大端序", variable=self.endian_var, value="big").pack(side=tk.LEFT)
         tk.Radiobutton(endian_frame, text="小端序", variable=self.endian_var, value="little").pack(side=tk.LEFT)
         
+        # 位字段：起始/结束位置为容纳它的字节，位偏移从按字节序读出的整数最低位算起
+        tk.Label(self, text="位偏移/位宽:").grid(row=6, column=0, sticky="w", padx=10, pady=5)
+        self.bit_offset_var = tk.StringVar(value="0")
+        self.bit_width_var = tk.StringVar(value="1")
+        bits_frame = tk.Frame(self)
+        bits_frame.grid(row=6, column=1, sticky="w", padx=10, pady=5)
+        self.bit_offset_entry = tk.Entry(bits_frame, textvariable=self.bit_offset_var, width=8, state=tk.DISABLED)
+        self.bit_offset_entry.pack(side=tk.LEFT)
+        tk.Label(bits_frame, text=" / ").pack(side=tk.LEFT)
+        self.bit_width_entry = tk.Entry(bits_frame, textvariable=self.bit_width_var, width=8, state=tk.DISABLED)
+        self.bit_width_entry.pack(side=tk.LEFT)
+        tk.Label(bits_frame, text=" (仅bits类型)").pack(side=tk.LEFT)
         
         # 创建描述文本输入
-        tk.Label(self, text="描述:").grid(row=6, column=0, sticky="nw", padx=10, pady=5)
+        tk.Label(self, text="描述:").grid(row=7, column=0, sticky="nw", padx=10, pady=5)
         self.description_text = tk.Text(self, width=30, height=5)
-        self.description_text.grid(row=6, column=1, sticky="nsew", padx=10, pady=5)
+        self.description_text.grid(row=7, column=1, sticky="nsew", padx=10, pady=5)
         
         # 添加滚动条
         scrollbar = tk.Scrollbar(self, command=self.description_text.yview)
-        scrollbar.grid(row=6, column=2, sticky="ns")
+        scrollbar.grid(row=7, column=2, sticky="ns")
         self.description_text.config(yscrollcommand=scrollbar.set)
         
         # 按钮区域
         button_frame = tk.Frame(self)
-        button_frame.grid(row=7, column=0, columnspan=3, pady=15)
+        button_frame.grid(row=8, column=0, columnspan=3, pady=15)
         
         save_button = tk.Button(button_frame, text="保存", command=self._on_save, width=10)
         save_button.pack(side=tk.LEFT, padx=10)
@@ -1693,6 +1726,11 @@ class ProtocolFieldDialog(tk.Toplevel):
             else:
                 self.type_var.set(field_type)
         
+        # 设置位字段信息
+        self.bit_offset_var.set(str(self.field_data.get("bit_offset", 0)))
+        self.bit_width_var.set(str(self.field_data.get("bit_width", 1)))
+        self._update_bit_inputs()
+        
         # 设置位置信息
         self.start_pos_var.set(str(self.field_data.get("start_pos", 0)))
         self.end_pos_var.set(str(self.field_data.get("end_pos", 0)))
@@ -1707,15 +1745,25 @@ class ProtocolFieldDialog(tk.Toplevel):
         # 计算字段长度
         self._calculate_length()
     
+    def _update_bit_inputs(self):
+        """只有bits类型时允许输入位偏移和位宽"""
+        state = tk.NORMAL if self.type_var.get().split('.')[0] == BIT_FIELD_TYPE else tk.DISABLED
+        self.bit_offset_entry.config(state=state)
+        self.bit_width_entry.config(state=state)
+    
     def _on_type_change(self, event):
         """类型变更时的处理"""
         field_type = self.type_var.get()
+        self._update_bit_inputs()
         
         # 根据类型设置默认字节长度
         if field_type in ["u8", "i8", "BYTE"]:
             length = 1
         elif field_type in ["u16", "i16", "WORD"]:
             length = 2
+        elif field_type == BIT_FIELD_TYPE and not self.end_pos_var.get():
+            # 新建位字段默认容器为1个字节
+            length = 1
         elif field_type in ["u32", "i32", "float", "DWORD"]:
             length = 4
         elif field_type in ["u64", "i64", "double", "QWORD"]:
@@ -1801,6 +1849,22 @@ class ProtocolFieldDialog(tk.Toplevel):
         field_length = end_pos - start_pos + 1
         field_data["length"] = field_length
         
+        # 编辑时保留对话框中不能编辑的属性（学习到的编码、变长/记录组设置等）
+        if not self.is_new and self.field_data:
+            for key in ("encoding", "length_field", "count_field", "record_size", "fields"):
+                if key in self.field_data:
+                    field_data[key] = self.field_data[key]
+        
+        # 位字段保存位偏移和位宽，并按容器长度校验
+        if field_type.split('.')[0] == BIT_FIELD_TYPE:
+            try:
+                field_data["bit_offset"] = int(self.bit_offset_var.get() or "0")
+                field_data["bit_width"] = int(self.bit_width_var.get() or "1")
+                FieldDef.from_dict(field_data).get_bit_layout()
+            except ValueError as e:
+                messagebox.showerror("错误", f"位偏移和位宽无效: {e}")
+                return
+        
         # 对于非uXX类型和iXX类型字段，在类型后面加上字节数
         if not field_type.startswith('u') and not field_type.startswith('i'):
             # 检查类型是否已经包含了字节数
@@ -1885,3 +1949,391 @@ class ProtocolFieldDialog(tk.Toplevel):
         else:
             # 对于其他长度，建议使用字节数组
             self.type_var.set(f"char.{length}")
+
+
+class FrameLogDialog(tk.Toplevel):
+    """报文记录查询对话框：按命令和时间范围查询记录的报文"""
+    
+    MAX_RESULTS = 1000  # 一次最多显示的记录数
+    
+    def __init__(self, parent, frame_log, on_open=None):
+        """
+        参数:
+            parent: 父窗口
+            frame_log: FrameLog报文记录
+            on_open (callable): 双击记录时调用，参数为报文的16进制字符串
+        """
+        super().__init__(parent)
+        self.title("报文记录查询")
+        self.geometry("900x500")
+        self.transient(parent)
+        
+        self.frame_log = frame_log
+        self.on_open = on_open
+        self.records = []
+        
+        # 查询条件
+        query_frame = ttk.Frame(self, padding=10)
+        query_frame.pack(fill=tk.X)
+        
+        ttk.Label(query_frame, text="命令:").pack(side=tk.LEFT)
+        self.command_var = tk.StringVar(value="全部")
+        self.command_combo = ttk.Combobox(query_frame, textvariable=self.command_var, width=20)
+        self.command_combo.pack(side=tk.LEFT, padx=(5, 10))
+        
+        ttk.Label(query_frame, text="开始时间:").pack(side=tk.LEFT)
+        self.start_var = tk.StringVar(value=datetime.now().strftime("%Y-%m-%d"))
+        ttk.Entry(query_frame, textvariable=self.start_var, width=20).pack(side=tk.LEFT, padx=(5, 10))
+        
+        ttk.Label(query_frame, text="结束时间:").pack(side=tk.LEFT)
+        self.end_var = tk.StringVar(value="")
+        ttk.Entry(query_frame, textvariable=self.end_var, width=20).pack(side=tk.LEFT, padx=(5, 10))
+        
+        ttk.Button(query_frame, text="查询", command=self._query).pack(side=tk.LEFT)
+        
+        # 结果列表
+        result_frame = ttk.Frame(self, padding=(10, 0, 10, 10))
+        result_frame.pack(fill=tk.BOTH, expand=True)
+        
+        columns = ("time", "command", "status", "length", "data")
+        self.tree = ttk.Treeview(result_frame, columns=columns, show="headings")
+        for column, text, width in (("time", "时间", 170), ("command", "命令", 140),
+                                    ("status", "状态", 70), ("length", "长度", 60),
+                                    ("data", "数据", 420)):
+            self.tree.heading(column, text=text)
+            self.tree.column(column, width=width, anchor=tk.W)
+        scrollbar = ttk.Scrollbar(result_frame, orient=tk.VERTICAL, command=self.tree.yview)
+        self.tree.configure(yscrollcommand=scrollbar.set)
+        self.tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        self.tree.bind("<Double-1>", self._on_double_click)
+        
+        self.status_var = tk.StringVar(value="双击记录可载入到输入区")
+        ttk.Label(self, textvariable=self.status_var, padding=(10, 0, 10, 5)).pack(anchor=tk.W)
+        
+        self._load_command_keys()
+    
+    def _load_command_keys(self):
+        """加载命令下拉框"""
+        values = ["全部"]
+        for command_key, count in self.frame_log.command_keys().items():
+            values.append(f"{command_key} ({count})")
+        self.command_combo['values'] = values
+    
+    def _query(self):
+        """执行查询"""
+        from frame_log import parse_time
+        
+        command = self.command_var.get().strip()
+        if command == "全部":
+            command = None
+        elif command.endswith(")") and " (" in command:
+            # 去掉下拉框中的记录数
+            command = command.rsplit(" (", 1)[0]
+        
+        try:
+            start = parse_time(self.start_var.get())
+            end = parse_time(self.end_var.get())
+        except ValueError:
+            messagebox.showerror("错误", "时间格式错误，请使用 2025-04-01 或 2025-04-01 10:30:00", parent=self)
+            return
+        
+        self.records = self.frame_log.query(command, start, end, limit=self.MAX_RESULTS)
+        self.tree.delete(*self.tree.get_children())
+        for index, record in enumerate(self.records):
+            hex_data = record.hex
+            if len(hex_data) > 96:
+                hex_data = hex_data[:96] + "..."
+            self.tree.insert("", tk.END, iid=str(index), values=(
+                f"{record.time:%Y-%m-%d %H:%M:%S.%f}"[:-3], record.command_key,
+                record.status_name, len(record.data), hex_data))
+        
+        message = f"共 {len(self.records)} 条记录"
+        if len(self.records) >= self.MAX_RESULTS:
+            message += f"（只显示前 {self.MAX_RESULTS} 条，请缩小时间范围）"
+        self.status_var.set(message)
+    
+    def _on_double_click(self, event):
+        """双击载入报文"""
+        selection = self.tree.selection()
+        if not selection or not self.on_open:
+            return
+        record = self.records[int(selection[0])]
+        self.on_open(record.hex)
+
+
+class LiveCaptureDialog(tk.Toplevel):
+    """实时抓包对话框：连接控制器、作为代理或读取串口，实时显示解码结果"""
+    
+    POLL_INTERVAL = 100   # 从抓包结果队列取数据的间隔(毫秒)
+    BATCH_SIZE = 200      # 每次最多插入的行数
+    MAX_ROWS = 2000       # 列表最多保留的行数，超出时删除最早的行
+    
+    def __init__(self, parent, protocol_manager, on_open=None):
+        """
+        参数:
+            parent: 父窗口
+            protocol_manager: ProtocolManager，在后台线程解码
+            on_open (callable): 双击记录时调用，参数为报文的16进制字符串
+        """
+        super().__init__(parent)
+        self.title("实时抓包")
+        self.geometry("900x500")
+        self.transient(parent)
+        
+        self.protocol_manager = protocol_manager
+        self.on_open = on_open
+        self.capture = None
+        self.rows = {}  # 行ID -> 16进制数据
+        self._row_counter = 0
+        self._poll_job = None
+        
+        # 连接设置
+        settings_frame = ttk.Frame(self, padding=10)
+        settings_frame.pack(fill=tk.X)
+        
+        self.mode_var = tk.StringVar(value="client")
+        ttk.Radiobutton(settings_frame, text="连接控制器", variable=self.mode_var,
+                        value="client").pack(side=tk.LEFT)
+        ttk.Radiobutton(settings_frame, text="代理", variable=self.mode_var,
+                        value="proxy").pack(side=tk.LEFT, padx=(5, 0))
+        ttk.Radiobutton(settings_frame, text="串口", variable=self.mode_var,
+                        value="serial").pack(side=tk.LEFT, padx=(5, 10))
+        
+        ttk.Label(settings_frame, text="控制器:").pack(side=tk.LEFT)
+        self.host_var = tk.StringVar(value="127.0.0.1")
+        ttk.Entry(settings_frame, textvariable=self.host_var, width=15).pack(side=tk.LEFT, padx=(5, 2))
+        self.port_var = tk.StringVar(value="9000")
+        ttk.Entry(settings_frame, textvariable=self.port_var, width=6).pack(side=tk.LEFT, padx=(0, 10))
+        
+        ttk.Label(settings_frame, text="代理监听端口:").pack(side=tk.LEFT)
+        self.listen_port_var = tk.StringVar(value="9001")
+        ttk.Entry(settings_frame, textvariable=self.listen_port_var, width=6).pack(side=tk.LEFT, padx=(5, 10))
+        
+        self.start_button = ttk.Button(settings_frame, text="开始", command=self._start)
+        self.start_button.pack(side=tk.LEFT)
+        self.stop_button = ttk.Button(settings_frame, text="停止", command=self._stop, state=tk.DISABLED)
+        self.stop_button.pack(side=tk.LEFT, padx=(5, 0))
+        ttk.Button(settings_frame, text="清空", command=self._clear).pack(side=tk.LEFT, padx=(5, 0))
+        
+        # 串口设置
+        serial_frame = ttk.Frame(self, padding=(10, 0, 10, 10))
+        serial_frame.pack(fill=tk.X)
+        ttk.Label(serial_frame, text="串口设备:").pack(side=tk.LEFT)
+        self.device_var = tk.StringVar(value="/dev/ttyUSB0")
+        ttk.Entry(serial_frame, textvariable=self.device_var, width=20).pack(side=tk.LEFT, padx=(5, 10))
+        ttk.Label(serial_frame, text="波特率:").pack(side=tk.LEFT)
+        self.baudrate_var = tk.StringVar(value="115200")
+        ttk.Combobox(serial_frame, textvariable=self.baudrate_var, width=8,
+                     values=["9600", "19200", "38400", "57600", "115200", "230400", "460800", "921600"]
+                     ).pack(side=tk.LEFT, padx=(5, 0))
+        
+        # 结果列表
+        result_frame = ttk.Frame(self, padding=(10, 0, 10, 10))
+        result_frame.pack(fill=tk.BOTH, expand=True)
+        
+        columns = ("time", "direction", "command", "length", "data")
+        self.tree = ttk.Treeview(result_frame, columns=columns, show="headings")
+        for column, text, width in (("time", "时间", 110), ("direction", "方向", 90),
+                                    ("command", "命令", 180), ("length", "长度", 60),
+                                    ("data", "数据", 420)):
+            self.tree.heading(column, text=text)
+            self.tree.column(column, width=width, anchor=tk.W)
+        scrollbar = ttk.Scrollbar(result_frame, orient=tk.VERTICAL, command=self.tree.yview)
+        self.tree.configure(yscrollcommand=scrollbar.set)
+        self.tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        self.tree.bind("<Double-1>", self._on_double_click)
+        
+        self.follow_var = tk.BooleanVar(value=True)
+        bottom_frame = ttk.Frame(self, padding=(10, 0, 10, 5))
+        bottom_frame.pack(fill=tk.X)
+        ttk.Checkbutton(bottom_frame, text="自动滚动", variable=self.follow_var).pack(side=tk.LEFT)
+        self.status_var = tk.StringVar(value="未开始")
+        ttk.Label(bottom_frame, textvariable=self.status_var).pack(side=tk.LEFT, padx=(10, 0))
+        
+        self.protocol("WM_DELETE_WINDOW", self._on_close)
+    
+    def _start(self):
+        """开始抓包"""
+        from live_capture import LiveCapture
+        
+        try:
+            port = int(self.port_var.get())
+            listen_port = int(self.listen_port_var.get())
+            baudrate = int(self.baudrate_var.get())
+        except ValueError:
+            messagebox.showerror("错误", "端口和波特率必须是数字", parent=self)
+            return
+        
+        self.capture = LiveCapture(self.protocol_manager, mode=self.mode_var.get(),
+                                   host=self.host_var.get().strip(), port=port, listen_port=listen_port,
+                                   device=self.device_var.get().strip(), baudrate=baudrate)
+        success, message = self.capture.start()
+        self.status_var.set(message)
+        if not success:
+            self.capture = None
+            messagebox.showerror("错误", message, parent=self)
+            return
+        
+        self.start_button.config(state=tk.DISABLED)
+        self.stop_button.config(state=tk.NORMAL)
+        self._poll_job = self.after(self.POLL_INTERVAL, self._poll)
+    
+    def _stop(self):
+        """停止抓包，剩余的结果在最后一次轮询中显示"""
+        if self.capture is not None:
+            self.capture.stop()
+        self.start_button.config(state=tk.NORMAL)
+        self.stop_button.config(state=tk.DISABLED)
+    
+    def _poll(self):
+        """批量取出解码结果插入列表，界面线程每次只处理有限的行数"""
+        self._poll_job = None
+        capture = self.capture
+        if capture is None:
+            return
+        
+        results = capture.get_results(self.BATCH_SIZE)
+        last_row = None
+        for result in results:
+            if result.protocol:
+                command = result.protocol.get('name', '')
+            else:
+                command = "未匹配"
+            hex_data = result.data
+            shown_hex = hex_data if len(hex_data) <= 96 else hex_data[:96] + "..."
+            time_text = datetime.fromtimestamp(result.timestamp / 1e9).strftime("%H:%M:%S.%f")[:-3]
+            
+            self._row_counter += 1
+            last_row = str(self._row_counter)
+            self.rows[last_row] = hex_data
+            self.tree.insert("", tk.END, iid=last_row, values=(
+                time_text, result.direction, command, len(hex_data) // 2, shown_hex))
+        
+        # 只保留最近的MAX_ROWS行
+        children = self.tree.get_children()
+        if len(children) > self.MAX_ROWS:
+            stale = children[:len(children) - self.MAX_ROWS]
+            self.tree.delete(*stale)
+            for row_id in stale:
+                self.rows.pop(row_id, None)
+        if last_row is not None and self.follow_var.get():
+            self.tree.see(last_row)
+        
+        running = capture.is_running()
+        message = f"已接收 {capture.frame_count} 帧，{capture.byte_count} 字节"
+        if capture.dropped:
+            message += f"，队列已满丢弃 {capture.dropped} 帧"
+        if not running:
+            message += "（已停止）"
+        self.status_var.set(message)
+        
+        if running or results or capture.results.qsize():
+            # 结果较多时立即继续取，否则按间隔轮询
+            delay = 1 if len(results) >= self.BATCH_SIZE else self.POLL_INTERVAL
+            self._poll_job = self.after(delay, self._poll)
+        else:
+            self.start_button.config(state=tk.NORMAL)
+            self.stop_button.config(state=tk.DISABLED)
+    
+    def _clear(self):
+        """清空列表"""
+        self.tree.delete(*self.tree.get_children())
+        self.rows.clear()
+    
+    def _on_double_click(self, event):
+        """双击载入报文"""
+        selection = self.tree.selection()
+        if not selection or not self.on_open:
+            return
+        hex_data = self.rows.get(selection[0])
+        if hex_data:
+            self.on_open(hex_data)
+    
+    def _on_close(self):
+        """关闭窗口时停止抓包"""
+        if self._poll_job is not None:
+            self.after_cancel(self._poll_job)
+            self._poll_job = None
+        if self.capture is not None:
+            self.capture.stop()
+        self.destroy()
+
+
+class FrameEncoderDialog(tk.Toplevel):
+    """报文生成对话框：修改字段值后按协议定义生成新的报文"""
+    
+    def __init__(self, parent, protocol_manager, definition, initial_values=None, on_generate=None):
+        """
+        参数:
+            parent: 父窗口
+            protocol_manager: ProtocolManager
+            definition (dict): 协议/命令定义
+            initial_values (dict): 字段名 -> 初始值，通常为当前报文的解析结果
+            on_generate (callable): 生成成功后调用，参数为报文的16进制字符串
+        """
+        super().__init__(parent)
+        self.title(f"生成报文 - {definition.get('name', '')}")
+        self.geometry("520x500")
+        self.transient(parent)
+        
+        self.protocol_manager = protocol_manager
+        self.definition = definition
+        self.on_generate = on_generate
+        initial_values = initial_values or {}
+        
+        # 字段列表，可滚动
+        canvas = tk.Canvas(self, highlightthickness=0)
+        scrollbar = ttk.Scrollbar(self, orient=tk.VERTICAL, command=canvas.yview)
+        fields_frame = ttk.Frame(canvas, padding=10)
+        fields_frame.bind("<Configure>", lambda e: canvas.configure(scrollregion=canvas.bbox("all")))
+        canvas.create_window((0, 0), window=fields_frame, anchor=tk.NW)
+        canvas.configure(yscrollcommand=scrollbar.set)
+        
+        for col, header in enumerate(("字段", "类型", "位置", "值")):
+            ttk.Label(fields_frame, text=header, font=('TkDefaultFont', 9, 'bold')).grid(
+                row=0, column=col, sticky=tk.W, padx=3)
+        
+        self.value_vars = {}
+        # 有分支布局时显示当前报文所属分支的字段
+        variant_table = protocol_manager.get_variant_table(definition)
+        self.selector_name = variant_table.selector_name if variant_table else None
+        variant = variant_table.select(initial_values.get(self.selector_name)) if variant_table else None
+        fields = sorted((variant or definition).get('fields', []), key=lambda f: f.get('start_pos', 0))
+        for row, field in enumerate(fields, start=1):
+            name = field.get('name', '')
+            ttk.Label(fields_frame, text=name).grid(row=row, column=0, sticky=tk.W, padx=3)
+            ttk.Label(fields_frame, text=field.get('type', '')).grid(row=row, column=1, sticky=tk.W, padx=3)
+            ttk.Label(fields_frame, text=f"{field.get('start_pos', 0)}-{field.get('end_pos', 0)}").grid(
+                row=row, column=2, sticky=tk.W, padx=3)
+            value = initial_values.get(name, "")
+            var = tk.StringVar(value="" if value is None else str(value))
+            ttk.Entry(fields_frame, textvariable=var, width=24).grid(row=row, column=3, sticky=tk.W, padx=3)
+            self.value_vars[name] = (var, var.get())
+        
+        button_frame = ttk.Frame(self, padding=10)
+        button_frame.pack(side=tk.BOTTOM, fill=tk.X)
+        ttk.Button(button_frame, text="生成", command=self._generate).pack(side=tk.RIGHT)
+        ttk.Button(button_frame, text="关闭", command=self.destroy).pack(side=tk.RIGHT, padx=(0, 5))
+        self.status_var = tk.StringVar(value="只有修改过的字段会写入报文，其余字节保持样本内容")
+        ttk.Label(button_frame, textvariable=self.status_var).pack(side=tk.LEFT)
+        
+        scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        canvas.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+    
+    def _generate(self):
+        """按修改过的字段值生成报文"""
+        values = {name: var.get().strip() for name, (var, initial) in self.value_vars.items()
+                  if var.get() != initial}
+        # 模板样本可能属于其他分支，选择字段总是写入，保证生成的报文与显示的分支一致
+        if self.selector_name in self.value_vars and self.value_vars[self.selector_name][0].get().strip():
+            values[self.selector_name] = self.value_vars[self.selector_name][0].get().strip()
+        protocol_key = self.protocol_manager.get_definition_key(self.definition)
+        success, result = self.protocol_manager.encode_frame(protocol_key, values)
+        if not success:
+            messagebox.showerror("生成失败", result, parent=self)
+            return
+        self.status_var.set(f"已生成 {len(result) // 2} 字节，修改了 {len(values)} 个字段")
+        if self.on_generate:
+            self.on_generate(result)